@@ -21,6 +21,8 @@ from urllib.error import URLError, HTTPError
 from urllib.parse import urlparse, parse_qs
 import urllib.request
 
+import collectors
+
 # ─────────────────────────────────────────────
 # CONFIG
 # ─────────────────────────────────────────────
@@ -30,6 +32,9 @@ NTFY_TOPIC    = "tcc-zenith-hive"
 SERVER_PORT   = 8765
 LOG_FILE      = os.path.expanduser("~/tcc-bridge-v2.log")
 HEARTBEAT_IV  = 60   # seconds
+HEALTH_REFRESH_IV = 30   # seconds between background /health snapshot refreshes
+HEALTH_MAX_AGE    = 90   # a probe older than this triggers an immediate revalidate
+DEVICE_DEADLINE   = 10   # seconds for all device collectors together (run in parallel)
 MAX_LOG_LINES = 100
 
 # ─────────────────────────────────────────────
@@ -112,50 +117,102 @@ def get_network_status():
     return {"internet_reachable": reachable, "public_ip": public_ip}
 
 
-def get_device_status():
-    """Collect device health metrics."""
-    status = {}
-    # Battery
-    bat_out, _, _ = safe_run("termux-battery-status", timeout=8)
-    try:
-        status["battery"] = json.loads(bat_out)
-    except Exception:
-        status["battery"] = {"raw": bat_out}
-    # Wifi info
-    wifi_out, _, _ = safe_run("termux-wifi-connectioninfo", timeout=8)
+def termux_status(cmd):
+    """Run a termux-api command; its JSON, or {"raw": output} if it isn't JSON."""
+    out, _, _ = safe_run(cmd, timeout=8)
     try:
-        status["wifi"] = json.loads(wifi_out)
+        return json.loads(out)
     except Exception:
-        status["wifi"] = {"raw": wifi_out}
-    # CPU load
-    load_out, _, _ = safe_run("cat /proc/loadavg", timeout=5)
-    status["load_avg"] = load_out
-    # Memory
-    mem_out, _, _ = safe_run("free -m | awk 'NR==2{print $2,$3,$4}'", timeout=5)
-    mem_parts = mem_out.split()
-    if len(mem_parts) == 3:
-        status["memory_mb"] = {
-            "total": mem_parts[0],
-            "used": mem_parts[1],
-            "free": mem_parts[2]
-        }
-    else:
-        status["memory_mb"] = {"raw": mem_out}
-    # Disk
-    disk_out, _, _ = safe_run("df -h ~ | awk 'NR==2{print $2,$3,$4,$5}'", timeout=5)
-    disk_parts = disk_out.split()
-    if len(disk_parts) == 4:
-        status["disk"] = {
-            "total": disk_parts[0],
-            "used": disk_parts[1],
-            "avail": disk_parts[2],
-            "use_pct": disk_parts[3]
-        }
-    else:
-        status["disk"] = {"raw": disk_out}
+        return {"raw": out}
+
+
+def memory_status():
+    mem = collectors.meminfo()
+    return {
+        "total": mem.get("total_mb"),
+        "used": mem.get("used_mb"),
+        "free": mem.get("free_mb"),
+        "available": mem.get("available_mb")
+    }
+
+
+# Battery and wifi are Termux:API round-trips; load, memory and disk come
+# from /proc and statvfs. All of them run at once under DEVICE_DEADLINE.
+device_collector = collectors.Collector({
+    "battery": lambda: termux_status("termux-battery-status"),
+    "wifi": lambda: termux_status("termux-wifi-connectioninfo"),
+    "load_avg": collectors.loadavg,
+    "memory_mb": memory_status,
+    "disk": lambda: collectors.disk_usage("~"),
+}, DEVICE_DEADLINE)
+
+
+def get_device_status():
+    """Collect device health metrics; fields not in by the deadline are listed."""
+    report = device_collector.run()
+    status = dict(report["values"])
+    if report["missing"] or report["stale"]:
+        logger.warning(f"Device status partial: missing={report['missing']} stale={report['stale']}")
+        status["missing"] = report["missing"]
+        status["stale"] = report["stale"]
     return status
 
 
+# ─────────────────────────────────────────────
+# HEALTH SNAPSHOT (stale-while-revalidate)
+# ─────────────────────────────────────────────
+_health_lock = threading.Lock()
+_health_state = {"data": None, "taken_at": None, "refreshing": False}
+
+
+def collect_health():
+    """The expensive part of /health: pgrep, network probes, device status."""
+    return {
+        "cloudflared": {"running": is_cloudflared_running()},
+        "network": get_network_status(),
+        "device": get_device_status()
+    }
+
+
+def refresh_health_snapshot():
+    """Collect a new snapshot unless a refresh is already running."""
+    with _health_lock:
+        if _health_state["refreshing"]:
+            return
+        _health_state["refreshing"] = True
+    try:
+        data = collect_health()
+        with _health_lock:
+            _health_state["data"] = data
+            _health_state["taken_at"] = time.time()
+    except Exception as e:
+        logger.error(f"Health snapshot refresh error: {e}\n{traceback.format_exc()}")
+    finally:
+        with _health_lock:
+            _health_state["refreshing"] = False
+
+
+def health_snapshot():
+    """Return (data, age_seconds) without blocking; revalidates in the background if stale."""
+    with _health_lock:
+        data = _health_state["data"]
+        taken_at = _health_state["taken_at"]
+        refreshing = _health_state["refreshing"]
+    age = None if taken_at is None else time.time() - taken_at
+    if (age is None or age > HEALTH_MAX_AGE) and not refreshing:
+        threading.Thread(target=refresh_health_snapshot, daemon=True, name="health-revalidate").start()
+    return data, age
+
+
+def health_refresh_loop():
+    """Background thread: keep the /health snapshot warm."""
+    logger.info("Health refresh loop started")
+    while not _shutdown_flag.is_set():
+        refresh_health_snapshot()
+        _shutdown_flag.wait(timeout=HEALTH_REFRESH_IV)
+    logger.info("Health refresh loop exiting")
+
+
 # ─────────────────────────────────────────────
 # NTFY INTEGRATION
 # ─────────────────────────────────────────────
@@ -422,19 +479,18 @@ class BridgeHandler(BaseHTTPRequestHandler):
     def handle_health(self, body=None):
         logger.info("GET /health")
         try:
-            cf_running = is_cloudflared_running()
-            net = get_network_status()
-            dev = get_device_status()
+            snap, age = health_snapshot()
+            snap = snap or {}
             data = {
                 "ok": True,
                 "bridge_version": "2.0.0",
                 "uptime_seconds": uptime_seconds(),
                 "timestamp": datetime.now(timezone.utc).isoformat(),
-                "cloudflared": {
-                    "running": cf_running
-                },
-                "network": net,
-                "device": dev
+                "cloudflared": snap.get("cloudflared", {"running": None}),
+                "network": snap.get("network", {}),
+                "device": snap.get("device", {}),
+                "snapshot_age_seconds": None if age is None else round(age, 3),
+                "snapshot_stale": age is None or age > HEALTH_MAX_AGE
             }
             self.send_json(data)
         except Exception as e:
@@ -608,6 +664,9 @@ def main():
     wd_thread = threading.Thread(target=cloudflared_watchdog, daemon=True, name="cf-watchdog")
     wd_thread.start()
 
+    health_thread = threading.Thread(target=health_refresh_loop, daemon=True, name="health-refresh")
+    health_thread.start()
+
     # Start HTTP server
     server = start_server()
     server_thread = threading.Thread(target=server.serve_forever, daemon=True, name="http-server")
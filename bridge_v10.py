@@ -9,23 +9,67 @@ Survives: Reboots, network drops, process kills, Android memory cleanup.
 Endpoints (all support GET with query params OR POST with JSON body):
   GET  /health          â Public health check (no auth)
   GET  /status          â Detailed status (auth required)
-  POST /exec            â Execute shell command
+  GET  /metrics         â Prometheus text metrics (auth required)
+  GET  /metrics/history â Recent samples of one device metric, bucketed
+                          (query: metric=, since=, step=; min/max/avg per bucket)
+  POST /exec            â Execute shell command (?stream=1 or
+                          Accept: text/event-stream streams output live;
+                          "session": name keeps cwd/env across calls;
+                          ?binary=1 or Accept: application/octet-stream sends
+                          raw stdout, exit code and stderr in trailers;
+                          Content-Type: application/octet-stream pipes the
+                          body into the command's stdin, cmd= in the query)
+  POST /write_file      â Write a file under ~ ({"path", "content", "mode": w|a},
+                          or an octet-stream body streamed to disk, path= and
+                          mode= in the query)
   POST /toast           â Show toast notification
   POST /vibrate         â Vibrate device
   POST /speak           â Text-to-speech
   POST /listen          â Speech-to-text
   POST /notify          â Push ntfy notification
-  POST /push_state      â Manually trigger Supabase state push
+  POST /push_state      â Manually trigger Supabase state push (changed columns
+                          only; {"full": true} sends the whole row)
   GET  /exec            â Execute command (GET, query: cmd=)
+  GET  /exec/output/<id> â Output an /exec spilled to disk past EXEC_MEMORY_MAX
+                          (query: stream=stdout|stderr, offset=, length=)
   GET  /toast           â Toast (GET, query: msg=)
   GET  /vibrate         â Vibrate (GET, query: duration=)
   GET  /speak           â Speak (GET, query: msg=)
+  POST /jobs            â Start a background command, returns a job id
+  GET  /jobs[/<id>]     â List jobs / job status + incremental output
+                          (query: stdout_offset=, stderr_offset=, limit=)
+  DELETE /jobs/<id>     â Kill a job's whole process group
+  POST /batch           â Run several actions (exec, toast, vibrate, speak,
+                          notify, push_state) in one round-trip
+  GET  /ws              â WebSocket channel: JSON requests with ids, replies
+                          in completion order, plus pushed events
+  POST /admin/reload    â Hot reload, same as SIGHUP (see below)
 
 Auth: Bearer token via:
   - Header:  Authorization: Bearer amos-bridge-2026
   - Header:  Authorization: amos-bridge-2026
   - Query:   ?auth=amos-bridge-2026
   - Body:    {"auth": "amos-bridge-2026"}
+
+Unix sockets (same routes, alongside TCP):
+  ~/tcc/bridge.sock        â on-device helpers; mode 0600, so filesystem
+                             permissions are the auth and no token is needed
+  ~/tcc/bridge-origin.sock â cloudflared origin, token auth as over TCP:
+                             ingress: - service: unix:/path/to/bridge-origin.sock
+
+Serving engine (BRIDGE_ENGINE env):
+  pool    â bounded worker-thread pool (default; BRIDGE_WORKERS, BRIDGE_QUEUE)
+  async   â asyncio streams + asyncio subprocesses, no thread per request
+  single  â legacy single-threaded HTTPServer
+BRIDGE_PROCS=N (N > 1, pool/async engines) pre-forks N worker processes that
+share the port via SO_REUSEPORT under a small supervisor; worker 0 runs the
+background threads, and the health snapshot and metrics live in shared memory.
+
+Hot reload (SIGHUP or POST /admin/reload): the listening sockets are handed to
+a fresh interpreter running the bridge_v10.py now on disk, in-flight requests
+finish, and the old code exits, so deploys drop no requests and never wait in
+the bind-retry loop. The pid pm2 watches stays the same. If the new code fails
+to start, the reload is abandoned and the running bridge keeps serving.
 """
 
 import subprocess
@@ -38,10 +82,34 @@ import logging
 import time
 import threading
 import traceback
+import queue
+import secrets
+import selectors
+import shlex
+import shutil
+import tempfile
+import asyncio
+import concurrent.futures
+import email.parser
+import email.utils
+import http.client
+import locale
+import gzip
+import zlib
+import base64
+import hashlib
+import math
+import struct
+import array
+import functools
+import mmap
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs, quote, urlparse
+
+import collectors
+import timeseries
 
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 # CONFIG
@@ -64,6 +132,137 @@ WATCHDOG_SEC    = int(os.environ.get("WATCHDOG_SEC",  "300"))
 MAX_RETRIES     = 5
 RETRY_BACKOFF   = [2, 4, 8, 16, 32]
 
+# device_state pushes PATCH only the columns that changed since the last push
+# Supabase acknowledged, and heartbeat rows repeat only on a change; a push
+# where nothing but the timestamps moved is skipped unless STATE_KEEPALIVE_SEC
+# have passed since the last one went out
+STATE_KEEPALIVE_SEC = int(os.environ.get("STATE_KEEPALIVE_SEC", "900"))
+
+# Serving engine: "pool" (bounded worker pool), "async" (asyncio streams + async
+# subprocesses) or "single" (legacy, one request at a time)
+ENGINE          = os.environ.get("BRIDGE_ENGINE", "pool")
+POOL_WORKERS    = int(os.environ.get("BRIDGE_WORKERS", str(max(8, (os.cpu_count() or 2) * 2))))
+POOL_QUEUE      = int(os.environ.get("BRIDGE_QUEUE",   "64"))
+IDLE_TIMEOUT    = int(os.environ.get("BRIDGE_IDLE_TIMEOUT", "30"))  # keep-alive idle cutoff
+BRIDGE_PROCS    = int(os.environ.get("BRIDGE_PROCS", "1"))  # >1: pre-fork worker processes
+SHARE_SYNC_SEC  = 2  # pre-fork: how often workers publish metrics / adopt shared health
+
+# Hot reload: how long a new interpreter gets to start serving, and how long a
+# stopping (or reloading) bridge waits for in-flight requests to finish
+RELOAD_READY_SEC = int(os.environ.get("RELOAD_READY_SEC", "30"))
+DRAIN_SEC        = int(os.environ.get("DRAIN_SEC",        "30"))
+
+# /health is served from a snapshot; refreshed in the background every
+# HEALTH_REFRESH_SEC, and revalidated on demand once older than HEALTH_MAX_AGE
+HEALTH_REFRESH_SEC = int(os.environ.get("HEALTH_REFRESH_SEC", "30"))
+HEALTH_MAX_AGE     = int(os.environ.get("HEALTH_MAX_AGE",     "90"))
+
+# Device-state fields are cached, each refreshed on its own TTL by a scheduler
+# thread (see state_collector); a field with no value yet is waited for up to
+# STATE_DEADLINE_SEC, then left out
+STATE_DEADLINE_SEC = float(os.environ.get("STATE_DEADLINE_SEC", "12"))
+
+# GET /metrics/history: HISTORY_METRICS are sampled every HISTORY_SAMPLE_SEC
+# into a fixed ring of HISTORY_CAPACITY samples (a day at the defaults, under
+# 2 MB); one query returns at most HISTORY_MAX_POINTS buckets
+HISTORY_SAMPLE_SEC = float(os.environ.get("HISTORY_SAMPLE_SEC", "2"))
+HISTORY_CAPACITY   = int(os.environ.get("HISTORY_CAPACITY",   "43200"))
+HISTORY_MAX_POINTS = int(os.environ.get("HISTORY_MAX_POINTS", "1000"))
+
+# The same samples are kept on disk in TSDB_PATH (SQLite): raw for
+# TSDB_RAW_DAYS, per-minute and per-hour rollups for TSDB_1M_DAYS and
+# TSDB_1H_DAYS. Every TSDB_UPLOAD_SEC the backfill thread uploads closed
+# 1-minute rollups to TSDB_TABLE, and heartbeats Supabase refused, oldest
+# first and TSDB_BATCH rows at a time; its cursors survive restarts
+TSDB_PATH       = os.path.expanduser(os.environ.get("TSDB_PATH", "~/tcc/metrics.db"))
+TSDB_TABLE      = os.environ.get("TSDB_TABLE", "device_metrics")
+TSDB_FLUSH_SEC  = int(os.environ.get("TSDB_FLUSH_SEC",  "30"))
+TSDB_UPLOAD_SEC = int(os.environ.get("TSDB_UPLOAD_SEC", "60"))
+TSDB_BATCH      = int(os.environ.get("TSDB_BATCH",      "500"))
+TSDB_RAW_DAYS   = float(os.environ.get("TSDB_RAW_DAYS", "2"))
+TSDB_1M_DAYS    = float(os.environ.get("TSDB_1M_DAYS",  "30"))
+TSDB_1H_DAYS    = float(os.environ.get("TSDB_1H_DAYS",  "365"))
+
+# Buffered /exec runs in persistent shells: SHELL_POOL warm `sh` workers, each
+# replaced after SHELL_RECYCLE commands or a timeout (0 spawns a fresh shell
+# per command as before). Up to SHELL_SESSIONS named sessions keep cwd and env
+# between calls; one idle for SHELL_SESSION_IDLE s is closed.
+SHELL_POOL         = int(os.environ.get("SHELL_POOL",         "4"))
+SHELL_RECYCLE      = int(os.environ.get("SHELL_RECYCLE",      "200"))
+SHELL_SESSIONS     = int(os.environ.get("SHELL_SESSIONS",     "8"))
+SHELL_SESSION_IDLE = int(os.environ.get("SHELL_SESSION_IDLE", "1800"))
+
+# Buffered /exec keeps the first EXEC_MEMORY_MAX bytes of each stream in memory.
+# A longer stream is written in full (up to EXEC_SPILL_MAX) to EXEC_SPILL_DIR
+# and read back in ranges via GET /exec/output/<id> for EXEC_SPILL_RETENTION_SEC
+EXEC_MEMORY_MAX          = int(os.environ.get("EXEC_MEMORY_MAX", str(1024 * 1024)))
+EXEC_SPILL_DIR           = os.path.expanduser(os.environ.get("EXEC_SPILL_DIR", "~/tcc/exec-output"))
+EXEC_SPILL_MAX           = int(os.environ.get("EXEC_SPILL_MAX", str(256 * 1024 * 1024)))
+EXEC_SPILL_RETENTION_SEC = int(os.environ.get("EXEC_SPILL_RETENTION_SEC", "3600"))
+EXEC_READ_MAX            = 1024 * 1024  # largest slice one GET /exec/output/<id> returns
+EXEC_TRAILER_STDERR      = 4096  # stderr bytes a binary /exec repeats in its trailer
+
+# Octet-stream request bodies (stdin for POST /exec, POST /write_file) are
+# passed on UPLOAD_CHUNK bytes at a time as they arrive, never held whole;
+# UPLOAD_MAX caps one body
+UPLOAD_CHUNK = int(os.environ.get("UPLOAD_CHUNK", str(64 * 1024)))
+UPLOAD_MAX   = int(os.environ.get("UPLOAD_MAX",   str(4 * 1024 * 1024 * 1024)))
+
+# Background /jobs: table size, concurrency, retention and per-stream output cap
+JOBS_DIR          = os.path.expanduser(os.environ.get("JOBS_DIR", "~/tcc/jobs"))
+JOB_MAX           = int(os.environ.get("JOB_MAX",           "100"))
+JOB_MAX_RUNNING   = int(os.environ.get("JOB_MAX_RUNNING",   "8"))
+JOB_RETENTION_SEC = int(os.environ.get("JOB_RETENTION_SEC", "86400"))
+JOB_MAX_OUTPUT    = int(os.environ.get("JOB_MAX_OUTPUT",    str(64 * 1024 * 1024)))
+JOB_TIMEOUT       = int(os.environ.get("JOB_TIMEOUT",       "3600"))
+JOB_READ_MAX      = 256 * 1024  # largest output slice one GET /jobs/<id> returns
+
+# POST /batch: max items per call, and threads the pool engine fans items out to
+BATCH_MAX_ITEMS   = int(os.environ.get("BATCH_MAX_ITEMS",   "32"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+# Response bodies at least this large are gzip/deflate-compressed when the
+# client's Accept-Encoding allows it; 0 disables compression
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL     = int(os.environ.get("COMPRESS_LEVEL",     "6"))
+
+# /ws: open channels (each pins a worker on the pool engine), requests in flight
+# per channel, largest accepted message, and keepalive ping interval
+WS_MAX_CONNECTIONS = int(os.environ.get("WS_MAX_CONNECTIONS", str(max(1, POOL_WORKERS // 4))))
+WS_MAX_INFLIGHT    = int(os.environ.get("WS_MAX_INFLIGHT",    "16"))
+WS_MAX_MESSAGE     = int(os.environ.get("WS_MAX_MESSAGE",     str(1024 * 1024)))
+WS_PING_SEC        = int(os.environ.get("WS_PING_SEC",        "30"))
+
+# Unix domain sockets. BRIDGE_SOCKET serves on-device helpers without a token
+# (only this user can open it); BRIDGE_ORIGIN_SOCKET is for cloudflared and
+# keeps token auth. "" disables either.
+BRIDGE_SOCKET        = os.path.expanduser(os.environ.get("BRIDGE_SOCKET", "~/tcc/bridge.sock"))
+BRIDGE_ORIGIN_SOCKET = os.path.expanduser(os.environ.get("BRIDGE_ORIGIN_SOCKET",
+                                                         "~/tcc/bridge-origin.sock"))
+LOCAL_PEER  = "unix"         # client_address[0] of BRIDGE_SOCKET connections
+ORIGIN_PEER = "unix-origin"  # ... and of BRIDGE_ORIGIN_SOCKET connections
+
+# Admission control. Token buckets (requests/s, burst) per client IP and per
+# presented auth token; 0 disables a limit. Device actions and heavy routes
+# (/exec, /listen, ...) then share ADMIT_SLOTS concurrent slots, heavy ones at
+# most ADMIT_HEAVY, with up to ADMIT_QUEUE requests waiting ADMIT_WAIT s for
+# one. On the pool engine a waiting request and an open /ws channel each pin a
+# worker as well, so the slots default to what BRIDGE_WORKERS leaves after
+# WS_MAX_CONNECTIONS, ADMIT_QUEUE and ADMIT_RESERVE workers kept free for
+# /health and /metrics (check_worker_budget() warns if the sum overbooks).
+RATE_IP_PER_SEC    = float(os.environ.get("RATE_IP_PER_SEC",    "10"))
+RATE_IP_BURST      = int(os.environ.get("RATE_IP_BURST",        "30"))
+RATE_TOKEN_PER_SEC = float(os.environ.get("RATE_TOKEN_PER_SEC", "20"))
+RATE_TOKEN_BURST   = int(os.environ.get("RATE_TOKEN_BURST",     "60"))
+ADMIT_QUEUE        = int(os.environ.get("ADMIT_QUEUE",   "2"))
+ADMIT_RESERVE      = int(os.environ.get("ADMIT_RESERVE", "1"))
+ADMIT_SLOTS        = int(os.environ.get("ADMIT_SLOTS", str(max(
+    1, POOL_WORKERS - WS_MAX_CONNECTIONS - ADMIT_QUEUE - ADMIT_RESERVE))))
+ADMIT_HEAVY        = int(os.environ.get("ADMIT_HEAVY", str(max(1, ADMIT_SLOTS // 2))))
+ADMIT_WAIT         = float(os.environ.get("ADMIT_WAIT", "5"))
+# A /batch holds BATCH_SLOTS heavy slots and runs at most that many items at once
+BATCH_SLOTS        = max(1, min(BATCH_CONCURRENCY, ADMIT_HEAVY, ADMIT_SLOTS))
+
 # Log setup
 LOG_FILE = os.path.expanduser("~/tcc/logs/bridge.log")
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
@@ -81,44 +280,548 @@ log = logging.getLogger("tcc.bridge.v7")
 # Shared stop event for clean shutdown
 _stop_event = threading.Event()
 
+# Pre-fork worker number (0 is the leader); None when serving as one process
+_worker_index = None
+
+# Codec subprocess.run(text=True) decodes with; the async engine matches it
+_LOCALE_ENCODING = locale.getpreferredencoding(False)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# METRICS (Prometheus text exposition, served at /metrics)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_str(names, values, extra: str = "") -> str:
+    parts = [
+        '%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self._lock   = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), val] for key, val in self._values.items()]
+
+    def render(self, others: list = ()) -> list:
+        """`others` are snapshot() lists from other worker processes to add in."""
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for snap in others:
+            for key, val in snap:
+                key = tuple(key)
+                values[key] = values.get(key, 0) + val
+        for key, val in sorted(values.items()):
+            out.append(f"{self.name}{_label_str(self.labels, key)} {_fmt(val)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: tuple = (),
+                 buckets: tuple = _DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels, self.buckets = name, doc, labels, buckets
+        self._lock   = threading.Lock()
+        self._series = {}  # labelvalues -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labelvalues):
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), list(s)] for key, s in self._series.items()]
+
+    def render(self, others: list = ()) -> list:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(s) for key, s in self._series.items()}
+        for snap in others:
+            for key, theirs in snap:
+                mine = series.setdefault(tuple(key), [0] * len(theirs))
+                for i, v in enumerate(theirs):
+                    mine[i] += v
+        for key, s in sorted(series.items()):
+            for bound, n in zip(self.buckets, s):
+                le = _label_str(self.labels, key, f'le="{bound}"')
+                out.append(f"{self.name}_bucket{le} {n}")
+            inf = _label_str(self.labels, key, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{inf} {s[-1]}")
+            out.append(f"{self.name}_sum{_label_str(self.labels, key)} {_fmt(s[-2])}")
+            out.append(f"{self.name}_count{_label_str(self.labels, key)} {s[-1]}")
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._gauges  = []  # (name, doc, fn) where fn() -> number
+        self._slots   = []  # pre-fork: one SharedSlot per worker, see share()
+        self._index   = 0
+
+    def counter(self, name, doc, labels=()) -> Counter:
+        m = Counter(name, doc, labels)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name, doc, labels=(), buckets=_DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, doc, labels, buckets)
+        self._metrics.append(m)
+        return m
+
+    def gauge_fn(self, name, doc, fn):
+        self._gauges.append((name, doc, fn))
+
+    def share(self, slots: list, index: int):
+        """Pre-fork: publish into slots[index] and add the other slots in on render."""
+        self._slots, self._index = slots, index
+
+    def publish_shared(self):
+        if not self._slots:
+            return
+        payload = json.dumps([m.snapshot() for m in self._metrics]).encode("utf-8")
+        if not self._slots[self._index].write(payload):
+            log.warning("Metrics snapshot (%d bytes) exceeds its shared slot.", len(payload))
+
+    def _peer_snapshots(self) -> list:
+        peers = []
+        for i, slot in enumerate(self._slots):
+            if i == self._index:
+                continue
+            payload, _ = slot.read()
+            if payload is None:
+                continue
+            try:
+                snaps = json.loads(payload)
+            except ValueError:
+                continue
+            if len(snaps) == len(self._metrics):
+                peers.append(snaps)
+        return peers
+
+    def render(self, extra_gauges: dict = None) -> str:
+        out = []
+        peers = self._peer_snapshots()
+        for i, m in enumerate(self._metrics):
+            out.extend(m.render([snaps[i] for snaps in peers]))
+        gauges = list(self._gauges)
+        for name, (doc, value) in (extra_gauges or {}).items():
+            gauges.append((name, doc, lambda v=value: v))
+        for name, doc, fn in gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            out.append(f"# HELP {name} {doc}")
+            out.append(f"# TYPE {name} gauge")
+            out.append(f"{name} {_fmt(value)}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = MetricsRegistry()
+M_REQUESTS        = METRICS.counter("tcc_bridge_requests_total",
+                                    "HTTP requests served.", ("route", "method", "code"))
+M_REQUEST_SECONDS = METRICS.histogram("tcc_bridge_request_duration_seconds",
+                                      "Time to build and send a response.", ("route", "method"))
+M_SUBPROC         = METRICS.counter("tcc_bridge_subprocess_total",
+                                    "Shell commands run via _run/_run_full.", ("cmd", "outcome"))
+M_SUBPROC_SECONDS = METRICS.histogram("tcc_bridge_subprocess_duration_seconds",
+                                      "Shell command wall time.", ("cmd",))
+M_UPSTREAM_SECONDS = METRICS.histogram("tcc_bridge_upstream_request_duration_seconds",
+                                       "Outbound _http attempt latency.", ("host", "outcome"))
+M_UPSTREAM_RETRIES = METRICS.counter("tcc_bridge_upstream_retries_total",
+                                     "Outbound _http attempts that failed and were retried.", ("host",))
+M_UPSTREAM_GIVEUPS = METRICS.counter("tcc_bridge_upstream_giveups_total",
+                                     "Outbound _http calls abandoned after all retries.", ("host",))
+M_NTFY_ATTEMPTS   = METRICS.counter("tcc_bridge_ntfy_attempts_total", "ntfy_push HTTP attempts.")
+M_NTFY_FAILURES   = METRICS.counter("tcc_bridge_ntfy_failures_total", "ntfy_push failed attempts.")
+M_RUN_CACHE       = METRICS.counter("tcc_bridge_run_cache_total",
+                                    "Cacheable _run commands by result: hit, miss, "
+                                    "or shared (joined an identical call in flight).",
+                                    ("cmd", "result"))
+M_STATE_PUSHES    = METRICS.counter("tcc_bridge_state_pushes_total",
+                                    "Supabase state pushes by kind: full, patch, keepalive, "
+                                    "skipped (unchanged), busy (another push in flight), "
+                                    "no_key or failed.", ("table", "kind"))
+M_STATE_SAVED_BYTES = METRICS.counter("tcc_bridge_state_push_saved_bytes_total",
+                                      "JSON bytes delta pushes did not send.", ("table",))
+M_STATE_SAVED_REQUESTS = METRICS.counter("tcc_bridge_state_push_saved_requests_total",
+                                         "State pushes skipped as unchanged.", ("table",))
+M_BACKFILL_BATCHES = METRICS.counter("tcc_bridge_backfill_batches_total",
+                                     "Backfill uploads from the local store by stream and "
+                                     "outcome: ok, failed or skipped.", ("stream", "outcome"))
+M_BACKFILL_ROWS   = METRICS.counter("tcc_bridge_backfill_rows_total",
+                                    "Rows backfilled to Supabase from the local store.", ("stream",))
+M_SHELL_RETIRED   = METRICS.counter("tcc_bridge_shell_workers_retired_total",
+                                    "Persistent shells closed, by reason.", ("reason",))
+M_LOOP_SECONDS    = METRICS.histogram("tcc_bridge_thread_loop_duration_seconds",
+                                      "One iteration of a background thread loop.", ("thread",))
+M_SHED            = METRICS.counter("tcc_bridge_shed_total",
+                                    "Requests refused by admission control.", ("lane", "reason"))
+M_BODY_RAW_BYTES  = METRICS.counter("tcc_bridge_response_body_raw_bytes_total",
+                                    "Response body bytes before content-coding.", ("encoding",))
+M_BODY_SENT_BYTES = METRICS.counter("tcc_bridge_response_body_sent_bytes_total",
+                                    "Response body bytes as sent on the wire.", ("encoding",))
+METRICS.gauge_fn("tcc_bridge_uptime_seconds", "Seconds since the bridge started.",
+                 lambda: round(time.time() - START_TIME, 3))
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# SHARED MEMORY (pre-fork workers)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# With BRIDGE_PROCS > 1 the supervisor maps one anonymous shared segment before
+# forking. It is cut into fixed slots, each with a single writer: the leader's
+# /health snapshot, one metrics snapshot per worker, and the leader's metric
+# history ring. Readers never lock; a CRC over the payload catches a read that
+# raced a write.
+class SharedSlot:
+    _HEADER = struct.Struct("<dII")  # written_at, length, crc32
+
+    def __init__(self, mm: mmap.mmap, offset: int, size: int):
+        self._mm, self._offset, self._size = mm, offset, size
+
+    def write(self, payload: bytes) -> bool:
+        if len(payload) > self._size - self._HEADER.size:
+            return False
+        start = self._offset + self._HEADER.size
+        self._mm[start:start + len(payload)] = payload
+        self._mm[self._offset:start] = self._HEADER.pack(time.time(), len(payload),
+                                                         zlib.crc32(payload))
+        return True
+
+    def read(self):
+        """Return (payload, written_at), or (None, None) if empty or torn."""
+        start = self._offset + self._HEADER.size
+        for _ in range(3):
+            written_at, length, crc = self._HEADER.unpack(self._mm[self._offset:start])
+            if not written_at or length > self._size - self._HEADER.size:
+                return None, None
+            payload = self._mm[start:start + length]
+            if zlib.crc32(payload) == crc:
+                return payload, written_at
+        return None, None
+
+
+class SharedState:
+    HEALTH_SIZE  = 64 * 1024
+    METRICS_SIZE = 512 * 1024
+
+    def __init__(self, workers: int):
+        history_at = self.HEALTH_SIZE + workers * self.METRICS_SIZE
+        self._mm = mmap.mmap(-1, history_at + metric_history.nbytes)
+        self.health  = SharedSlot(self._mm, 0, self.HEALTH_SIZE)
+        self.metrics = [SharedSlot(self._mm, self.HEALTH_SIZE + i * self.METRICS_SIZE,
+                                   self.METRICS_SIZE)
+                        for i in range(workers)]
+        self.history = memoryview(self._mm)[history_at:]
+
+
+# Commands worth their own label; everything else (arbitrary /exec) is "other"
+_LABELLED_CMDS = {"pm", "df", "ip", "pgrep", "getprop"}
+
+# Read-only collector commands and how long (s) _run() may reuse their output
+# (storage and network come from collectors, which reads the kernel directly)
+CMD_BATTERY  = "termux-battery-status"
+CMD_SIGNAL   = "termux-telephony-cellinfo"
+CMD_APPS     = "pm list packages -3 2>/dev/null"
+_RUN_CACHE_TTL = {
+    CMD_BATTERY:  10,   # a Termux:API broadcast, the priciest of the lot
+    CMD_APPS:     300,
+}
+
+
+def _cmd_label(cmd: str) -> str:
+    word = cmd.split(None, 1)[0] if cmd.strip() else ""
+    return word if word.startswith("termux-") or word in _LABELLED_CMDS else "other"
+
 
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 # UTILITY FUNCTIONS
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+def _observe_cmd(cmd: str, started: float, outcome: str):
+    label = _cmd_label(cmd)
+    M_SUBPROC.inc(label, outcome)
+    M_SUBPROC_SECONDS.observe(time.monotonic() - started, label)
+
+
 def _run(cmd: str, timeout: int = 15) -> str:
-    """Run a shell command and return stdout (stripped). Non-fatal on error."""
+    """Run a shell command and return stdout (stripped). Non-fatal on error.
+    Commands in _RUN_CACHE_TTL are answered from run_cache."""
+    if cmd in run_cache.ttls:
+        return run_cache.get(cmd, lambda: _run_once(cmd, timeout))
+    return _run_once(cmd, timeout)
+
+
+def _run_once(cmd: str, timeout: int) -> str:
+    started = time.monotonic()
     try:
         result = subprocess.run(
             cmd, shell=True, capture_output=True,
             text=True, timeout=timeout
         )
+        _observe_cmd(cmd, started, "ok" if result.returncode == 0 else "error")
         if result.returncode != 0 and result.stderr:
             log.debug("CMD stderr [%s]: %s", cmd[:60], result.stderr.strip())
         return result.stdout.strip()
     except subprocess.TimeoutExpired:
+        _observe_cmd(cmd, started, "timeout")
         log.warning("CMD timeout [%s]", cmd[:60])
         return ""
     except Exception as exc:
+        _observe_cmd(cmd, started, "exception")
         log.warning("CMD error [%s]: %s", cmd[:60], exc)
         return ""
 
 
-def _run_full(cmd: str, timeout: int = 30) -> dict:
-    """Run a shell command and return full result dict."""
+class RunCache:
+    """TTL cache with singleflight for read-only commands: a caller inside the
+    TTL gets the last output, and callers arriving while the command runs wait
+    for that same subprocess instead of starting their own. Empty output (the
+    command failed) is shared with the waiters but not kept."""
+
+    def __init__(self, ttls: dict):
+        self.ttls     = ttls
+        self._lock    = threading.Lock()
+        self._results = {}  # cmd -> (expires, output)
+        self._flights = {}  # cmd -> [done Event, output]
+
+    def get(self, cmd: str, fetch) -> str:
+        label = _cmd_label(cmd)
+        with self._lock:
+            cached = self._results.get(cmd)
+            if cached is not None and cached[0] > time.monotonic():
+                M_RUN_CACHE.inc(label, "hit")
+                return cached[1]
+            flight = self._flights.get(cmd)
+            leader = flight is None
+            if leader:
+                flight = self._flights[cmd] = [threading.Event(), ""]
+        if not leader:
+            M_RUN_CACHE.inc(label, "shared")
+            flight[0].wait()
+            return flight[1]
+        M_RUN_CACHE.inc(label, "miss")
+        try:
+            flight[1] = fetch()
+        finally:
+            with self._lock:
+                del self._flights[cmd]
+                if flight[1]:
+                    self._results[cmd] = (time.monotonic() + self.ttls[cmd], flight[1])
+            flight[0].set()
+        return flight[1]
+
+
+run_cache = RunCache(_RUN_CACHE_TTL)
+
+
+def _kill_group(proc):
+    """SIGKILL a command started with start_new_session=True, grandchildren included."""
     try:
-        result = subprocess.run(
-            cmd, shell=True, capture_output=True,
-            text=True, timeout=timeout
-        )
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode
-        }
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+def _spawn(cmd: str, stdin=subprocess.DEVNULL, **kwargs) -> subprocess.Popen:
+    """Start a shell command in its own session so _kill_group() can reap
+    everything it forks. Shared by _run_full, streaming /exec and /jobs."""
+    return subprocess.Popen(cmd, shell=True, stdin=stdin,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=True, **kwargs)
+
+
+def _run_full(cmd: str, timeout: int = 30, session: str = None, stdin=None) -> dict:
+    """Run a shell command and return full result dict. Goes through the
+    persistent shells (see ShellPool) unless SHELL_POOL=0 and no session, or
+    `stdin` feeds the command (see _capture_spawned), which needs a fresh one.
+    Output past EXEC_MEMORY_MAX spills to disk (see OutputCapture)."""
+    started = time.monotonic()
+    capture = OutputCapture(spills, EXEC_MEMORY_MAX)
+    out, err = capture.sink("stdout"), capture.sink("stderr")
+    try:
+        if stdin is None and (SHELL_POOL > 0 or session is not None):
+            returncode = shells.run(cmd, timeout, out, err, session)
+        else:
+            returncode = _capture_spawned(cmd, timeout, out, err, stdin)
+        _observe_cmd(cmd, started, "ok" if returncode == 0 else "error")
+        return capture.result(returncode)
     except subprocess.TimeoutExpired:
+        capture.discard()
+        _observe_cmd(cmd, started, "timeout")
         return {"stdout": "", "stderr": "Command timed out.", "returncode": -1}
     except Exception as exc:
+        capture.discard()
+        _observe_cmd(cmd, started, "exception")
         return {"stdout": "", "stderr": str(exc), "returncode": -2}
+    finally:
+        capture.close()
+
+
+def _capture_spawned(cmd: str, timeout: int, out, err, stdin=None) -> int:
+    """Run `cmd` in a fresh shell, passing output to the `out`/`err` callables
+    as it arrives; returns the exit status. `stdin`, if given, is called on its
+    own thread with the command's stdin pipe and must close it when done."""
+    deadline = time.monotonic() + timeout
+    with _spawn(cmd, subprocess.PIPE if stdin else subprocess.DEVNULL) as proc:
+        feeder = None
+        if stdin is not None:
+            feeder = threading.Thread(target=stdin, args=(proc.stdin,),
+                                      name="exec-stdin", daemon=True)
+            feeder.start()
+        sel = selectors.DefaultSelector()
+        sel.register(proc.stdout, selectors.EVENT_READ, out)
+        sel.register(proc.stderr, selectors.EVENT_READ, err)
+        try:
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        key.data(chunk)
+                    else:
+                        sel.unregister(key.fileobj)
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            proc.wait()
+            raise
+        finally:
+            sel.close()
+            if feeder is not None:
+                feeder.join()
+    return proc.returncode
+
+
+class _LineSplitter:
+    """Cuts a byte stream into lines without ever holding more than max_line bytes."""
+
+    def __init__(self, max_line: int = 64 * 1024):
+        self._buf = b""
+        self._max = max_line
+
+    def feed(self, chunk: bytes) -> list:
+        *lines, self._buf = (self._buf + chunk).split(b"\n")
+        if len(self._buf) >= self._max:
+            lines.append(self._buf)
+            self._buf = b""
+        return lines
+
+    def flush(self) -> list:
+        rest, self._buf = self._buf, b""
+        return [rest] if rest else []
+
+
+class _RawChunks:
+    """_LineSplitter stand-in for binary output: every read passes through as is."""
+
+    def feed(self, chunk: bytes) -> list:
+        return [chunk]
+
+    def flush(self) -> list:
+        return []
+
+
+def _stream_exec(cmd: str, timeout: int = 30, client=None, on_spawn=None, raw: bool = False):
+    """Run a shell command and yield ("stdout"|"stderr", [line_bytes, ...]) for
+    each read as output is produced, then a final ("exit", info_dict). With
+    `raw`, the lists hold the bytes exactly as read instead of lines.
+
+    Memory stays bounded no matter how much the command prints. If `client`
+    (the requesting socket) hangs up, or the generator is closed, the whole
+    process group is killed. `on_spawn(proc)` lets a caller keep the Popen
+    handle, e.g. to cancel from another thread.
+    """
+    started  = time.monotonic()
+    deadline = started + timeout
+    proc = _spawn(cmd)
+    if on_spawn is not None:
+        on_spawn(proc)
+    sel = selectors.DefaultSelector()
+    splitter = _RawChunks if raw else _LineSplitter
+    sel.register(proc.stdout, selectors.EVENT_READ, ("stdout", splitter()))
+    sel.register(proc.stderr, selectors.EVENT_READ, ("stderr", splitter()))
+    if client is not None:
+        sel.register(client, selectors.EVENT_READ, ("client", None))
+    open_pipes = 2
+    timed_out  = False
+    try:
+        while open_pipes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in sel.select(remaining):
+                name, splitter = key.data
+                if name == "client":
+                    if not client.recv(1, socket.MSG_PEEK):
+                        log.info("Stream client went away; killed [%s]", cmd[:60])
+                        _observe_cmd(cmd, started, "cancelled")
+                        return
+                    sel.unregister(client)  # pipelined request: leave it for later
+                    continue
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    lines = splitter.feed(chunk)
+                else:
+                    sel.unregister(key.fileobj)
+                    open_pipes -= 1
+                    lines = splitter.flush()
+                if lines:
+                    yield name, lines
+        if not timed_out:
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+        if timed_out:
+            _kill_group(proc)
+            proc.wait()
+            _observe_cmd(cmd, started, "timeout")
+            yield "exit", {"returncode": -1, "error": "Command timed out.",
+                           "duration": round(time.monotonic() - started, 3)}
+            return
+        _observe_cmd(cmd, started, "ok" if proc.returncode == 0 else "error")
+        yield "exit", {"returncode": proc.returncode,
+                       "duration": round(time.monotonic() - started, 3)}
+    finally:
+        sel.close()
+        if proc.poll() is None:
+            _kill_group(proc)
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
 
 
 def _http(method: str, url: str, data: dict = None, headers: dict = None,
@@ -128,61 +831,461 @@ def _http(method: str, url: str, data: dict = None, headers: dict = None,
     _headers = {"Content-Type": "application/json"}
     if headers:
         _headers.update(headers)
+    host = urlparse(url).hostname or "unknown"
     for attempt in range(retries):
+        started = time.monotonic()
         try:
             req = Request(url, data=body, headers=_headers, method=method.upper())
             with urlopen(req, timeout=15) as resp:
                 raw = resp.read().decode("utf-8")
+                M_UPSTREAM_SECONDS.observe(time.monotonic() - started, host, "ok")
                 return json.loads(raw) if raw.strip() else {"ok": True}
         except (URLError, HTTPError) as exc:
+            M_UPSTREAM_SECONDS.observe(time.monotonic() - started, host, "error")
             wait = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
             log.warning("HTTP %s %s failed (attempt %d/%d): %s. Retrying in %ds.",
                         method, url, attempt + 1, retries, exc, wait)
+            if attempt + 1 < retries:
+                M_UPSTREAM_RETRIES.inc(host)
             if _stop_event.wait(wait):
                 break
         except Exception:
             log.error("HTTP unexpected error: %s", traceback.format_exc())
             break
+    M_UPSTREAM_GIVEUPS.inc(host)
     return {"error": "max_retries_exceeded"}
 
 
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# EXEC OUTPUT CAPTURE (bounded memory, spill to disk)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# `logcat -d` or `find /` can print hundreds of MB, enough for pm2's
+# max_memory_restart to kill the bridge if _run_full() buffered it all. Each
+# stream keeps only its first EXEC_MEMORY_MAX bytes in memory; one that grows
+# past that is written in full to <id>.stdout / <id>.stderr under
+# EXEC_SPILL_DIR, and the /exec reply carries the id for GET /exec/output/<id>.
+class SpillStore:
+    """Spill files, deleted `retention` seconds after their last write."""
+
+    def __init__(self, root: str, retention: int, max_bytes: int):
+        self.root      = root
+        self.retention = retention
+        self.max_bytes = max_bytes
+
+    def _file(self, out_id: str, stream: str) -> str:
+        return os.path.join(self.root, f"{out_id}.{stream}")
+
+    def create(self) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        self.prune()
+        return secrets.token_hex(8)
+
+    def open(self, out_id: str, stream: str):
+        return open(self._file(out_id, stream), "wb")
+
+    def append(self, out_id: str, stream: str, data: bytes):
+        path = self._file(out_id, stream)
+        try:
+            room = self.max_bytes - os.path.getsize(path)
+        except FileNotFoundError:
+            room = self.max_bytes
+        if room > 0:
+            with open(path, "ab") as f:
+                f.write(data[:room])
+
+    def write_exit(self, out_id: str, info: dict):
+        with open(self._file(out_id, "exit"), "w", encoding="utf-8") as f:
+            json.dump(info, f)
+
+    def exit_info(self, out_id: str):
+        """The exit status a binary /exec recorded, or None."""
+        if len(out_id) != 16 or not all(c in "0123456789abcdef" for c in out_id):
+            return None
+        try:
+            with open(self._file(out_id, "exit"), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def remove(self, out_id: str):
+        for stream in ("stdout", "stderr", "exit"):
+            try:
+                os.remove(self._file(out_id, stream))
+            except FileNotFoundError:
+                pass
+
+    def read(self, out_id: str, stream: str, offset: int, length: int):
+        """Return (bytes, total_size), or None if there is no such spill file."""
+        if len(out_id) != 16 or not all(c in "0123456789abcdef" for c in out_id):
+            return None
+        try:
+            with open(self._file(out_id, stream), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                f.seek(offset)
+                return f.read(length), size
+        except FileNotFoundError:
+            return None
+
+    def prune(self):
+        cutoff = time.time() - self.retention
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class OutputCapture:
+    """Collects one command's stdout and stderr for _run_full()."""
+
+    def __init__(self, store: SpillStore, limit: int):
+        self.store  = store
+        self.limit  = limit
+        self.id     = None
+        self.sizes  = {"stdout": 0, "stderr": 0}   # bytes the command produced
+        self.saved  = {"stdout": 0, "stderr": 0}   # bytes in the spill files
+        self._head  = {"stdout": bytearray(), "stderr": bytearray()}
+        self._files = {}
+
+    def sink(self, stream: str):
+        return functools.partial(self.write, stream)
+
+    def write(self, stream: str, chunk: bytes):
+        if not chunk:
+            return
+        head = self._head[stream]
+        self.sizes[stream] += len(chunk)
+        f = self._files.get(stream)
+        if f is None and self.sizes[stream] > self.limit:
+            if self.id is None:
+                self.id = self.store.create()
+            f = self._files[stream] = self.store.open(self.id, stream)
+            f.write(head)
+            self.saved[stream] = len(head)
+        if f is not None:
+            room = self.store.max_bytes - self.saved[stream]
+            if room > 0:
+                f.write(chunk[:room])
+                self.saved[stream] += min(room, len(chunk))
+        if len(head) < self.limit:
+            head.extend(chunk[:self.limit - len(head)])
+
+    def result(self, returncode: int) -> dict:
+        errors = "strict" if self.id is None else "replace"  # the head may end mid-character
+        out = {
+            "stdout": _decode_output(bytes(self._head["stdout"]), errors),
+            "stderr": _decode_output(bytes(self._head["stderr"]), errors),
+            "returncode": returncode
+        }
+        if self.id is not None:
+            out["output"] = {
+                "id":           self.id,
+                "url":          f"/exec/output/{self.id}",
+                "stdout_bytes": self.sizes["stdout"],
+                "stderr_bytes": self.sizes["stderr"],
+                "spilled":      sorted(self._files),
+                "complete":     all(self.saved[s] == self.sizes[s] for s in self._files),
+            }
+        return out
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+    def discard(self):
+        self.close()
+        if self.id is not None:
+            self.store.remove(self.id)
+
+
+spills = SpillStore(EXEC_SPILL_DIR, EXEC_SPILL_RETENTION_SEC, EXEC_SPILL_MAX)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# PERSISTENT SHELLS (buffered /exec)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# A fresh `sh -c` per command costs a fork+exec of the shell (tens of ms on
+# Android) before the command even starts. ShellWorkers are long-lived shells
+# reading commands on stdin. Each command is eval'd in a subshell with stdin
+# from /dev/null and stdout/stderr redirected into two FIFOs made for it, so
+# its output is framed by EOF exactly as with a fresh shell (background
+# children included); the worker then reports "<marker> <status>" on its own
+# stdout. Sessions eval in the shell itself, so cd and export carry over.
+class ShellSessionBusy(Exception):
+    pass
+
+
+class ShellWorker:
+    def __init__(self, fifo_dir: str, session: str = None):
+        self.fifo_dir = fifo_dir
+        self.session  = session
+        self.commands = 0
+        self.used     = time.monotonic()
+        self.lock     = threading.Lock()  # sessions: one command at a time
+        self.proc = subprocess.Popen(["sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self, reason: str = None):
+        if self.proc.stdin.closed:
+            return
+        if self.proc.poll() is None:
+            _kill_group(self.proc)
+        self.proc.wait()
+        for pipe in (self.proc.stdin, self.proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        if reason:
+            M_SHELL_RETIRED.inc(reason)
+
+    def run(self, cmd: str, timeout: float, out, err) -> int:
+        """Run one command, passing its output to the `out`/`err` callables as it
+        arrives; returns the exit status. Raises subprocess.TimeoutExpired after
+        killing the shell."""
+        mark  = secrets.token_hex(8)
+        fifos = [os.path.join(self.fifo_dir, f"{mark}.{name}") for name in ("out", "err")]
+        fds   = []
+        self.commands += 1
+        self.used = time.monotonic()
+        deadline  = self.used + timeout
+        sel = selectors.DefaultSelector()
+        try:
+            for path, sink in zip(fifos, (out, err)):
+                os.mkfifo(path, 0o600)
+                reader = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+                # Our own write end keeps the FIFO from reading as EOF before the
+                # shell opens it; dropped once the command has finished
+                keeper = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+                fds += [reader, keeper]
+                sel.register(reader, selectors.EVENT_READ, sink)
+            sel.register(self.proc.stdout, selectors.EVENT_READ)
+            quoted = shlex.quote(cmd)
+            self.proc.stdin.write(os.fsencode(
+                (f"command eval {quoted}" if self.session else f"( eval {quoted} )")
+                + f" </dev/null >{shlex.quote(fifos[0])} 2>{shlex.quote(fifos[1])}\n"
+                + f"echo {mark} $?\n"))
+            self.proc.stdin.flush()
+            status, line = None, b""
+            while len(sel.get_map()) > (1 if status is None else 0):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close("timeout")
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if key.data is not None:
+                        if chunk:
+                            key.data(chunk)
+                        else:  # every writer is gone, background children included
+                            sel.unregister(key.fd)
+                    elif not chunk:
+                        # The shell itself exited: `exit` in a session, or killed
+                        self.close("exit")
+                        return self.proc.returncode
+                    else:
+                        line += chunk
+                        while status is None and b"\n" in line:
+                            # Anything else a session leaves on the shell's stdout
+                            # is not our status line; drop it
+                            first, line = line.split(b"\n", 1)
+                            words = first.split()
+                            if len(words) != 2 or words[0] != mark.encode():
+                                continue
+                            status = int(words[1])
+                            sel.unregister(key.fileobj)
+                            for keeper in fds[1::2]:
+                                os.close(keeper)
+                            fds[1::2] = [-1, -1]
+            return status
+        except BrokenPipeError:
+            self.close("exit")
+            return self.proc.returncode
+        finally:
+            sel.close()
+            for fd in fds:
+                if fd >= 0:
+                    os.close(fd)
+            for path in fifos:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.used = time.monotonic()
+
+
+class ShellPool:
+    """Warm stateless ShellWorkers plus named sessions. Bursts beyond `size`
+    get extra shells that are closed once the burst is over."""
+
+    def __init__(self, size: int, recycle: int, max_sessions: int, session_idle: int):
+        self.size         = size
+        self.recycle      = recycle
+        self.max_sessions = max_sessions
+        self.session_idle = session_idle
+        self._lock        = threading.Lock()
+        self._idle        = []
+        self._sessions    = {}
+        self._closed      = False
+        self._fifo_dir    = None  # per process, made on first use
+
+    def _spawn(self, session: str = None) -> ShellWorker:
+        if self._fifo_dir is None:
+            self._fifo_dir = tempfile.mkdtemp(prefix="tcc-shell-")
+        return ShellWorker(self._fifo_dir, session)
+
+    def warm(self):
+        self._closed = False
+        threading.Thread(target=self._refill, name="shell-refill", daemon=True).start()
+
+    def _refill(self):
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) >= self.size:
+                    return
+            try:
+                worker = self._spawn()
+            except OSError as exc:
+                log.warning("Could not start a shell worker: %s", exc)
+                return
+            self._release(worker)
+
+    def _release(self, worker: ShellWorker):
+        reason = None
+        if not worker.alive():
+            reason = "exit"
+        elif worker.commands >= self.recycle:
+            reason = "recycled"
+        else:
+            with self._lock:
+                if not self._closed and len(self._idle) < self.size:
+                    self._idle.append(worker)
+                    return
+        worker.close(reason or "surplus")
+        if reason and not self._closed:
+            threading.Thread(target=self._refill, name="shell-refill", daemon=True).start()
+
+    def run(self, cmd: str, timeout: int, out, err, session: str = None) -> int:
+        if session is not None:
+            return self._run_session(cmd, timeout, out, err, session)
+        worker = None
+        with self._lock:
+            while self._idle and worker is None:
+                worker = self._idle.pop()
+                if not worker.alive():
+                    worker.close("exit")
+                    worker = None
+        if worker is None:
+            worker = self._spawn()
+        try:
+            return worker.run(cmd, timeout, out, err)
+        finally:
+            self._release(worker)
+
+    def _run_session(self, cmd: str, timeout: int, out, err, name: str) -> int:
+        with self._lock:
+            self._prune_sessions()
+            worker = self._sessions.get(name)
+            if worker is None:
+                if len(self._sessions) >= self.max_sessions:
+                    raise ShellSessionBusy(f"{self.max_sessions} shell sessions already open")
+                worker = self._sessions[name] = self._spawn(name)
+                log.info("Shell session %r opened", name)
+        deadline = time.monotonic() + timeout
+        if not worker.lock.acquire(timeout=timeout):
+            raise ShellSessionBusy(f"Shell session {name!r} is busy")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:  # nothing left to run it in; don't kill the session trying
+            worker.lock.release()
+            raise ShellSessionBusy(f"Shell session {name!r} is busy")
+        try:
+            return worker.run(cmd, remaining, out, err)
+        finally:
+            worker.lock.release()
+            if not worker.alive():
+                with self._lock:
+                    if self._sessions.get(name) is worker:
+                        del self._sessions[name]
+                log.info("Shell session %r closed", name)
+
+    def _prune_sessions(self):
+        # Caller holds self._lock
+        now = time.monotonic()
+        for name, worker in list(self._sessions.items()):
+            if now - worker.used > self.session_idle and worker.lock.acquire(blocking=False):
+                del self._sessions[name]
+                worker.close("idle")
+                worker.lock.release()
+                log.info("Shell session %r closed after %ds idle", name, self.session_idle)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"idle": len(self._idle), "sessions": sorted(self._sessions)}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers = self._idle + list(self._sessions.values())
+            self._idle, self._sessions = [], {}
+        for worker in workers:
+            worker.close()
+        if self._fifo_dir is not None:
+            shutil.rmtree(self._fifo_dir, ignore_errors=True)
+            self._fifo_dir = None
+
+
+shells = ShellPool(SHELL_POOL, SHELL_RECYCLE, SHELL_SESSIONS, SHELL_SESSION_IDLE)
+METRICS.gauge_fn("tcc_bridge_shell_workers_idle", "Warm persistent shells waiting for a command.",
+                 lambda: shells.stats()["idle"])
+METRICS.gauge_fn("tcc_bridge_shell_sessions", "Open named shell sessions.",
+                 lambda: len(shells.stats()["sessions"]))
+
+
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 # DEVICE STATE COLLECTORS
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 def get_battery() -> dict:
     try:
-        raw = _run("termux-battery-status", timeout=10)
+        raw = _run(CMD_BATTERY, timeout=10)
         return json.loads(raw) if raw else {}
     except Exception:
         return {}
 
 
 def get_storage() -> dict:
-    try:
-        raw = _run("df /data --output=used,avail,size -m 2>/dev/null | tail -1")
-        parts = raw.split()
-        if len(parts) >= 3:
-            return {
-                "used_mb":  int(parts[0]),
-                "avail_mb": int(parts[1]),
-                "total_mb": int(parts[2])
-            }
-    except Exception:
-        pass
-    return {}
+    return collectors.disk_usage("/data")
 
 
 def get_network_info() -> dict:
+    # No rx/tx counters here: they would make every device_state push a change
+    return {"local_ip": collectors.local_ip() or "unknown"}
+
+
+def get_signal() -> dict:
+    """The serving cell's radio type and signal strength (dBm)."""
     try:
-        ip = _run("ip route get 1 2>/dev/null | awk '{print $NF; exit}'")
-        return {"local_ip": ip or "unknown"}
+        raw = _run(CMD_SIGNAL, timeout=10)
+        cells = json.loads(raw) if raw else []
     except Exception:
         return {}
+    for cell in cells:
+        if isinstance(cell, dict) and cell.get("registered"):
+            return {"type": cell.get("type"), "dbm": cell.get("dbm")}
+    return {}
 
 
 def get_installed_apps() -> list:
     try:
-        raw = _run("pm list packages -3 2>/dev/null", timeout=20)
+        raw = _run(CMD_APPS, timeout=20)
         return [
             line.replace("package:", "").strip()
             for line in raw.splitlines()
@@ -192,9 +1295,34 @@ def get_installed_apps() -> list:
         return []
 
 
-def build_device_state() -> dict:
+# Fields collect_state() can fill, and what a field that never answered becomes
+DEVICE_FIELDS  = ("battery", "storage", "network")
+FULL_FIELDS    = DEVICE_FIELDS + ("apps",)
+_STATE_DEFAULT = {"battery": {}, "storage": {}, "network": {}, "apps": []}
+
+# Each field's refresh interval (s) and cost tier
+state_collector = collectors.Registry(STATE_DEADLINE_SEC)
+state_collector.register("battery", get_battery,        60,  collectors.SLOW)
+state_collector.register("storage", get_storage,        60,  collectors.CHEAP)
+state_collector.register("network", get_network_info,   30,  collectors.CHEAP)
+state_collector.register("apps",    get_installed_apps, 900, collectors.HEAVY)
+# Not pushed to device_state; kept warm for the metric history
+state_collector.register("signal",  get_signal,         60,  collectors.SLOW)
+
+
+def collect_state(fields: tuple = DEVICE_FIELDS) -> dict:
+    """The cached values for `fields` (see collectors.Registry.get); a field
+    that has never been collected is waited for up to STATE_DEADLINE_SEC."""
+    report = state_collector.get(fields)
+    if report["missing"] or report["stale"]:
+        log.warning("Device state partial: missing=%s stale=%s",
+                    report["missing"], report["stale"])
+    return {name: report["values"].get(name, _STATE_DEFAULT[name]) for name in fields}
+
+
+def build_device_state(fields: tuple = DEVICE_FIELDS) -> dict:
     uptime = int(time.time() - START_TIME)
-    return {
+    state = {
         "id":         "phone-bridge",
         "device_id":  DEVICE_ID,
         "version":    VERSION,
@@ -202,17 +1330,227 @@ def build_device_state() -> dict:
         "uptime":     uptime,
         "timestamp":  time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         "last_seen":  time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        "battery":    get_battery(),
-        "storage":    get_storage(),
-        "network":    get_network_info(),
     }
+    state.update(collect_state(fields))
+    return state
 
 
 def build_full_state() -> dict:
     """Full state including app list (slower, used for periodic deep reports)."""
-    state = build_device_state()
-    state["apps"] = get_installed_apps()
-    return state
+    return build_device_state(FULL_FIELDS)
+
+
+class HealthSnapshot:
+    """Last-known device health for /health, kept fresh off the request path.
+
+    get() never runs a subprocess: it returns whatever snapshot is held plus its
+    age, and if that is older than max_age it kicks one background refresh
+    (stale-while-revalidate). Before the first refresh completes the snapshot
+    is empty and the age is None.
+
+    Pre-fork workers share one snapshot: the leader writes each refresh to a
+    SharedSlot and the others adopt it (see SharedSyncThread).
+    """
+
+    def __init__(self, collect, max_age: float):
+        self._collect    = collect
+        self._max_age    = max_age
+        self._lock       = threading.Lock()
+        self._data       = {}
+        self._taken_at   = None
+        self._refreshing = False
+        self._slot       = None
+        self._writer     = False
+
+    def share(self, slot: "SharedSlot", writer: bool):
+        self._slot, self._writer = slot, writer
+
+    def adopt_shared(self) -> bool:
+        """Take the shared snapshot if it is newer than ours; True if adopted."""
+        payload, written_at = self._slot.read()
+        if payload is None:
+            return False
+        with self._lock:
+            if self._taken_at is not None and written_at <= self._taken_at:
+                return False
+            self._data, self._taken_at = json.loads(payload), written_at
+        return True
+
+    def get(self):
+        with self._lock:
+            data, taken_at = self._data, self._taken_at
+            age = None if taken_at is None else time.time() - taken_at
+            if (age is None or age > self._max_age) and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._do_refresh, name="health-revalidate",
+                                 daemon=True).start()
+        return data, age
+
+    def refresh(self):
+        """Collect a fresh snapshot now (blocking). Used by the refresher thread."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        self._do_refresh()
+
+    def _do_refresh(self):
+        try:
+            data = self._collect()
+            with self._lock:
+                self._data, self._taken_at = data, time.time()
+            if self._writer:
+                self._slot.write(json.dumps(data, default=str).encode("utf-8"))
+            events.publish("health", data)
+        except Exception:
+            log.warning("Health snapshot refresh failed: %s", traceback.format_exc())
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def _collect_health() -> dict:
+    return {"battery": get_battery()}
+
+
+health_snapshot = HealthSnapshot(_collect_health, HEALTH_MAX_AGE)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# METRIC HISTORY (GET /metrics/history)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# Recent device readings kept on the phone, so "what did the battery
+# temperature do in the last hour" needs no Supabase round-trip. Each series
+# is one typed column (float32 values, float64 timestamps) in a ring of fixed
+# size: appending allocates nothing, and a day of 2 s samples stays under 2 MB.
+# Under pre-fork the columns live in the shared segment; the leader samples
+# and every worker answers queries from it.
+HISTORY_METRICS = ("battery.pct", "battery.temp", "load.1m", "load.5m", "cpu.pct",
+                   "mem.used_mb", "mem.available_mb", "storage.avail_mb", "signal.dbm")
+
+
+class MetricHistory:
+    """Ring of the last `capacity` samples of each series. A series with no
+    reading in a sample stores NaN, which queries skip."""
+    _META = 2  # int64s ahead of the columns: next slot, samples held
+
+    def __init__(self, series: tuple, capacity: int):
+        self.series   = tuple(series)
+        self.capacity = max(1, capacity)
+        self.nbytes   = 8 * self._META + self.capacity * (8 + 4 * len(self.series))
+        self._lock    = threading.Lock()
+        self._bind(None)
+
+    def _bind(self, buf):
+        cap = self.capacity
+        if buf is None:
+            self._meta = array.array("q", bytes(8 * self._META))
+            self._t    = array.array("d", bytes(8 * cap))
+            self._cols = {name: array.array("f", bytes(4 * cap)) for name in self.series}
+            return
+        offset = 8 * self._META
+        self._meta = buf[:offset].cast("q")
+        self._t    = buf[offset:offset + 8 * cap].cast("d")
+        offset += 8 * cap
+        self._cols = {}
+        for name in self.series:
+            self._cols[name] = buf[offset:offset + 4 * cap].cast("f")
+            offset += 4 * cap
+
+    def share(self, buf: memoryview):
+        """Pre-fork: keep the ring in `buf`, a zeroed (empty) region of the
+        shared segment. A respawned leader appends after what is there."""
+        self._bind(buf[:self.nbytes])
+
+    def append(self, ts: float, values: dict):
+        with self._lock:
+            i = self._meta[0]
+            for name, col in self._cols.items():
+                try:
+                    col[i] = float(values.get(name))
+                except (TypeError, ValueError, OverflowError):
+                    col[i] = math.nan
+            self._t[i] = ts
+            self._meta[0] = (i + 1) % self.capacity
+            self._meta[1] = min(self.capacity, self._meta[1] + 1)
+
+    def query(self, name: str, since: float, step: float) -> dict:
+        """Samples of `name` taken at or after `since`, in buckets of `step`
+        seconds: columns of bucket start, min, max, mean and sample count.
+        Empty buckets are left out."""
+        col = self._cols[name]
+        # Other pre-fork workers read without the leader's lock; at worst one
+        # sample is caught mid-write
+        with self._lock:
+            head, count = self._meta[0], self._meta[1]
+            times, values = self._t.tolist(), col.tolist()
+        buckets = {}
+        for i in range(head - count, head):  # oldest first; a negative i wraps
+            t, v = times[i], values[i]
+            if t < since or v != v:
+                continue
+            key = int((t - since) // step)
+            b = buckets.get(key)
+            if b is None:
+                buckets[key] = [v, v, v, 1]
+            else:
+                if v < b[0]:
+                    b[0] = v
+                if v > b[1]:
+                    b[1] = v
+                b[2] += v
+                b[3] += 1
+        out = {"t": [], "min": [], "max": [], "avg": [], "n": []}
+        for key in sorted(buckets):
+            lo, hi, total, n = buckets[key]
+            out["t"].append(round(since + key * step, 3))
+            out["min"].append(round(lo, 3))
+            out["max"].append(round(hi, 3))
+            out["avg"].append(round(total / n, 3))
+            out["n"].append(n)
+        return out
+
+
+def history_sample(cpu_before: dict, cpu_after: dict) -> dict:
+    """One reading of every HISTORY_METRICS series. Kernel figures are read
+    fresh; battery and signal are the state_collector's cached values (a
+    Termux:API call every few seconds would cost more than it tells), so
+    those series step once per field TTL."""
+    battery = state_collector.peek("battery") or {}
+    cell    = state_collector.peek("signal") or {}
+    load, mem = collectors.loadavg(), collectors.meminfo()
+    return {
+        "battery.pct":      battery.get("percentage"),
+        "battery.temp":     battery.get("temperature"),
+        "load.1m":          load.get("1m"),
+        "load.5m":          load.get("5m"),
+        "cpu.pct":          collectors.cpu_percent(cpu_before, cpu_after),
+        "mem.used_mb":      mem.get("used_mb"),
+        "mem.available_mb": mem.get("available_mb"),
+        "storage.avail_mb": collectors.disk_usage("/data").get("avail_mb"),
+        "signal.dbm":       cell.get("dbm"),
+    }
+
+
+metric_history = MetricHistory(HISTORY_METRICS, HISTORY_CAPACITY)
+
+# Written by the leader only (HistoryThread, HeartbeatThread, BackfillThread)
+metric_store = timeseries.Store(TSDB_PATH, {
+    timeseries.RAW:    TSDB_RAW_DAYS * 86400,
+    timeseries.MINUTE: TSDB_1M_DAYS * 86400,
+    timeseries.HOUR:   TSDB_1H_DAYS * 86400,
+    timeseries.OUTBOX: TSDB_1M_DAYS * 86400,
+}, TSDB_FLUSH_SEC)
+
+
+def close_store():
+    """Write out metric_store's buffered samples and close it. Called on every
+    way out of serve_process(): a hot reload never sets _stop_event, so the
+    HistoryThread's own flush does not run, and exec or os._exit follows."""
+    try:
+        metric_store.close()
+    except Exception:
+        log.error("Local store close failed: %s", traceback.format_exc())
 
 
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
@@ -239,21 +1577,161 @@ def supabase_upsert(table: str, payload: dict) -> dict:
     return result
 
 
-def supabase_insert(table: str, payload: dict) -> dict:
+def supabase_patch(table: str, match: str, payload: dict):
+    """PATCH the rows matching `match`, a PostgREST filter such as "id=eq.x".
+    Returns the matched rows' keys ([] if none matched) or an error dict."""
     if not SUPABASE_KEY:
-        log.debug("SUPABASE_KEY not set â skipping insert to %s", table)
+        log.debug("SUPABASE_KEY not set â skipping patch to %s", table)
         return {"skipped": "no_key"}
-    url = f"{SUPABASE_URL}/rest/v1/{table}"
+    column = match.split("=", 1)[0]
+    url = f"{SUPABASE_URL}/rest/v1/{table}?{match}&select={column}"
     headers = _supabase_headers()
-    headers["Prefer"] = "return=minimal"
-    result = _http("POST", url, payload, headers)
-    if "error" in result:
-        log.warning("Supabase insert to '%s' failed: %s", table, result)
+    headers["Prefer"] = "return=representation"
+    result = _http("PATCH", url, payload, headers)
+    if isinstance(result, dict) and "error" in result:
+        log.warning("Supabase patch to '%s' failed: %s", table, result)
     return result
 
 
-# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-# NTFY CLIENT
+class StatePusher:
+    """Delta pushes of one Supabase row (`key` column names it).
+
+    Remembers the last state Supabase acknowledged, and push() PATCHes only
+    the columns that differ from it. A push whose only changes are `volatile`
+    columns (timestamps, uptime) is skipped unless `keepalive` seconds have
+    passed since the last one went out. The first push, a forced one, and the
+    one after a failure (the acknowledged copy can't be trusted) upsert the
+    whole row, as does a PATCH that finds the row gone. The request goes out
+    without the lock held (offline, _http retries for minutes); a push made
+    while another is in flight returns {"skipped": "busy"} instead of waiting.
+    """
+
+    def __init__(self, table: str, key: str, volatile: tuple, keepalive: int):
+        self.table     = table
+        self.key       = key
+        self.volatile  = frozenset(volatile)
+        self.keepalive = keepalive
+        self._lock     = threading.Lock()
+        self._acked    = None
+        self._sent_at  = 0.0
+        self._sending  = False
+
+    def push(self, state: dict, force: bool = False) -> dict:
+        with self._lock:  # the report thread and /push_state may race
+            if self._sending:
+                M_STATE_PUSHES.inc(self.table, "busy")
+                return {"skipped": "busy"}
+            size = len(json.dumps(state, default=str))
+            changed = None
+            if self._acked is not None and not force:
+                changed = {k: v for k, v in state.items() if self._acked.get(k) != v}
+                if (changed.keys() <= self.volatile
+                        and time.monotonic() - self._sent_at < self.keepalive):
+                    M_STATE_PUSHES.inc(self.table, "skipped")
+                    M_STATE_SAVED_REQUESTS.inc(self.table)
+                    M_STATE_SAVED_BYTES.inc(self.table, amount=size)
+                    return {"skipped": "unchanged"}
+                kind = "keepalive" if changed.keys() <= self.volatile else "patch"
+                if not changed:  # a keepalive still has to say something
+                    changed = {k: state[k] for k in self.volatile & state.keys()}
+            self._sending = True
+        try:
+            result, changed = self._send(state, changed)
+        except Exception:
+            with self._lock:
+                self._sending, self._acked = False, None
+            raise
+        with self._lock:
+            self._sending = False
+            if isinstance(result, dict) and ("error" in result or "skipped" in result):
+                self._acked = None
+                M_STATE_PUSHES.inc(self.table, "failed" if "error" in result else "no_key")
+                return result
+            if changed is None:
+                kind = "full"
+                self._acked = dict(state)
+            else:
+                self._acked.update(changed)
+                M_STATE_SAVED_BYTES.inc(self.table,
+                                        amount=size - len(json.dumps(changed, default=str)))
+            self._sent_at = time.monotonic()
+            M_STATE_PUSHES.inc(self.table, kind)
+            return {"ok": True, "kind": kind, "columns": sorted(state if changed is None else changed)}
+
+    def _send(self, state: dict, changed):
+        """PATCH `changed`, or upsert the whole row when it is None or the
+        PATCH finds the row gone. Returns (result, what was sent: changed or None)."""
+        if changed is not None:
+            match = f"{self.key}=eq.{quote(str(state[self.key]), safe='')}"
+            result = supabase_patch(self.table, match, changed)
+            if result != []:
+                return result, changed
+            log.info("%s row %s is gone; pushing it whole", self.table, state[self.key])
+        return supabase_upsert(self.table, state), None
+
+
+# Columns that change on every build and alone are no reason to push
+state_pusher = StatePusher("device_state", "id", ("timestamp", "last_seen", "uptime"),
+                           STATE_KEEPALIVE_SEC)
+
+
+def supabase_insert(table: str, payload: dict) -> dict:
+    if not SUPABASE_KEY:
+        log.debug("SUPABASE_KEY not set â skipping insert to %s", table)
+        return {"skipped": "no_key"}
+    url = f"{SUPABASE_URL}/rest/v1/{table}"
+    headers = _supabase_headers()
+    headers["Prefer"] = "return=minimal"
+    result = _http("POST", url, payload, headers)
+    if "error" in result:
+        log.warning("Supabase insert to '%s' failed: %s", table, result)
+    return result
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# BACKFILL (local store -> Supabase)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# Nothing waits on these uploads, so an outage only grows the backlog in
+# metric_store: each stream is sent oldest first, a batch at a time, and its
+# cursor moves only when Supabase accepts the batch. A stream stops at its
+# first failure and resumes from the same row next round.
+def _rollup_rows(limit: int):
+    rows, position = metric_store.rollup_batch(timeseries.MINUTE, limit)
+    for row in rows:
+        row["device_id"] = DEVICE_ID
+        row["bucket"]    = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(row["bucket"]))
+    return rows, position
+
+
+# (cursor stream, Supabase table, fetch(limit) -> (rows, position))
+_BACKFILL_STREAMS = (
+    ("heartbeats",       "heartbeats", lambda limit: metric_store.outbox_batch("heartbeats", limit)),
+    (timeseries.MINUTE,  TSDB_TABLE,   _rollup_rows),
+)
+
+
+def backfill(max_batches: int = 20) -> dict:
+    """Upload up to `max_batches` batches per stream; returns rows sent per stream."""
+    sent = {}
+    for stream, table, fetch in _BACKFILL_STREAMS:
+        sent[stream] = 0
+        for _ in range(max_batches):
+            rows, position = fetch(TSDB_BATCH)
+            if not rows or _stop_event.is_set():
+                break
+            result = supabase_upsert(table, rows)
+            if "error" in result or "skipped" in result:
+                M_BACKFILL_BATCHES.inc(stream, "failed" if "error" in result else "skipped")
+                break
+            metric_store.advance(stream, position)
+            M_BACKFILL_BATCHES.inc(stream, "ok")
+            M_BACKFILL_ROWS.inc(stream, amount=len(rows))
+            sent[stream] += len(rows)
+    return sent
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# NTFY CLIENT
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 def ntfy_push(message: str, title: str = "TCC Bridge v7",
               priority=3, tags: list = None) -> dict:
@@ -268,12 +1746,14 @@ def ntfy_push(message: str, title: str = "TCC Bridge v7",
         "Tags":     _tags
     }
     for attempt in range(MAX_RETRIES):
+        M_NTFY_ATTEMPTS.inc()
         try:
             req = Request(url, data=message.encode("utf-8"),
                           headers=headers, method="POST")
             with urlopen(req, timeout=10) as resp:
                 return {"ok": True, "status": resp.status}
         except Exception as exc:
+            M_NTFY_FAILURES.inc()
             wait = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
             log.warning("ntfy push failed (attempt %d/%d): %s. Retry in %ds.",
                         attempt + 1, MAX_RETRIES, exc, wait)
@@ -287,6 +1767,313 @@ def ntfy(msg, priority=3, tags=None):
     return ntfy_push(msg, priority=priority, tags=tags)
 
 
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# EVENT HUB (server-pushed /ws events)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# Events: "heartbeat" (after each heartbeat), "health" (new /health snapshot)
+# and "job" (a background job started or ended).
+WS_EVENTS = ("heartbeat", "health", "job")
+
+
+class EventHub:
+    """Fans events out to every open /ws channel. Subscribers are callables
+    taking (event, data); they are called on the publishing thread and must
+    not block."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = []
+
+    def subscribe(self, fn):
+        with self._lock:
+            self._subs.append(fn)
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subs:
+                self._subs.remove(fn)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def publish(self, event: str, data):
+        with self._lock:
+            subs = list(self._subs)
+        for fn in subs:
+            try:
+                fn(event, data)
+            except Exception as exc:
+                log.debug("Event subscriber error (%s): %s", event, exc)
+
+
+events = EventHub()
+METRICS.gauge_fn("tcc_bridge_ws_connections", "Open /ws channels.", events.count)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# BACKGROUND JOBS (/jobs)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# Long commands outlive the ~100 s Cloudflare origin cutoff, so /jobs starts
+# them detached and lets the caller poll. Each job is a runner thread draining
+# _stream_exec() into <id>.stdout / <id>.stderr under JOBS_DIR, next to a
+# <id>.json metadata file, so finished jobs survive a bridge restart.
+class JobLimitReached(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, cmd: str, timeout: int, created: float = None):
+        self.id         = job_id
+        self.cmd        = cmd
+        self.timeout    = timeout
+        self.status     = "running"   # running|finished|failed|timeout|cancelled|lost
+        self.returncode = None
+        self.created    = created or time.time()
+        self.finished   = None
+        self.truncated  = False
+        self.proc       = None
+        self.owner      = os.getpid()  # process running it (pre-fork: any worker)
+        self.pgid       = None
+
+    def meta(self) -> dict:
+        return {
+            "id":         self.id,
+            "cmd":        self.cmd,
+            "timeout":    self.timeout,
+            "status":     self.status,
+            "returncode": self.returncode,
+            "created":    self.created,
+            "finished":   self.finished,
+            "truncated":  self.truncated,
+            "owner":      self.owner,
+            "pgid":       self.pgid,
+        }
+
+    @classmethod
+    def from_meta(cls, meta: dict) -> "Job":
+        job = cls(meta["id"], meta["cmd"], meta["timeout"], meta["created"])
+        job.owner      = meta.get("owner")
+        job.pgid       = meta.get("pgid")
+        job.status     = meta["status"]
+        if job.status == "running" and not job.foreign_alive():
+            job.status = "lost"
+        job.returncode = meta.get("returncode")
+        job.finished   = meta.get("finished")
+        job.truncated  = meta.get("truncated", False)
+        return job
+
+    def foreign_alive(self) -> bool:
+        """True if another live process (a pre-fork sibling) owns this job."""
+        if not self.owner or self.owner == os.getpid():
+            return False
+        try:
+            os.kill(self.owner, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+class JobTable:
+    """Bounded job registry: at most `max_running` live jobs, at most `max_jobs`
+    remembered, finished ones forgotten (and their files deleted) after
+    `retention` seconds.
+
+    With `shared` set (pre-fork workers) every lookup first rescans JOBS_DIR,
+    so a job started by one worker can be polled and cancelled through any."""
+
+    def __init__(self, root: str, max_jobs: int, max_running: int,
+                 retention: int, max_output: int):
+        self.root        = root
+        self.max_jobs    = max_jobs
+        self.max_running = max_running
+        self.retention   = retention
+        self.max_output  = max_output
+        self._lock       = threading.Lock()
+        self._jobs       = {}
+        self._loaded     = False
+        self.shared      = False
+
+    def _file(self, job_id: str, ext: str) -> str:
+        return os.path.join(self.root, f"{job_id}.{ext}")
+
+    def _save(self, job: Job):
+        tmp = self._file(job.id, "json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job.meta(), f)
+        os.replace(tmp, self._file(job.id, "json"))
+
+    def _load(self):
+        # Lazily, so importing the module never touches the disk
+        if self._loaded:
+            if self.shared:
+                self._sync()
+            return
+        self._loaded = True
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name), encoding="utf-8") as f:
+                    job = Job.from_meta(json.load(f))
+                self._jobs[job.id] = job
+            except Exception as exc:
+                log.warning("Skipping unreadable job file %s: %s", name, exc)
+
+    def _sync(self):
+        """Pick up jobs other workers started or changed; ours stay as they are."""
+        seen = set()
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-5]
+            seen.add(job_id)
+            mine = self._jobs.get(job_id)
+            if mine is not None and mine.owner == os.getpid():
+                continue
+            try:
+                with open(os.path.join(self.root, name), encoding="utf-8") as f:
+                    self._jobs[job_id] = Job.from_meta(json.load(f))
+            except (OSError, ValueError):
+                pass  # mid-replace or just forgotten; next scan sees it
+        for job_id in [j for j, job in self._jobs.items()
+                       if j not in seen and job.owner != os.getpid()]:
+            del self._jobs[job_id]
+
+    def _forget(self, job: Job):
+        self._jobs.pop(job.id, None)
+        for ext in ("json", "stdout", "stderr", "cancel"):
+            try:
+                os.remove(self._file(job.id, ext))
+            except FileNotFoundError:
+                pass
+
+    def _prune(self):
+        now = time.time()
+        done = sorted((j for j in self._jobs.values() if j.status != "running"),
+                      key=lambda j: j.finished or j.created)
+        for job in done:
+            if now - (job.finished or job.created) > self.retention:
+                self._forget(job)
+        done = [job for job in done if job.id in self._jobs]
+        overflow = len(self._jobs) - self.max_jobs
+        for job in done[:max(0, overflow)]:
+            self._forget(job)
+
+    def running(self) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.status == "running")
+
+    def start(self, cmd: str, timeout: int) -> Job:
+        with self._lock:
+            self._load()
+            self._prune()
+            if sum(1 for j in self._jobs.values() if j.status == "running") >= self.max_running:
+                raise JobLimitReached(f"{self.max_running} jobs already running")
+            if len(self._jobs) >= self.max_jobs:
+                raise JobLimitReached(f"job table full ({self.max_jobs})")
+            job = Job(secrets.token_hex(6), cmd, timeout)
+            self._jobs[job.id] = job
+            self._save(job)
+        events.publish("job", job.meta())
+        threading.Thread(target=self._run, args=(job,), name=f"job-{job.id}",
+                         daemon=True).start()
+        log.info("JOB %s started: %s", job.id, cmd)
+        return job
+
+    def _run(self, job: Job):
+        sizes = {"stdout": 0, "stderr": 0}
+        files = {name: open(self._file(job.id, name), "ab") for name in sizes}
+        try:
+            for kind, data in _stream_exec(job.cmd, job.timeout,
+                                           on_spawn=lambda p: self._spawned(job, p)):
+                if kind == "exit":
+                    job.returncode = data["returncode"]
+                    if job.status == "running" and os.path.exists(self._file(job.id, "cancel")):
+                        job.status = "cancelled"  # by a sibling worker, see cancel()
+                    if job.status == "running":
+                        if "error" in data:
+                            job.status = "timeout"
+                        else:
+                            job.status = "finished" if data["returncode"] == 0 else "failed"
+                    continue
+                chunk = b"".join(line + b"\n" for line in data)
+                if sizes[kind] + len(chunk) > self.max_output:
+                    job.truncated = True
+                    continue
+                files[kind].write(chunk)
+                files[kind].flush()
+                sizes[kind] += len(chunk)
+        except Exception:
+            log.error("JOB %s runner error: %s", job.id, traceback.format_exc())
+            job.status = "failed" if job.status == "running" else job.status
+        finally:
+            for f in files.values():
+                f.close()
+            job.proc = None
+            job.finished = time.time()
+            with self._lock:
+                self._save(job)
+            log.info("JOB %s %s (rc=%s)", job.id, job.status, job.returncode)
+            events.publish("job", job.meta())
+
+    def _spawned(self, job: Job, proc):
+        job.proc, job.pgid = proc, proc.pid  # _spawn() makes it a session leader
+        if self.shared:
+            with self._lock:
+                self._save(job)
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._load()
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            self._load()
+            self._prune()
+            return [j.meta() for j in sorted(self._jobs.values(), key=lambda j: j.created)]
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.status == "running" and job.owner != os.getpid():
+            # Another worker's runner thread owns it: kill the process group and
+            # leave a marker so that runner records "cancelled", not "failed".
+            open(self._file(job.id, "cancel"), "w").close()
+            if job.pgid:
+                try:
+                    os.killpg(job.pgid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+            job.status = "cancelled"
+            log.info("JOB %s cancelled (owned by pid %s)", job_id, job.owner)
+        elif job.status == "running":
+            job.status = "cancelled"
+            if job.proc is not None:
+                _kill_group(job.proc)
+            log.info("JOB %s cancelled", job_id)
+        return job
+
+    def read(self, job: Job, stream: str, offset: int, length: int):
+        """Return (bytes, next_offset) from one of the job's output files."""
+        try:
+            with open(self._file(job.id, stream), "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+        except FileNotFoundError:
+            data = b""
+        return data, offset + len(data)
+
+
+jobs = JobTable(JOBS_DIR, JOB_MAX, JOB_MAX_RUNNING, JOB_RETENTION_SEC, JOB_MAX_OUTPUT)
+METRICS.gauge_fn("tcc_bridge_jobs_running", "Background /jobs currently running.", jobs.running)
+
+
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 # BACKGROUND THREADS
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
@@ -295,19 +2082,22 @@ class HeartbeatThread(threading.Thread):
     def __init__(self):
         super().__init__(name="heartbeat", daemon=True)
         self._consecutive_failures = 0
+        self._last_row  = None  # the last heartbeat row Supabase accepted ...
+        self._last_sent = 0.0   # ... and when
 
     def run(self):
         log.info("Heartbeat thread started (every %ds).", HEARTBEAT_SEC)
         _stop_event.wait(10)  # initial stagger
         while not _stop_event.is_set():
+            started = time.monotonic()
             try:
                 bat = get_battery()
                 level  = bat.get("percentage", "?")
                 status = bat.get("status", "?")
-                msg = f"\u{1F493} {DEVICE_ID} | v{VERSION} | Battery: {level}% [{status}]"
+                msg = f"\U0001F493 {DEVICE_ID} | v{VERSION} | Battery: {level}% [{status}]"
                 ntfy_push(msg, title="TCC Heartbeat",
                           priority="default", tags=["heartbeat", "white_check_mark"])
-                supabase_upsert("heartbeats", {
+                self._record({
                     "device_id":   DEVICE_ID,
                     "timestamp":   time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
                     "battery_pct": level,
@@ -316,6 +2106,12 @@ class HeartbeatThread(threading.Thread):
                 })
                 self._consecutive_failures = 0
                 log.info("Heartbeat sent. Battery: %s%%", level)
+                events.publish("heartbeat", {
+                    "device_id": DEVICE_ID,
+                    "version":   VERSION,
+                    "battery":   bat,
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                })
             except Exception:
                 self._consecutive_failures += 1
                 log.error("Heartbeat error (#%d): %s",
@@ -330,8 +2126,29 @@ class HeartbeatThread(threading.Thread):
                         self._consecutive_failures = 0  # reset after alert
                     except Exception:
                         pass
+            M_LOOP_SECONDS.observe(time.monotonic() - started, self.name)
             _stop_event.wait(HEARTBEAT_SEC)
 
+    def _record(self, row: dict):
+        """Insert a heartbeat row, unless it only repeats the last one's
+        battery/status/version within STATE_KEEPALIVE_SEC."""
+        same = self._last_row is not None and all(
+            self._last_row[k] == row[k] for k in ("battery_pct", "status", "version"))
+        if same and time.monotonic() - self._last_sent < STATE_KEEPALIVE_SEC:
+            M_STATE_PUSHES.inc("heartbeats", "skipped")
+            M_STATE_SAVED_REQUESTS.inc("heartbeats")
+            M_STATE_SAVED_BYTES.inc("heartbeats", amount=len(json.dumps(row)))
+            return
+        result = supabase_upsert("heartbeats", row)
+        if "error" in result or "skipped" in result:
+            M_STATE_PUSHES.inc("heartbeats", "failed" if "error" in result else "no_key")
+            if "error" in result:
+                metric_store.append("heartbeats", row)  # BackfillThread retries it
+                log.info("Heartbeat kept for backfill.")
+            return
+        self._last_row, self._last_sent = row, time.monotonic()
+        M_STATE_PUSHES.inc("heartbeats", "keepalive" if same else "full")
+
 
 class ReportThread(threading.Thread):
     """Periodically pushes full device state to Supabase."""
@@ -342,16 +2159,110 @@ class ReportThread(threading.Thread):
         log.info("Report thread started (every %ds).", REPORT_SEC)
         _stop_event.wait(15)  # stagger from heartbeat
         while not _stop_event.is_set():
+            started = time.monotonic()
             try:
                 state = build_full_state()
-                # Upsert into device_state table (keyed on id)
-                result = supabase_upsert("device_state", state)
+                # Only what changed since the last acknowledged push (see StatePusher)
+                result = state_pusher.push(state)
                 log.info("Device state pushed to Supabase. Result: %s", result)
             except Exception:
                 log.error("Report thread error: %s", traceback.format_exc())
+            M_LOOP_SECONDS.observe(time.monotonic() - started, self.name)
             _stop_event.wait(REPORT_SEC)
 
 
+class HealthRefreshThread(threading.Thread):
+    """Keeps the /health snapshot warm so probes never wait on Termux:API."""
+    def __init__(self):
+        super().__init__(name="health-refresh", daemon=True)
+
+    def run(self):
+        log.info("Health refresh thread started (every %ds).", HEALTH_REFRESH_SEC)
+        while not _stop_event.is_set():
+            started = time.monotonic()
+            health_snapshot.refresh()
+            M_LOOP_SECONDS.observe(time.monotonic() - started, self.name)
+            _stop_event.wait(HEALTH_REFRESH_SEC)
+
+
+class HistoryThread(threading.Thread):
+    """Appends a history_sample() to metric_history and metric_store every
+    HISTORY_SAMPLE_SEC."""
+    def __init__(self):
+        super().__init__(name="history", daemon=True)
+
+    def run(self):
+        log.info("History thread started (every %gs, %d samples kept).",
+                 HISTORY_SAMPLE_SEC, metric_history.capacity)
+        cpu = collectors.cpu_times()
+        while not _stop_event.wait(HISTORY_SAMPLE_SEC):
+            started = time.monotonic()
+            try:
+                now_cpu, now = collectors.cpu_times(), time.time()
+                sample = history_sample(cpu, now_cpu)
+                cpu = now_cpu
+                metric_history.append(now, sample)
+                metric_store.add(now, sample)
+            except Exception:
+                log.error("History thread error: %s", traceback.format_exc())
+            M_LOOP_SECONDS.observe(time.monotonic() - started, self.name)
+        try:
+            metric_store.flush()
+        except Exception:
+            log.error("History flush on stop failed: %s", traceback.format_exc())
+
+
+class BackfillThread(threading.Thread):
+    """Every TSDB_UPLOAD_SEC applies metric_store's retention and backfills
+    Supabase from it."""
+    def __init__(self):
+        super().__init__(name="backfill", daemon=True)
+
+    def run(self):
+        log.info("Backfill thread started (every %ds, %s).", TSDB_UPLOAD_SEC, TSDB_PATH)
+        while not _stop_event.wait(TSDB_UPLOAD_SEC):
+            started = time.monotonic()
+            try:
+                pruned = metric_store.prune()
+                if pruned:
+                    log.info("Local store: %d rows past retention dropped.", pruned)
+                sent = backfill()
+                if any(sent.values()):
+                    log.info("Backfilled %s", ", ".join(f"{n} {s}" for s, n in sent.items() if n))
+            except Exception:
+                log.error("Backfill thread error: %s", traceback.format_exc())
+            M_LOOP_SECONDS.observe(time.monotonic() - started, self.name)
+
+
+class StateRefreshThread(threading.Thread):
+    """Runs the state_collector scheduler: each device-state field is refreshed
+    on its own TTL, so building a report only reads the cache."""
+    def __init__(self):
+        super().__init__(name="state-refresh", daemon=True)
+
+    def run(self):
+        log.info("State refresh thread started (%d fields).", len(state_collector.fns))
+        state_collector.serve(_stop_event)
+
+
+class SharedSyncThread(threading.Thread):
+    """Pre-fork only: publishes this worker's metrics to shared memory and, in
+    workers other than the leader, adopts the leader's /health snapshot."""
+    def __init__(self, leader: bool):
+        super().__init__(name="shared-sync", daemon=True)
+        self._leader = leader
+
+    def run(self):
+        while not _stop_event.is_set():
+            try:
+                METRICS.publish_shared()
+                if not self._leader and health_snapshot.adopt_shared():
+                    events.publish("health", health_snapshot.get()[0])
+            except Exception:
+                log.error("Shared sync error: %s", traceback.format_exc())
+            _stop_event.wait(SHARE_SYNC_SEC)
+
+
 class WatchdogThread(threading.Thread):
     """Monitors tunnel health and restarts components if needed."""
     def __init__(self):
@@ -372,6 +2283,13 @@ class WatchdogThread(threading.Thread):
 
     def _check_local(self) -> bool:
         try:
+            if BRIDGE_SOCKET and os.path.exists(BRIDGE_SOCKET):
+                conn = collectors.UnixHTTPConnection(BRIDGE_SOCKET, timeout=5)
+                try:
+                    conn.request("GET", "/health")
+                    return conn.getresponse().status == 200
+                finally:
+                    conn.close()
             req = Request(f"http://localhost:{PORT}/health")
             with urlopen(req, timeout=5) as resp:
                 return resp.status == 200
@@ -382,6 +2300,7 @@ class WatchdogThread(threading.Thread):
         log.info("Watchdog thread started (every %ds).", WATCHDOG_SEC)
         _stop_event.wait(30)  # let everything start first
         while not _stop_event.is_set():
+            started = time.monotonic()
             try:
                 tunnel_ok = self._check_tunnel()
                 local_ok  = self._check_local()
@@ -409,8 +2328,11 @@ class WatchdogThread(threading.Thread):
                 else:
                     log.debug("Watchdog: All checks passed.")
 
+                spills.prune()  # expired /exec output spill files
+
             except Exception:
                 log.error("Watchdog thread error: %s", traceback.format_exc())
+            M_LOOP_SECONDS.observe(time.monotonic() - started, self.name)
             _stop_event.wait(WATCHDOG_SEC)
 
 
@@ -419,6 +2341,9 @@ class WatchdogThread(threading.Thread):
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
 def _check_auth(handler, body: dict = None) -> bool:
     """Check auth token from multiple sources. Returns True if valid."""
+    # 0. BRIDGE_SOCKET: only this user can connect, so no token is needed
+    if handler.client_address[0] == LOCAL_PEER:
+        return True
     # 1. Authorization header
     auth_header = handler.headers.get("Authorization", "")
     if auth_header == AUTH_TOKEN:
@@ -441,329 +2366,2922 @@ def _check_auth(handler, body: dict = None) -> bool:
 
 
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-# HTTP HANDLER
+# ADMISSION CONTROL (rate limits + priority lanes)
 # ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-class BridgeHandler(BaseHTTPRequestHandler):
-    server_version = f"TCC-Bridge/{VERSION}"
-    protocol_version = "HTTP/1.1"
-
-    # ââ Logging ââ
-    def log_message(self, fmt, *args):
-        log.info("%s â %s", self.client_address[0], fmt % args)
+# Every request is sorted into a lane by path before dispatch:
+#   0  /health, /metrics        never limited, never queued
+#   1  device actions           rate-limited, share the admission slots
+#   2  /exec, /listen, ...      rate-limited, capped at ADMIT_HEAVY slots
+# Refusals carry Retry-After: 429 for a rate limit, 503 when no slot frees up.
+LANE_PRIORITY, LANE_DEVICE, LANE_HEAVY = 0, 1, 2
+_PRIORITY_ROUTES = frozenset({"/health", "/metrics"})
+_HEAVY_ROUTES    = frozenset({"/exec", "/listen", "/batch", "/push_state", "/state-push",
+                              "/write_file"})
 
-    def log_error(self, fmt, *args):
-        log.warning("%s â %s", self.client_address[0], fmt % args)
 
-    # ââ Response helpers ââ
-    def _send_json(self, code: int, obj: dict):
-        body = json.dumps(obj, default=str).encode("utf-8")
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("X-Bridge-Version", VERSION)
-        self.end_headers()
-        try:
-            self.wfile.write(body)
-        except BrokenPipeError:
-            pass
+def request_lane(path: str) -> int:
+    if path in _PRIORITY_ROUTES:
+        return LANE_PRIORITY
+    if path in _HEAVY_ROUTES:
+        return LANE_HEAVY
+    return LANE_DEVICE
 
-    def _send_ok(self, extra: dict = None):
-        data = {"ok": True}
-        if extra:
-            data.update(extra)
-        self._send_json(200, data)
 
-    def _send_error_json(self, code: int, message: str):
-        self._send_json(code, {"ok": False, "error": message, "code": code})
+def request_weight(path: str) -> int:
+    """Admission slots a request holds: a /batch one per item it runs at once."""
+    return BATCH_SLOTS if path == "/batch" else 1
 
-    # ââ Body reader ââ
-    def _read_body(self) -> dict:
-        try:
-            length = int(self.headers.get("Content-Length", 0))
-            if length > 0:
-                raw = self.rfile.read(length).decode("utf-8")
-                try:
-                    return json.loads(raw)
-                except json.JSONDecodeError:
-                    return {"_raw": raw}
-        except Exception as exc:
-            log.debug("Body read error: %s", exc)
-        return {}
 
-    # ââ Path + query helpers ââ
-    def _path(self) -> str:
-        return urlparse(self.path).path
+def client_ip(req) -> str:
+    """The caller's address; behind cloudflared (a loopback peer) that is the
+    CF-Connecting-IP header rather than 127.0.0.1."""
+    peer = req.client_address[0]
+    if peer in ("127.0.0.1", "::1", ORIGIN_PEER):
+        return req.headers.get("CF-Connecting-IP", peer)
+    return peer
 
-    def _query(self) -> dict:
-        return parse_qs(urlparse(self.path).query)
 
-    def _qget(self, key: str, default=None):
-        return self._query().get(key, [default])[0]
+def presented_token(req) -> str:
+    """The credential a request carries in its headers or query (valid or not)."""
+    token = req.headers.get("Authorization", "") or req.headers.get("X-Auth", "")
+    if token.startswith("Bearer "):
+        token = token[len("Bearer "):]
+    return token or parse_qs(urlparse(req.path).query).get("auth", [""])[0]
 
-    # ââââââââââââââââââââââââââââââââââââââââââââ
-    # GET HANDLER
-    # ââââââââââââââââââââââââââââââââââââââââââââ
-    def do_GET(self):
-        path = self._path()
 
-        # ââ Public: /health ââ
-        if path == "/health":
-            uptime = int(time.time() - START_TIME)
-            bat    = get_battery()
-            self._send_json(200, {
-                "status":    "online",
-                "version":   VERSION,
-                "device_id": DEVICE_ID,
-                "uptime":    uptime,
-                "battery":   bat,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-            })
-            return
+class RateLimiter:
+    """Token buckets keyed by client: `rate` tokens/s up to `burst`. Only the
+    `max_keys` most recently seen clients are remembered."""
 
-        # ââ All other routes require auth ââ
-        if not _check_auth(self):
-            self._send_error_json(401, "Unauthorized â provide valid auth token.")
-            return
+    def __init__(self, rate: float, burst: int, max_keys: int = 4096):
+        self.rate, self.burst, self.max_keys = rate, burst, max_keys
+        self._lock    = threading.Lock()
+        self._buckets = {}  # key -> (tokens, stamp), oldest first
 
-        if path == "/status":
-            uptime = int(time.time() - START_TIME)
-            self._send_json(200, {
-                "status":    "online",
-                "version":   VERSION,
-                "device_id": DEVICE_ID,
-                "uptime":    uptime,
-                "battery":   get_battery(),
-                "storage":   get_storage(),
-                "network":   get_network_info(),
-                "port":      PORT,
-                "public_url": PUBLIC_URL,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-            })
-
-        elif path == "/exec":
-            cmd = self._qget("cmd")
-            if not cmd:
-                self._send_error_json(400, "Missing required query param: cmd")
-                return
-            log.info("EXEC (GET): %s", cmd)
-            result = _run_full(cmd)
-            self._send_json(200, {
-                "ok":         result["returncode"] == 0,
-                "stdout":     result["stdout"],
-                "stderr":     result["stderr"],
-                "returncode": result["returncode"],
-                "cmd":        cmd
-            })
-
-        elif path == "/toast":
-            msg = self._qget("msg", "Hello from TCC Bridge")
-            _run(f'termux-toast {json.dumps(msg)}')
-            self._send_ok({"message": "Toast sent", "msg": msg})
-
-        elif path == "/vibrate":
-            try:
-                duration = max(10, min(int(self._qget("duration", "500")), 5000))
-            except (ValueError, TypeError):
-                duration = 500
-            _run(f"termux-vibrate -d {duration}")
-            self._send_ok({"message": "Vibrated", "duration": duration})
-
-        elif path == "/speak":
-            msg  = self._qget("msg", "Hello")
-            lang = self._qget("lang", "en")
-            _run(f"termux-tts-speak -l {lang} {json.dumps(msg)}")
-            self._send_ok({"message": "Speaking", "text": msg})
+    def take(self, key: str) -> float:
+        """Spend one token; returns 0 if allowed, else seconds until one is due."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                del self._buckets[next(iter(self._buckets))]
+        return wait
 
-        else:
-            self._send_error_json(404, f"Endpoint not found: {path}")
 
-    # ââââââââââââââââââââââââââââââââââââââââââââ
-    # POST HANDLER
-    # ââââââââââââââââââââââââââââââââââââââââââââ
-    def do_POST(self):
-        path = self._path()
-        body = self._read_body()
-
-        # ââ Public: /health (POST) ââ
-        if path == "/health":
-            uptime = int(time.time() - START_TIME)
-            self._send_json(200, {
-                "status":    "online",
-                "version":   VERSION,
-                "uptime":    uptime,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-            })
-            return
+ip_limiter    = RateLimiter(RATE_IP_PER_SEC, RATE_IP_BURST)
+token_limiter = RateLimiter(RATE_TOKEN_PER_SEC, RATE_TOKEN_BURST)
 
-        # ââ Auth required for all POST routes ââ
-        if not _check_auth(self, body):
-            self._send_error_json(401, "Unauthorized â provide valid auth token.")
-            return
 
-        if path == "/exec":
-            # Support both 'cmd' (v7) and 'command' (v2 legacy)
-            cmd = body.get("cmd") or body.get("command", "")
-            if not cmd:
-                self._send_error_json(400, "Missing required field: 'cmd'")
-                return
-            timeout = int(body.get("timeout", 30))
-            log.info("EXEC (POST): %s", cmd)
-            result = _run_full(cmd, timeout=timeout)
-            self._send_json(200, {
-                "ok":         result["returncode"] == 0,
-                "stdout":     result["stdout"],
-                "stderr":     result["stderr"],
-                "returncode": result["returncode"],
-                "cmd":        cmd
-            })
-
-        elif path == "/toast":
-            msg = body.get("msg") or body.get("message", "")
-            if not msg:
-                self._send_error_json(400, "Missing required field: 'msg'")
-                return
-            _run(f'termux-toast {json.dumps(msg)}')
-            self._send_ok({"message": "Toast sent", "msg": msg})
-
-        elif path == "/vibrate":
-            try:
-                duration = max(10, min(int(body.get("duration", 500)), 5000))
-            except (ValueError, TypeError):
-                duration = 500
-            _run(f"termux-vibrate -d {duration}")
-            self._send_ok({"message": "Vibrated", "duration": duration})
-
-        elif path == "/speak":
-            text = body.get("text") or body.get("msg", "")
-            lang = body.get("lang", "en")
-            if not text:
-                self._send_error_json(400, "Missing required field: 'text'")
-                return
-            _run(f"termux-tts-speak -l {lang} {json.dumps(text)}")
-            self._send_ok({"message": "Speaking", "text": text})
+def rate_limit(req, lane: int):
+    """None if the request may proceed, else (429, json_obj, retry_after_s)."""
+    if lane == LANE_PRIORITY or req.client_address[0] == LOCAL_PEER:
+        return None
+    for limiter, key, reason in ((ip_limiter, client_ip(req), "ip"),
+                                 (token_limiter, presented_token(req), "token")):
+        if not key:
+            continue
+        wait = limiter.take(key)
+        if wait:
+            M_SHED.inc(str(lane), f"rate_{reason}")
+            return _err(429, f"Rate limit exceeded ({reason}); retry in {wait:.1f}s") + (math.ceil(wait),)
+    return None
 
-        elif path == "/listen":
-            lang    = body.get("lang", "en-US")
-            timeout = int(body.get("timeout", 5))
-            raw = _run(f"termux-speech-to-text -l {lang}", timeout=timeout + 10)
-            try:
-                parsed = json.loads(raw)
-            except Exception:
-                parsed = {"transcript": raw}
-            self._send_json(200, parsed)
-
-        elif path == "/notify":
-            msg      = body.get("msg") or body.get("message", "")
-            title    = body.get("title", "TCC Bridge v7")
-            priority = body.get("priority", "default")
-            tags     = body.get("tags", [])
-            if not msg:
-                self._send_error_json(400, "Missing required field: 'msg'")
-                return
-            result = ntfy_push(msg, title=title, priority=priority, tags=tags)
-            self._send_json(200, result)
 
-        elif path in ("/push_state", "/state-push"):
-            # Trigger an immediate Supabase state push
-            try:
-                state  = build_full_state()
-                result = supabase_upsert("device_state", state)
-                log.info("Manual push_state triggered. Result: %s", result)
-                self._send_json(200, {"ok": True, "state": state, "supabase": result})
-            except Exception as exc:
-                log.error("push_state error: %s", traceback.format_exc())
-                self._send_error_json(500, f"push_state failed: {exc}")
+class Admission:
+    """Concurrency slots for lanes 1 and 2, handed out by lane then arrival.
 
-        else:
-            self._send_error_json(404, f"Endpoint not found: {path}")
+    enter() (threads) and aenter() (asyncio) return None once the request
+    holds a slot, or a (503, json_obj, retry_after_s) refusal when the wait
+    queue is full or no slot frees up within `max_wait`. A request may take
+    `weight` slots at once; every admitted request must call leave() with the
+    same lane and weight. Lane 0 always gets in.
+    """
 
-    # ââââââââââââââââââââââââââââââââââââââââââââ
-    # OPTIONS (CORS pre-flight)
-    # ââââââââââââââââââââââââââââââââââââââââââââ
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header("Allow", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Headers",
-                         "Authorization, Content-Type, X-Auth")
-        self.send_header("Content-Length", "0")
-        self.end_headers()
+    def __init__(self, slots: int, heavy: int, queue_max: int, max_wait: float):
+        self.slots, self.heavy = slots, heavy
+        self.queue_max, self.max_wait = queue_max, max_wait
+        self._lock    = threading.Lock()
+        self._running = [0, 0, 0]
+        self._waiting = []  # (lane, seq, weight, wake)
+        self._seq     = 0
 
+    def _fits(self, lane: int, weight: int) -> bool:
+        if self._running[LANE_DEVICE] + self._running[LANE_HEAVY] + weight > self.slots:
+            return False
+        return lane != LANE_HEAVY or self._running[LANE_HEAVY] + weight <= self.heavy
 
-# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-# SIGNAL HANDLING
-# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-def _handle_signal(sig, frame):
-    log.info("Signal %s received â initiating graceful shutdown.", sig)
-    _stop_event.set()
+    def _try(self, lane: int, weight: int, wake) -> str:
+        with self._lock:
+            if lane == LANE_PRIORITY or (
+                    self._fits(lane, weight) and not any(w[0] <= lane for w in self._waiting)):
+                self._running[lane] += weight
+                return "run"
+            if len(self._waiting) >= self.queue_max:
+                return "full"
+            self._seq += 1
+            self._waiting.append((lane, self._seq, weight, wake))
+            return "wait"
 
+    def _cancel(self, wake) -> bool:
+        """Withdraw a waiter; False if it was granted a slot in the meantime."""
+        with self._lock:
+            for entry in self._waiting:
+                if entry[3] is wake:
+                    self._waiting.remove(entry)
+                    return True
+            return False
 
-# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-# SERVER BOOTSTRAP
-# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
-def run_server():
-    # Register signal handlers
-    signal.signal(signal.SIGTERM, _handle_signal)
-    signal.signal(signal.SIGINT,  _handle_signal)
+    def _refuse(self, lane: int, reason: str):
+        M_SHED.inc(str(lane), reason)
+        return _err(503, "Bridge busy, retry shortly.") + (1,)
 
-    # Start background threads
-    threads = [
-        HeartbeatThread(),
-        ReportThread(),
-        WatchdogThread(),
-    ]
-    for t in threads:
-        t.start()
-        log.info("Started thread: %s", t.name)
+    def enter(self, lane: int, weight: int = 1):
+        event = threading.Event()
+        wake = event.set
+        state = self._try(lane, weight, wake)
+        if state == "run":
+            return None
+        if state == "wait":
+            if event.wait(self.max_wait) or not self._cancel(wake):
+                return None
+            return self._refuse(lane, "wait_timeout")
+        return self._refuse(lane, "queue_full")
 
-    # Send startup notification
-    try:
-        ntfy_push(
-            f"\U0001F680 TCC Bridge v{VERSION} started on {DEVICE_ID} | Port: {PORT}",
-            title="Bridge Online",
-            priority="high",
-            tags=["rocket", "shield"]
-        )
-    except Exception:
-        log.warning("Startup ntfy failed (non-fatal).")
+    async def aenter(self, lane: int, weight: int = 1):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
 
-    # Push initial state
-    try:
-        state = build_device_state()
-        supabase_upsert("device_state", state)
-        log.info("Initial state pushed to Supabase.")
-    except Exception:
-        log.warning("Initial Supabase push failed (non-fatal).")
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
 
-    # Bind with retry
-    server = None
-    for attempt in range(10):
+        state = self._try(lane, weight, wake)
+        if state == "run":
+            return None
+        if state == "full":
+            return self._refuse(lane, "queue_full")
         try:
-            server = HTTPServer(("0.0.0.0", PORT), BridgeHandler)
-            server.socket.setsockopt(
-                __import__('socket').SOL_SOCKET,
-                __import__('socket').SO_REUSEADDR, 1
-            )
-            log.info("TCC Bridge v%s listening on 0.0.0.0:%d", VERSION, PORT)
-            break
-        except OSError as exc:
-            wait = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
-            log.error("Server bind error (attempt %d/10): %s. Retrying in %ds.",
-                      attempt + 1, exc, wait)
-            time.sleep(wait)
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait)
+            return None
+        except asyncio.TimeoutError:
+            if not self._cancel(wake):
+                return None
+            return self._refuse(lane, "wait_timeout")
+        except asyncio.CancelledError:
+            if not self._cancel(wake):
+                self.leave(lane, weight)
+            raise
 
-    if server is None:
-        log.critical("Failed to bind server after 10 attempts. Exiting.")
-        sys.exit(1)
+    def leave(self, lane: int, weight: int = 1):
+        woken = []
+        with self._lock:
+            self._running[lane] -= weight
+            for entry in sorted(self._waiting):
+                if self._fits(entry[0], entry[2]):
+                    self._waiting.remove(entry)
+                    self._running[entry[0]] += entry[2]
+                    woken.append(entry[3])
+        for wake in woken:
+            wake()
 
-    try:
-        server.serve_forever()
-    except Exception:
+    def inflight(self) -> int:
+        """Requests holding or waiting for a slot, any lane."""
+        with self._lock:
+            return sum(self._running) + len(self._waiting)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": sum(self._running[1:]),
+                "heavy":   self._running[LANE_HEAVY],
+                "waiting": len(self._waiting),
+                "slots":   self.slots,
+            }
+
+
+admission = Admission(ADMIT_SLOTS, ADMIT_HEAVY, ADMIT_QUEUE, ADMIT_WAIT)
+
+
+def check_worker_budget():
+    """Pool engine: warn if admitted and waiting requests plus /ws channels can
+    hold every worker, which would leave lane 0 queueing behind them."""
+    pinned = ADMIT_SLOTS + ADMIT_QUEUE + WS_MAX_CONNECTIONS
+    if ENGINE == "pool" and pinned + ADMIT_RESERVE > POOL_WORKERS:
+        log.warning("Admission overbooks the worker pool: ADMIT_SLOTS %d + ADMIT_QUEUE %d "
+                    "+ WS_MAX_CONNECTIONS %d + ADMIT_RESERVE %d > BRIDGE_WORKERS %d; "
+                    "/health and /metrics may queue.", ADMIT_SLOTS, ADMIT_QUEUE,
+                    WS_MAX_CONNECTIONS, ADMIT_RESERVE, POOL_WORKERS)
+METRICS.gauge_fn("tcc_bridge_admission_running", "Requests holding an admission slot.",
+                 lambda: admission.stats()["running"])
+METRICS.gauge_fn("tcc_bridge_admission_waiting", "Requests waiting for an admission slot.",
+                 lambda: admission.stats()["waiting"])
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# ROUTES (shared by every serving engine)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# Route logic is written as generators so the threaded handler and the asyncio
+# engine run exactly the same code. Whenever a route needs blocking work it
+# yields an effect tuple and gets the result sent back:
+#   ("run", cmd, timeout)       -> _run()        stdout string
+#   ("run_full", cmd, timeout[, session])
+#                               -> _run_full()   result dict
+#   ("call", fn, *args)         -> fn(*args)     any other blocking helper
+#   ("gather", [routes])        -> [(code, obj) or exception, ...] run concurrently
+# A route finishes by returning (status_code, json_obj); json_obj may instead be
+# a RawResponse for non-JSON bodies such as /metrics.
+class RawResponse:
+    __slots__ = ("body", "content_type")
+
+    def __init__(self, body, content_type: str):
+        self.body         = body.encode("utf-8") if isinstance(body, str) else body
+        self.content_type = content_type
+
+
+def _encode_response(obj):
+    """Return (body_bytes, content_type) for whatever a route returned."""
+    if isinstance(obj, RawResponse):
+        return obj.body, obj.content_type
+    return json.dumps(obj, default=str).encode("utf-8"), "application/json; charset=utf-8"
+
+
+def _pick_encoding(accept: str) -> str:
+    """Choose gzip or deflate from an Accept-Encoding header; "" for identity."""
+    offered = {}
+    for part in (accept or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    best, best_q = "", 0.0
+    for coding in ("gzip", "deflate"):
+        q = offered.get(coding, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _compress(body: bytes, accept: str):
+    """Return (body, content_encoding) for a buffered response, compressing it
+    when it is big enough and the client accepts gzip or deflate."""
+    encoding = ""
+    if COMPRESS_MIN_BYTES and len(body) >= COMPRESS_MIN_BYTES:
+        encoding = _pick_encoding(accept)
+    if encoding == "gzip":
+        out = gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+    elif encoding == "deflate":
+        out = zlib.compress(body, COMPRESS_LEVEL)  # zlib-wrapped, per RFC 9110
+    else:
+        out = body
+    label = encoding or "identity"
+    M_BODY_RAW_BYTES.inc(label, amount=len(body))
+    M_BODY_SENT_BYTES.inc(label, amount=len(out))
+    return out, encoding
+
+
+class ExecStream:
+    """Route result asking the engine to stream a command's output as it runs.
+
+    Frames are Server-Sent Events (event: stdout|stderr|exit) when `sse` is set,
+    otherwise newline-delimited JSON over chunked transfer. With `binary`, the
+    body is stdout itself, undecoded (application/octet-stream); stderr and the
+    exit status come as trailers, and are also kept in the spill store under
+    the X-Exec-Id header for clients that can't read trailers.
+    """
+    __slots__ = ("cmd", "timeout", "sse", "binary", "exec_id",
+                 "_stderr", "_stderr_bytes", "_exit")
+
+    TRAILERS = ("X-Exit-Code", "X-Exec-Duration", "X-Exec-Error",
+                "X-Exec-Stderr", "X-Exec-Stderr-Bytes")
+
+    def __init__(self, cmd: str, timeout: int, sse: bool, binary: bool = False):
+        self.cmd, self.timeout, self.sse, self.binary = cmd, timeout, sse, binary
+        self.exec_id       = None
+        self._stderr       = bytearray()  # the head of it, for the trailer
+        self._stderr_bytes = 0
+        self._exit         = None
+
+    @property
+    def content_type(self) -> str:
+        if self.binary:
+            return "application/octet-stream"
+        return "text/event-stream; charset=utf-8" if self.sse else "application/x-ndjson; charset=utf-8"
+
+    def headers(self) -> dict:
+        """Extra response headers; call once, before the body."""
+        if not self.binary:
+            return {}
+        self.exec_id = spills.create()
+        return {"X-Exec-Id": self.exec_id, "Trailer": ", ".join(self.TRAILERS)}
+
+    def trailer(self) -> bytes:
+        """Trailer fields for the last chunk (binary mode), as wire bytes."""
+        if not self.binary or self._exit is None:
+            return b""
+        fields = {
+            "X-Exit-Code":         self._exit["returncode"],
+            "X-Exec-Duration":     self._exit["duration"],
+            "X-Exec-Error":        self._exit.get("error", ""),
+            "X-Exec-Stderr":       base64.b64encode(self._stderr).decode(),
+            "X-Exec-Stderr-Bytes": self._stderr_bytes,
+        }
+        return "".join(f"{k}: {v}\r\n" for k, v in fields.items() if v != "").encode("latin-1")
+
+    def frame(self, kind: str, data) -> bytes:
+        """Encode one ("exit", info) or (stream_name, [lines]) item as wire bytes."""
+        if self.binary:
+            return self._binary_frame(kind, data)
+        if kind == "exit":
+            info = dict(data, ok=data["returncode"] == 0, cmd=self.cmd)
+            if self.sse:
+                return f"event: exit\ndata: {json.dumps(info)}\n\n".encode("utf-8")
+            return (json.dumps(dict(info, event="exit")) + "\n").encode("utf-8")
+        out = []
+        for line in data:
+            text = line.decode("utf-8", errors="replace").rstrip("\r")
+            if self.sse:
+                out.append(f"event: {kind}\ndata: {text}\n\n")
+            else:
+                out.append(json.dumps({"stream": kind, "data": text}) + "\n")
+        return "".join(out).encode("utf-8")
+
+    def _binary_frame(self, kind: str, data) -> bytes:
+        if kind == "stdout":
+            return b"".join(data)
+        if kind == "stderr":
+            chunk = b"".join(data)
+            self._stderr_bytes += len(chunk)
+            self._stderr.extend(chunk[:EXEC_TRAILER_STDERR - len(self._stderr)])
+            spills.append(self.exec_id, "stderr", chunk)
+        else:
+            self._exit = data
+            spills.write_exit(self.exec_id, dict(data, cmd=self.cmd))
+        return b""
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# STREAMED REQUEST BODIES (octet-stream uploads)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# A POST with Content-Type: application/octet-stream is not read up front: its
+# parameters come from the query string, and the route returns a BodyUpload
+# that the engine then feeds the body to, UPLOAD_CHUNK bytes at a time as they
+# arrive (Content-Length or chunked). A multi-GB upload costs one chunk of
+# memory, and the command or file sees the first bytes before the last are sent.
+class UploadError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def _is_upload(req) -> bool:
+    ctype = req.headers.get("Content-Type", "")
+    return ctype.split(";", 1)[0].strip().lower() == "application/octet-stream"
+
+
+def _body_length(headers):
+    """Content-Length as an int, or None for a chunked body."""
+    if "chunked" in headers.get("Transfer-Encoding", "").lower():
+        return None
+    length = _content_length(headers)
+    if length is None:
+        raise UploadError(400, "Bad Content-Length")
+    if length > UPLOAD_MAX:
+        raise UploadError(413, f"Request body too large (> {UPLOAD_MAX} bytes)")
+    return length
+
+
+def _chunk_size(line: bytes, total: int) -> int:
+    try:
+        size = int(line.split(b";", 1)[0].strip(), 16)
+    except ValueError:
+        raise UploadError(400, "Bad chunk size line") from None
+    if total + size > UPLOAD_MAX:
+        raise UploadError(413, f"Request body too large (> {UPLOAD_MAX} bytes)")
+    return size
+
+
+def _body_chunks(rfile, headers):
+    """Yield the request body from a handler's rfile in pieces of at most
+    UPLOAD_CHUNK, de-chunking Transfer-Encoding: chunked. Raises UploadError."""
+    try:
+        length = _body_length(headers)
+        total  = 0
+        while True:
+            size = length
+            if length is None:
+                size = _chunk_size(rfile.readline(1024), total)
+                if size == 0:
+                    while rfile.readline(65537).strip():
+                        pass  # trailer fields
+                    return
+            total += size
+            while size > 0:
+                data = rfile.read(min(size, UPLOAD_CHUNK))
+                if not data:
+                    raise UploadError(400, "Request body ended early")
+                size -= len(data)
+                yield data
+            if length is not None:
+                return
+            rfile.readline(3)  # CRLF after the chunk data
+    except OSError as exc:
+        raise UploadError(400, f"Request body read failed: {exc}") from None
+
+
+async def _abody_chunks(reader, headers):
+    """Async twin of _body_chunks() over an asyncio StreamReader."""
+    try:
+        length = _body_length(headers)
+        total  = 0
+        while True:
+            size = length
+            if length is None:
+                line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                size = _chunk_size(line, total)
+                if size == 0:
+                    while (await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)).strip():
+                        pass  # trailer fields
+                    return
+            total += size
+            while size > 0:
+                data = await asyncio.wait_for(reader.read(min(size, UPLOAD_CHUNK)), IDLE_TIMEOUT)
+                if not data:
+                    raise UploadError(400, "Request body ended early")
+                size -= len(data)
+                yield data
+            if length is not None:
+                return
+            await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+    except (OSError, asyncio.TimeoutError, ValueError) as exc:
+        raise UploadError(400, f"Request body read failed: {exc}") from None
+
+
+def _write_path(path: str):
+    """`path` resolved for /write_file, or None if it leads outside the home directory."""
+    resolved = os.path.realpath(os.path.expanduser(path))
+    home = os.path.realpath(os.path.expanduser("~"))
+    return resolved if os.path.commonpath([resolved, home]) == home else None
+
+
+class BodyUpload:
+    """Route result asking the engine for the request body: run(chunks) on the
+    threaded engines, arun(chunks) on asyncio, each returning (code, obj).
+    `complete` tells the engine whether the body was read to the end, i.e.
+    whether the connection can be kept alive."""
+    complete = False
+
+
+class ExecUpload(BodyUpload):
+    """POST /exec with an octet-stream body: the body is the command's stdin,
+    written to the pipe as it arrives. Always a fresh shell, since a persistent
+    one reads its script from stdin. A command that stops reading (head -c, a
+    timeout) just stops getting writes; the rest of the body is drained so the
+    reply still goes out on a usable connection."""
+
+    def __init__(self, cmd: str, timeout: int):
+        self.cmd, self.timeout = cmd, timeout
+        self.stdin_bytes = 0
+        self.error       = None
+
+    def run(self, chunks) -> tuple:
+        def feed(pipe):
+            try:
+                for chunk in chunks:
+                    self.stdin_bytes += len(chunk)
+                    if pipe is not None:
+                        try:
+                            pipe.write(chunk)
+                        except (OSError, ValueError):
+                            pipe = None
+                self.complete = True
+            except UploadError as exc:
+                self.error = exc
+            finally:
+                if pipe is not None:
+                    try:
+                        pipe.close()
+                    except OSError:
+                        pass
+
+        return self._reply(_run_full(self.cmd, self.timeout, stdin=feed))
+
+    async def arun(self, chunks) -> tuple:
+        async def feed(pipe):
+            try:
+                async for chunk in chunks:
+                    self.stdin_bytes += len(chunk)
+                    if pipe is not None:
+                        try:
+                            pipe.write(chunk)
+                            await pipe.drain()
+                        except OSError:
+                            pipe = None
+                self.complete = True
+            except UploadError as exc:
+                self.error = exc
+            finally:
+                if pipe is not None:
+                    pipe.close()
+
+        return self._reply(await _arun_full(self.cmd, self.timeout, stdin=feed))
+
+    def _reply(self, result: dict) -> tuple:
+        if self.error is not None:
+            return _err(self.error.code, str(self.error))
+        return 200, dict(_exec_reply(self.cmd, result), stdin_bytes=self.stdin_bytes)
+
+
+class FileUpload(BodyUpload):
+    """POST /write_file with an octet-stream body, written to disk a chunk at a
+    time. Mode "w" writes a temp file beside `path` that replaces it only once
+    the whole body is in, so a cut-off upload never leaves a torn file; mode "a"
+    appends in place. A disk error stops the writes, not the reading."""
+
+    def __init__(self, path: str, mode: str):
+        self.path, self.mode = path, mode
+        self.written = 0
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.mode == "a":
+            return open(self.path, "ab"), None
+        tmp = f"{self.path}.{secrets.token_hex(4)}.part"
+        return open(tmp, "xb"), tmp
+
+    def _write(self, f, chunk: bytes, failure):
+        if failure is None:
+            try:
+                f.write(chunk)
+                self.written += len(chunk)
+            except OSError as exc:
+                return exc
+        return failure
+
+    def run(self, chunks) -> tuple:
+        try:
+            f, tmp = self._open()
+        except OSError as exc:
+            return _err(500, f"write_file failed: {exc}")
+        failure = None
+        try:
+            for chunk in chunks:
+                failure = self._write(f, chunk, failure)
+            self.complete = True
+        except UploadError as exc:
+            failure = exc
+        return self._finish(f, tmp, failure)
+
+    async def arun(self, chunks) -> tuple:
+        try:
+            f, tmp = self._open()
+        except OSError as exc:
+            return _err(500, f"write_file failed: {exc}")
+        failure = None
+        try:
+            async for chunk in chunks:
+                failure = self._write(f, chunk, failure)
+            self.complete = True
+        except UploadError as exc:
+            failure = exc
+        return self._finish(f, tmp, failure)
+
+    def _finish(self, f, tmp, failure) -> tuple:
+        try:
+            f.close()
+            if failure is None and tmp is not None:
+                os.replace(tmp, self.path)
+        except OSError as exc:
+            failure = exc
+        if failure is not None:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except FileNotFoundError:
+                    pass
+            log.error("/write_file %s failed: %s", self.path, failure)
+            return _err(getattr(failure, "code", 500), f"write_file failed: {failure}")
+        log.info("WRITE_FILE %s (%s): %d bytes", self.path, self.mode, self.written)
+        return 200, {"ok": True, "path": self.path, "bytes_written": self.written,
+                     "mode": self.mode}
+
+
+def _binary_mode(req, flag) -> bool:
+    """Binary /exec from ?binary=, a body flag or Accept: application/octet-stream."""
+    flag = flag or parse_qs(urlparse(req.path).query).get("binary", [None])[0]
+    return (str(flag).lower() in ("1", "true", "yes")
+            or "application/octet-stream" in req.headers.get("Accept", ""))
+
+
+def _stream_mode(req, flag) -> tuple:
+    """(stream?, sse?) from ?stream=, a body flag and the Accept header."""
+    flag = flag or parse_qs(urlparse(req.path).query).get("stream", [None])[0]
+    sse = "text/event-stream" in req.headers.get("Accept", "") or str(flag).lower() == "sse"
+    return sse or str(flag).lower() in ("1", "true", "yes"), sse
+
+
+def _ok(extra: dict = None):
+    data = {"ok": True}
+    if extra:
+        data.update(extra)
+    return 200, data
+
+
+def _exec_reply(cmd: str, result: dict) -> dict:
+    reply = {
+        "ok":         result["returncode"] == 0,
+        "stdout":     result["stdout"],
+        "stderr":     result["stderr"],
+        "returncode": result["returncode"],
+        "cmd":        cmd
+    }
+    if "output" in result:  # spilled: stdout/stderr above are only the head
+        reply["truncated"] = True
+        reply["output"]    = result["output"]
+    return reply
+
+
+def _err(code: int, message: str):
+    return code, {"ok": False, "error": message, "code": code}
+
+
+def _content_length(headers):
+    """Content-Length as an int (0 if absent), or None if it is not a
+    non-negative integer; both engines answer that with 400 and close."""
+    try:
+        length = int(headers.get("Content-Length", 0) or 0)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+def _parse_body(raw: bytes) -> dict:
+    """Decode a request body the way every route expects it."""
+    try:
+        text = raw.decode("utf-8")
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return {"_raw": text}
+    except Exception as exc:
+        log.debug("Body read error: %s", exc)
+    return {}
+
+
+def route_get(req, path: str, qget):
+    """GET routes. `req` exposes .headers/.path for _check_auth; `qget` reads the query."""
+    # ââ Public: /health (served from the cached snapshot, never blocks) ââ
+    if path == "/health":
+        uptime = int(time.time() - START_TIME)
+        snap, age = health_snapshot.get()
+        return 200, {
+            "status":    "online",
+            "version":   VERSION,
+            "device_id": DEVICE_ID,
+            "uptime":    uptime,
+            "battery":   snap.get("battery", {}),
+            "snapshot_age":   None if age is None else round(age, 3),
+            "snapshot_stale": age is None or age > HEALTH_MAX_AGE,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+
+    # ââ All other routes require auth ââ
+    if not _check_auth(req):
+        return _err(401, "Unauthorized â provide valid auth token.")
+
+    if path == "/metrics":
+        gauges = {
+            f"tcc_bridge_pool_{key}": (f"Serving engine {key} count.", value)
+            for key, value in getattr(req.server, "pool_stats", dict)().items()
+        }
+        _, age = health_snapshot.get()
+        gauges["tcc_bridge_health_snapshot_age_seconds"] = (
+            "Age of the cached /health snapshot.", None if age is None else round(age, 3))
+        return 200, RawResponse(METRICS.render(gauges), "text/plain; version=0.0.4; charset=utf-8")
+
+    if path == "/metrics/history":
+        metric = qget("metric")
+        if metric not in metric_history.series:
+            return _err(400, f"'metric' must be one of: {', '.join(metric_history.series)}")
+        try:
+            since = float(qget("since", 3600))
+            step  = float(qget("step") or 0)
+        except (TypeError, ValueError):
+            return _err(400, "since and step must be numbers")
+        if not (math.isfinite(since) and math.isfinite(step)):
+            return _err(400, "since and step must be finite numbers")
+        now = time.time()
+        if since < 1e9:  # seconds back from now rather than an epoch time
+            since = now - since
+        span = max(0.0, now - since)
+        # Unset: about 200 buckets; never finer than the sampling or the point cap
+        step = round(max(step or span / 200, HISTORY_SAMPLE_SEC, span / HISTORY_MAX_POINTS), 3)
+        found = yield ("call", metric_history.query, metric, since, step)
+        return 200, {"ok": True, "metric": metric, "since": round(since, 3),
+                     "step": step, **found}
+
+    if path == "/jobs":
+        return 200, {"ok": True, "jobs": (yield ("call", jobs.list))}
+
+    if path.startswith("/exec/output/"):
+        out_id = path[len("/exec/output/"):]
+        stream = qget("stream", "stdout")
+        if stream not in ("stdout", "stderr"):
+            return _err(400, "'stream' must be stdout or stderr")
+        try:
+            offset = max(0, int(qget("offset", 0)))
+            length = max(0, min(int(qget("length", EXEC_READ_MAX)), EXEC_READ_MAX))
+        except (TypeError, ValueError):
+            return _err(400, "offset and length must be integers")
+        found     = yield ("call", spills.read, out_id, stream, offset, length)
+        exit_info = yield ("call", spills.exit_info, out_id)  # binary /exec only
+        if found is None and exit_info is None:
+            return _err(404, f"No spilled {stream} for {out_id} (expired, or it fit in the reply)")
+        data, size = found or (b"", 0)
+        reply = {
+            "ok":          True,
+            "id":          out_id,
+            "stream":      stream,
+            "offset":      offset,
+            "next_offset": offset + len(data),
+            "size":        size,
+            "eof":         offset + len(data) >= size,
+            "data":        data.decode("utf-8", errors="replace"),
+        }
+        if exit_info is not None:
+            reply["exit"] = exit_info
+        return 200, reply
+
+    if path.startswith("/jobs/"):
+        job = yield ("call", jobs.get, path[len("/jobs/"):])
+        if job is None:
+            return _err(404, f"No such job: {path[len('/jobs/'):]}")
+        try:
+            limit = max(0, min(int(qget("limit", JOB_READ_MAX)), JOB_READ_MAX))
+            offsets = {name: max(0, int(qget(f"{name}_offset", 0))) for name in ("stdout", "stderr")}
+        except (TypeError, ValueError):
+            return _err(400, "Offsets and limit must be integers")
+        out = dict(job.meta(), ok=True)
+        for name, offset in offsets.items():
+            data, nxt = yield ("call", jobs.read, job, name, offset, limit)
+            out[name] = data.decode("utf-8", errors="replace")
+            out[f"{name}_offset"] = nxt
+        return 200, out
+
+    if path == "/status":
+        uptime = int(time.time() - START_TIME)
+        return 200, {
+            "status":    "online",
+            "version":   VERSION,
+            "device_id": DEVICE_ID,
+            "uptime":    uptime,
+            **(yield ("call", collect_state)),
+            "collection": state_collector.last,
+            "backfill":  (yield ("call", metric_store.backlog)),
+            "port":      PORT,
+            "public_url": PUBLIC_URL,
+            "engine":    ENGINE,
+            "worker":    {"index": _worker_index, "pid": os.getpid(), "procs": BRIDGE_PROCS},
+            "pool":      getattr(req.server, "pool_stats", dict)(),
+            "admission": admission.stats(),
+            "shells":    shells.stats(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+
+    elif path == "/exec":
+        cmd = qget("cmd")
+        if not cmd:
+            return _err(400, "Missing required query param: cmd")
+        session = qget("session")
+        if _binary_mode(req, qget("binary")):
+            log.info("EXEC (GET, binary): %s", cmd)
+            return 200, ExecStream(cmd, 30, False, binary=True)
+        stream, sse = _stream_mode(req, qget("stream"))
+        if stream and session is None:
+            log.info("EXEC (GET, stream): %s", cmd)
+            return 200, ExecStream(cmd, 30, sse)
+        log.info("EXEC (GET%s): %s", f", session={session}" if session else "", cmd)
+        result = yield ("run_full", cmd, 30, session)
+        return 200, _exec_reply(cmd, result)
+
+    elif path == "/toast":
+        msg = qget("msg", "Hello from TCC Bridge")
+        yield ("run", f'termux-toast {json.dumps(msg)}', 15)
+        return _ok({"message": "Toast sent", "msg": msg})
+
+    elif path == "/vibrate":
+        try:
+            duration = max(10, min(int(qget("duration", "500")), 5000))
+        except (ValueError, TypeError):
+            duration = 500
+        yield ("run", f"termux-vibrate -d {duration}", 15)
+        return _ok({"message": "Vibrated", "duration": duration})
+
+    elif path == "/speak":
+        msg  = qget("msg", "Hello")
+        lang = qget("lang", "en")
+        yield ("run", f"termux-tts-speak -l {lang} {json.dumps(msg)}", 15)
+        return _ok({"message": "Speaking", "text": msg})
+
+    return _err(404, f"Endpoint not found: {path}")
+
+
+def route_post(req, path: str, body: dict):
+    """POST routes. `body` is the decoded JSON body (see _parse_body)."""
+    # ââ Public: /health (POST) ââ
+    if path == "/health":
+        uptime = int(time.time() - START_TIME)
+        return 200, {
+            "status":    "online",
+            "version":   VERSION,
+            "uptime":    uptime,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+
+    # ââ Auth required for all POST routes ââ
+    if not _check_auth(req, body):
+        return _err(401, "Unauthorized â provide valid auth token.")
+
+    if path == "/admin/reload":
+        return (yield ("call", request_reload))
+
+    if path == "/batch":
+        return (yield from route_batch(req, body))
+    return (yield from post_action(req, path, body))
+
+
+def post_action(req, path: str, body: dict, streaming: bool = True):
+    """The authenticated POST actions. Shared by do_POST, /batch and /ws, which
+    have already checked auth; `streaming=False` forces buffered /exec."""
+    if path == "/exec":
+        # Support both 'cmd' (v7) and 'command' (v2 legacy)
+        cmd = body.get("cmd") or body.get("command", "")
+        if not cmd:
+            return _err(400, "Missing required field: 'cmd'")
+        timeout = int(body.get("timeout", 30))
+        session = body.get("session")
+        if session is not None and not isinstance(session, str):
+            return _err(400, "'session' must be a string")
+        if streaming and _is_upload(req):
+            if session is not None:
+                return _err(400, "A streamed stdin body can't run in a session")
+            log.info("EXEC (POST, stdin upload): %s", cmd)
+            return 200, ExecUpload(cmd, timeout)
+        if streaming and session is None and _binary_mode(req, body.get("binary")):
+            log.info("EXEC (POST, binary): %s", cmd)
+            return 200, ExecStream(cmd, timeout, False, binary=True)
+        stream, sse = _stream_mode(req, body.get("stream")) if streaming else (False, False)
+        if stream and session is None:
+            log.info("EXEC (POST, stream): %s", cmd)
+            return 200, ExecStream(cmd, timeout, sse)
+        log.info("EXEC (POST%s): %s", f", session={session}" if session else "", cmd)
+        result = yield ("run_full", cmd, timeout, session)
+        return 200, _exec_reply(cmd, result)
+
+    elif path == "/jobs":
+        cmd = body.get("cmd") or body.get("command", "")
+        if not cmd:
+            return _err(400, "Missing required field: 'cmd'")
+        try:
+            job = yield ("call", jobs.start, cmd, int(body.get("timeout", JOB_TIMEOUT)))
+        except JobLimitReached as exc:
+            return _err(429, f"Job limit reached: {exc}")
+        return 202, {"ok": True, "job": job.meta(), "poll": f"/jobs/{job.id}"}
+
+    elif path == "/write_file":
+        target = str(body.get("path", "")).strip()
+        if not target:
+            return _err(400, "Missing required field: 'path'")
+        resolved = _write_path(target)
+        if resolved is None:
+            log.warning("/write_file outside home refused: %s", target)
+            return _err(403, "Path must be within the home directory")
+        mode = body.get("mode", "w")
+        if mode not in ("w", "a"):
+            return _err(400, "'mode' must be 'w' or 'a'")
+        if streaming and _is_upload(req):
+            return 200, FileUpload(resolved, mode)
+        content = body.get("content", "")
+        if not isinstance(content, str):
+            return _err(400, "'content' must be a string")
+        return (yield ("call", FileUpload(resolved, mode).run, [content.encode("utf-8")]))
+
+    elif path == "/toast":
+        msg = body.get("msg") or body.get("message", "")
+        if not msg:
+            return _err(400, "Missing required field: 'msg'")
+        yield ("run", f'termux-toast {json.dumps(msg)}', 15)
+        return _ok({"message": "Toast sent", "msg": msg})
+
+    elif path == "/vibrate":
+        try:
+            duration = max(10, min(int(body.get("duration", 500)), 5000))
+        except (ValueError, TypeError):
+            duration = 500
+        yield ("run", f"termux-vibrate -d {duration}", 15)
+        return _ok({"message": "Vibrated", "duration": duration})
+
+    elif path == "/speak":
+        text = body.get("text") or body.get("msg", "")
+        lang = body.get("lang", "en")
+        if not text:
+            return _err(400, "Missing required field: 'text'")
+        yield ("run", f"termux-tts-speak -l {lang} {json.dumps(text)}", 15)
+        return _ok({"message": "Speaking", "text": text})
+
+    elif path == "/listen":
+        lang    = body.get("lang", "en-US")
+        timeout = int(body.get("timeout", 5))
+        raw = yield ("run", f"termux-speech-to-text -l {lang}", timeout + 10)
+        try:
+            parsed = json.loads(raw)
+        except Exception:
+            parsed = {"transcript": raw}
+        return 200, parsed
+
+    elif path == "/notify":
+        msg      = body.get("msg") or body.get("message", "")
+        title    = body.get("title", "TCC Bridge v7")
+        priority = body.get("priority", "default")
+        tags     = body.get("tags", [])
+        if not msg:
+            return _err(400, "Missing required field: 'msg'")
+        result = yield ("call", ntfy_push, msg, title, priority, tags)
+        return 200, result
+
+    elif path in ("/push_state", "/state-push"):
+        # Trigger an immediate Supabase state push
+        try:
+            state  = yield ("call", build_full_state)
+            result = yield ("call", state_pusher.push, state, bool(body.get("full")))
+            log.info("Manual push_state triggered. Result: %s", result)
+            return 200, {"ok": True, "state": state, "supabase": result}
+        except Exception as exc:
+            log.error("push_state error: %s", traceback.format_exc())
+            return _err(500, f"push_state failed: {exc}")
+
+    return _err(404, f"Endpoint not found: {path}")
+
+
+# Threads behind the ("gather", ...) effect for the threaded engines
+_gather_pool = concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY,
+                                                     thread_name_prefix="batch")
+
+# Paths that get their own "route" label in metrics; anything else is "other"
+KNOWN_ROUTES = frozenset({
+    "/health", "/metrics", "/status", "/exec", "/toast", "/vibrate", "/speak",
+    "/listen", "/notify", "/push_state", "/state-push", "/jobs", "/batch", "/ws",
+    "/admin/reload", "/write_file", "/metrics/history",
+})
+
+
+def observe_request(method: str, path: str, code: int, started: float):
+    if path.startswith("/jobs/"):
+        route = "/jobs/:id"
+    elif path.startswith("/exec/output/"):
+        route = "/exec/output/:id"
+    else:
+        route = path if path in KNOWN_ROUTES else "other"
+    M_REQUESTS.inc(route, method, str(code))
+    M_REQUEST_SECONDS.observe(time.monotonic() - started, route, method)
+
+
+# Actions a /batch item may name; each maps onto the POST route of the same name
+BATCH_ACTIONS = ("exec", "toast", "vibrate", "speak", "notify", "push_state")
+
+
+def route_batch(req, body: dict):
+    """POST /batch: {"items": [{"action": "toast", "msg": "hi"}, ...]}
+
+    Items run concurrently, except that an item listing "after": [i, ...]
+    starts only once those earlier items are done, and "sequential": true runs
+    the whole list in order. Results come back in item order. At most
+    BATCH_SLOTS items run at once, the heavy slots the batch was admitted with.
+    """
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        return _err(400, "Missing required field: 'items' (non-empty list)")
+    if len(items) > BATCH_MAX_ITEMS:
+        return _err(400, f"Too many items ({len(items)} > {BATCH_MAX_ITEMS})")
+
+    # Group items into waves: each wave only depends on earlier waves
+    waves = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or item.get("action") not in BATCH_ACTIONS:
+            return _err(400, f"Item {i}: 'action' must be one of {', '.join(BATCH_ACTIONS)}")
+        after = item.get("after", [])
+        if not isinstance(after, list) or any(
+                not isinstance(j, int) or not 0 <= j < i for j in after):
+            return _err(400, f"Item {i}: 'after' must list indexes of earlier items")
+        if body.get("sequential"):
+            wave = i
+        else:
+            wave = max((waves[j] + 1 for j in after), default=0)
+        waves.append(wave)
+
+    log.info("BATCH: %d item(s) in %d wave(s)", len(items), max(waves) + 1)
+    results = [None] * len(items)
+    for wave in range(max(waves) + 1):
+        in_wave = [i for i, w in enumerate(waves) if w == wave]
+        for start in range(0, len(in_wave), BATCH_SLOTS):
+            idx = in_wave[start:start + BATCH_SLOTS]
+            routes = [post_action(req, "/" + items[i]["action"], items[i], streaming=False)
+                      for i in idx]
+            for i, outcome in zip(idx, (yield ("gather", routes))):
+                if isinstance(outcome, Exception):
+                    outcome = _err(500, f"{type(outcome).__name__}: {outcome}")
+                code, obj = outcome
+                results[i] = {
+                    "index":  i,
+                    "action": items[i]["action"],
+                    "code":   code,
+                    "ok":     code < 400 and (not isinstance(obj, dict) or obj.get("ok", True) is not False),
+                    "result": obj,
+                }
+    return 200, {"ok": all(r["ok"] for r in results), "results": results}
+
+
+def route_delete(req, path: str, qget):
+    """DELETE routes."""
+    if not _check_auth(req):
+        return _err(401, "Unauthorized â provide valid auth token.")
+    if path.startswith("/jobs/"):
+        job = yield ("call", jobs.cancel, path[len("/jobs/"):])
+        if job is None:
+            return _err(404, f"No such job: {path[len('/jobs/'):]}")
+        return 200, {"ok": True, "job": job.meta()}
+    return _err(404, f"Endpoint not found: {path}")
+
+
+def _perform(effect):
+    kind = effect[0]
+    if kind == "run":
+        return _run(effect[1], timeout=effect[2])
+    if kind == "run_full":
+        return _run_full(effect[1], effect[2], *effect[3:])
+    if kind == "call":
+        return effect[1](*effect[2:])
+    if kind == "gather":
+        futures = [_gather_pool.submit(drive, r) for r in effect[1]]
+        results = []
+        for f in futures:
+            try:
+                results.append(f.result())
+            except Exception as exc:
+                results.append(exc)
+        return results
+    raise ValueError(f"unknown effect: {kind}")
+
+
+def drive(route):
+    """Run a route generator to completion, performing its effects inline."""
+    try:
+        effect = next(route)
+        while True:
+            try:
+                value = _perform(effect)
+            except Exception as exc:
+                effect = route.throw(exc)
+            else:
+                effect = route.send(value)
+    except StopIteration as stop:
+        return stop.value
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# WEBSOCKET CHANNEL (/ws)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# One authenticated connection carries many requests. Client messages are
+# JSON text frames naming a POST action, with an id the reply echoes:
+#   -> {"id": 1, "action": "speak", "text": "hi"}
+#   <- {"id": 1, "code": 200, "ok": true, "result": {...}}
+# Requests run concurrently, so replies arrive in completion order. An exec
+# with "stream": true sends {"id", "event": "stdout"|"stderr", "lines"} frames
+# before its reply. {"action": "subscribe", "events": [...]} opts in to pushed
+# {"event": name, "data": {...}} frames (see WS_EVENTS). Each request is
+# rate-limited and admitted in the lane of the route it names, like the HTTP
+# request it stands for; a refusal is a 429/503 reply carrying retry_after.
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+# Actions a /ws request may name; each maps onto the POST route of the same name
+WS_ACTIONS = frozenset({"exec", "jobs", "toast", "vibrate", "speak", "listen",
+                        "notify", "push_state", "batch", "health"})
+
+
+class WebSocketError(Exception):
+    """Protocol violation; `code` is the close status to send back."""
+
+    def __init__(self, code: int, reason: str):
+        super().__init__(reason)
+        self.code = code
+
+
+def ws_handshake(req):
+    """Validate a /ws upgrade request. Returns (101, accept_key) to switch
+    protocols, or an (error_code, json_obj) pair to answer instead."""
+    if req.headers.get("Upgrade", "").lower() != "websocket":
+        return _err(426, "Upgrade to websocket required")
+    if not _check_auth(req):
+        return _err(401, "Unauthorized â provide valid auth token.")
+    if req.headers.get("Sec-WebSocket-Version") != "13":
+        return _err(426, "Unsupported Sec-WebSocket-Version (need 13)")
+    key = req.headers.get("Sec-WebSocket-Key", "").strip()
+    if not key:
+        return _err(400, "Missing Sec-WebSocket-Key")
+    if events.count() >= WS_MAX_CONNECTIONS:
+        return _err(503, "Too many WebSocket channels open")
+    return 101, base64.b64encode(hashlib.sha1(key.encode() + _WS_GUID).digest()).decode()
+
+
+def ws_frame(opcode: int, payload: bytes = b"") -> bytes:
+    """Encode one unfragmented, unmasked (server-to-client) frame."""
+    n = len(payload)
+    if n < 126:
+        head = bytes((0x80 | opcode, n))
+    elif n < 65536:
+        head = bytes((0x80 | opcode, 126)) + n.to_bytes(2, "big")
+    else:
+        head = bytes((0x80 | opcode, 127)) + n.to_bytes(8, "big")
+    return head + payload
+
+
+def ws_close_frame(code: int = 1000, reason: str = "") -> bytes:
+    return ws_frame(WS_CLOSE, code.to_bytes(2, "big") + reason.encode("utf-8")[:120])
+
+
+def ws_json(obj) -> bytes:
+    return ws_frame(WS_TEXT, json.dumps(obj, default=str).encode("utf-8"))
+
+
+class WSParser:
+    """Incremental decoder for client-to-server frames. feed() takes raw socket
+    bytes and returns the complete (opcode, payload) messages they finish,
+    with fragmented data messages reassembled."""
+
+    def __init__(self, max_message: int):
+        self.max_message = max_message
+        self._buf    = bytearray()
+        self._opcode = None
+        self._parts  = []
+        self._size   = 0
+
+    def feed(self, data: bytes) -> list:
+        self._buf += data
+        out = []
+        while len(self._buf) >= 2:
+            b0, b1 = self._buf[0], self._buf[1]
+            fin, opcode, n, pos = b0 & 0x80, b0 & 0x0F, b1 & 0x7F, 2
+            if not b1 & 0x80:
+                raise WebSocketError(1002, "Client frames must be masked")
+            if n == 126:
+                if len(self._buf) < 4:
+                    break
+                n, pos = int.from_bytes(self._buf[2:4], "big"), 4
+            elif n == 127:
+                if len(self._buf) < 10:
+                    break
+                n, pos = int.from_bytes(self._buf[2:10], "big"), 10
+            if self._size + n > self.max_message:
+                raise WebSocketError(1009, "Message too big")
+            if len(self._buf) < pos + 4 + n:
+                break
+            mask = bytes(self._buf[pos:pos + 4])
+            payload = bytes(self._buf[pos + 4:pos + 4 + n])
+            del self._buf[:pos + 4 + n]
+            if n:
+                # Unmask in one big-int XOR rather than byte by byte
+                key = (mask * (n // 4 + 1))[:n]
+                payload = (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+
+            if opcode >= 0x8:
+                if not fin or n > 125:
+                    raise WebSocketError(1002, "Bad control frame")
+                out.append((opcode, payload))
+                continue
+            if opcode == 0 and self._opcode is None:
+                raise WebSocketError(1002, "Unexpected continuation frame")
+            if opcode != 0 and self._opcode is not None:
+                raise WebSocketError(1002, "Expected continuation frame")
+            if opcode != 0:
+                self._opcode = opcode
+            self._parts.append(payload)
+            self._size += n
+            if fin:
+                out.append((self._opcode, b"".join(self._parts)))
+                self._opcode, self._parts, self._size = None, [], 0
+        return out
+
+
+def ws_text(opcode: int, payload: bytes) -> str:
+    """The request text of a data message, or WebSocketError for anything else."""
+    if opcode != WS_TEXT:
+        raise WebSocketError(1003, "Only JSON text frames are accepted")
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        raise WebSocketError(1007, "Text frame is not valid UTF-8")
+
+
+def ws_route(req, text: str, subscriptions: set):
+    """One /ws request, as a route generator returning (id, path, code, obj).
+    `req` is the authenticated upgrade request, so the POST routes see the
+    same credentials as on the handshake."""
+    try:
+        msg = json.loads(text)
+    except json.JSONDecodeError:
+        msg = None
+    if not isinstance(msg, dict):
+        return (None, "/ws") + _err(400, "Messages must be JSON objects")
+    msg_id = msg.get("id")
+    action = msg.get("action", "")
+
+    if action in ("subscribe", "unsubscribe"):
+        names = msg.get("events", list(WS_EVENTS))
+        if not isinstance(names, list) or not set(names) <= set(WS_EVENTS):
+            return (msg_id, "/ws") + _err(400, f"'events' must list some of {', '.join(WS_EVENTS)}")
+        if action == "subscribe":
+            subscriptions.update(names)
+        else:
+            subscriptions.difference_update(names)
+        return (msg_id, "/ws") + _ok({"subscribed": sorted(subscriptions)})
+
+    if action not in WS_ACTIONS:
+        return (msg_id, "/ws") + _err(404, f"Unknown action: {action!r}")
+    path = "/" + action
+    code, obj = yield from route_post(req, path, msg)
+    return msg_id, path, code, obj
+
+
+def ws_reply(msg_id, code: int, obj) -> dict:
+    return {"id": msg_id, "code": code, "ok": code < 400, "result": obj}
+
+
+def ws_lane(text: str):
+    """(id, lane, weight) of a /ws message: the admission of the POST route it
+    names. Subscriptions and malformed messages do no work and take lane 0."""
+    try:
+        msg = json.loads(text)
+    except ValueError:
+        return None, LANE_PRIORITY, 1
+    if not isinstance(msg, dict):
+        return None, LANE_PRIORITY, 1
+    action = msg.get("action")
+    if isinstance(action, str) and action in WS_ACTIONS:
+        return msg.get("id"), request_lane("/" + action), request_weight("/" + action)
+    return msg.get("id"), LANE_PRIORITY, 1
+
+
+def ws_refused(msg_id, refusal) -> dict:
+    """Reply for a request rate_limit() or admission refused."""
+    code, obj, retry_after = refusal
+    return ws_reply(msg_id, code, dict(obj, retry_after=retry_after))
+
+
+def ws_busy_reply(msg_id) -> dict:
+    """429 reply for a request refused because WS_MAX_INFLIGHT are running."""
+    return ws_reply(msg_id, *_err(429, "Too many requests in flight"))
+
+
+def ws_stream_message(msg_id, stream: ExecStream, kind: str, data) -> dict:
+    """The /ws message for one _stream_exec item of a streamed exec."""
+    if kind == "exit":
+        return ws_reply(msg_id, 200, dict(data, ok=data["returncode"] == 0, cmd=stream.cmd))
+    if stream.binary:
+        return {"id": msg_id, "event": kind, "base64": base64.b64encode(b"".join(data)).decode()}
+    lines = [line.decode("utf-8", errors="replace").rstrip("\r") for line in data]
+    return {"id": msg_id, "event": kind, "lines": lines}
+
+
+# Threads that run /ws requests for the threaded engines
+_ws_pool = concurrent.futures.ThreadPoolExecutor(max_workers=POOL_WORKERS,
+                                                 thread_name_prefix="ws")
+
+
+class WSChannel:
+    """A /ws connection on the threaded engine. The handler's worker thread
+    reads frames; requests run on _ws_pool; one writer thread owns the socket
+    and sends replies, pushed events and keepalive pings from a bounded
+    outbox."""
+
+    def __init__(self, handler):
+        self.req           = handler
+        self.sock          = handler.connection
+        self.subscriptions = set()
+        self._outbox       = queue.Queue(maxsize=256)
+        self._closed       = threading.Event()
+        self._lock         = threading.Lock()
+        self._inflight     = 0
+        self._procs        = set()  # streamed execs to kill if the channel drops
+
+    def serve(self):
+        writer = threading.Thread(target=self._writer, name="ws-writer", daemon=True)
+        writer.start()
+        events.subscribe(self._on_event)
+        close_code, reason = 1000, ""
+        parser = WSParser(WS_MAX_MESSAGE)
+        try:
+            # Silence for three ping intervals means the peer is gone
+            self.sock.settimeout(WS_PING_SEC * 3)
+            while not self._closed.is_set():
+                data = self.req.rfile.read1(65536)
+                if not data:
+                    break
+                for opcode, payload in parser.feed(data):
+                    if opcode == WS_CLOSE:
+                        raise WebSocketError(1000, "")
+                    if opcode == WS_PING:
+                        self._send(ws_frame(WS_PONG, payload))
+                    elif opcode != WS_PONG:
+                        self._dispatch(ws_text(opcode, payload))
+        except WebSocketError as exc:
+            close_code, reason = exc.code, str(exc)
+        except (OSError, ValueError):
+            pass
+        finally:
+            events.unsubscribe(self._on_event)
+            self._send(ws_close_frame(close_code, reason))
+            self._closed.set()
+            with self._lock:
+                for proc in self._procs:
+                    _kill_group(proc)
+            self._outbox.put(None)
+            writer.join(5)
+
+    def _writer(self):
+        while True:
+            try:
+                frame = self._outbox.get(timeout=WS_PING_SEC)
+            except queue.Empty:
+                frame = ws_frame(WS_PING)
+            if frame is None:
+                return
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self._closed.set()
+                return
+
+    def _send(self, frame: bytes):
+        """Queue a frame, waiting for outbox room unless the channel closed."""
+        while not self._closed.is_set():
+            try:
+                self._outbox.put(frame, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _on_event(self, event: str, data):
+        if event in self.subscriptions:
+            try:
+                self._outbox.put_nowait(ws_json({"event": event, "data": data}))
+            except queue.Full:
+                pass  # a slow reader loses pushed events, never replies
+
+    def _track(self, proc, procs: list):
+        procs.append(proc)
+        with self._lock:
+            self._procs.add(proc)
+        if self._closed.is_set():
+            _kill_group(proc)
+
+    def _dispatch(self, text: str):
+        msg_id, lane, weight = ws_lane(text)
+        refusal = rate_limit(self.req, lane)
+        if refusal:
+            self._send(ws_json(ws_refused(msg_id, refusal)))
+            return
+        with self._lock:
+            busy = self._inflight >= WS_MAX_INFLIGHT
+            if not busy:
+                self._inflight += 1
+        if busy:
+            self._send(ws_json(ws_busy_reply(msg_id)))
+            return
+        _ws_pool.submit(self._handle, text, msg_id, lane, weight)
+
+    def _handle(self, text: str, msg_id, lane: int, weight: int):
+        started = time.monotonic()
+        path, code = "/ws", 500
+        admitted = False
+        try:
+            refusal = admission.enter(lane, weight)  # waits here, not on the reader thread
+            if refusal:
+                code = refusal[0]
+                self._send(ws_json(ws_refused(msg_id, refusal)))
+                return
+            admitted = True
+            msg_id, path, code, obj = drive(ws_route(self.req, text, self.subscriptions))
+            if isinstance(obj, ExecStream):
+                procs = []
+                frames = _stream_exec(obj.cmd, obj.timeout, raw=obj.binary,
+                                      on_spawn=lambda proc: self._track(proc, procs))
+                try:
+                    for kind, data in frames:
+                        if self._closed.is_set():
+                            break
+                        self._send(ws_json(ws_stream_message(msg_id, obj, kind, data)))
+                finally:
+                    frames.close()
+                    with self._lock:
+                        self._procs.difference_update(procs)
+            else:
+                self._send(ws_json(ws_reply(msg_id, code, obj)))
+        except Exception:
+            log.error("WS request error: %s", traceback.format_exc())
+        finally:
+            if admitted:
+                admission.leave(lane, weight)
+            with self._lock:
+                self._inflight -= 1
+            observe_request("WS", path, code, started)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# HTTP HANDLER
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+class BridgeHandler(BaseHTTPRequestHandler):
+    server_version = f"TCC-Bridge/{VERSION}"
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_TIMEOUT  # drop idle keep-alive connections so they can't pin a worker
+
+    # ââ Logging ââ
+    def log_message(self, fmt, *args):
+        log.info("%s â %s", self.client_address[0], fmt % args)
+
+    def log_error(self, fmt, *args):
+        log.warning("%s â %s", self.client_address[0], fmt % args)
+
+    # ââ Response helpers ââ
+    def _send_json(self, code: int, obj: dict, headers: dict = None):
+        body, content_type = _encode_response(obj)
+        body, encoding = _compress(body, self.headers.get("Accept-Encoding", ""))
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if COMPRESS_MIN_BYTES:
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Bridge-Version", VERSION)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            pass
+
+    def _send_result(self, code: int, obj):
+        if isinstance(obj, ExecStream):
+            self._send_stream(code, obj)
+        else:
+            self._send_json(code, obj)
+
+    def _send_stream(self, code: int, stream: ExecStream):
+        self.send_response(code)
+        self.send_header("Content-Type", stream.content_type)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("X-Bridge-Version", VERSION)
+        for name, value in stream.headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        frames = _stream_exec(stream.cmd, stream.timeout, client=self.connection,
+                              raw=stream.binary)
+        finished = False
+        try:
+            for kind, data in frames:
+                payload = stream.frame(kind, data)
+                if payload:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+                finished = kind == "exit"
+            if finished:
+                self.wfile.write(b"0\r\n" + stream.trailer() + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            log.info("Stream client went away; killed [%s]", stream.cmd[:60])
+        finally:
+            frames.close()
+            if not finished:
+                self.close_connection = True
+
+    def _send_ok(self, extra: dict = None):
+        data = {"ok": True}
+        if extra:
+            data.update(extra)
+        self._send_json(200, data)
+
+    def _send_error_json(self, code: int, message: str):
+        self._send_json(code, {"ok": False, "error": message, "code": code})
+
+    # ââ Body reader ââ
+    def _read_body(self) -> dict:
+        try:
+            length = _content_length(self.headers)  # checked in _dispatch
+            if length > 0:
+                return _parse_body(self.rfile.read(length))
+        except Exception as exc:
+            log.debug("Body read error: %s", exc)
+        return {}
+
+    # ââ Path + query helpers ââ
+    def _path(self) -> str:
+        return urlparse(self.path).path
+
+    def _query(self) -> dict:
+        return parse_qs(urlparse(self.path).query)
+
+    def _qget(self, key: str, default=None):
+        return self._query().get(key, [default])[0]
+
+    # ââââââââââââââââââââââââââââââââââââââââââââ
+    # GET / POST (dispatch to the shared routes)
+    # ââââââââââââââââââââââââââââââââââââââââââââ
+    def do_GET(self):
+        self._dispatch("GET", lambda path: route_get(self, path, self._qget))
+
+    def do_POST(self):
+        if _is_upload(self):  # the body is left for the route's BodyUpload
+            params = {k: v[0] for k, v in self._query().items()}
+            self._dispatch("POST", lambda path: route_post(self, path, params))
+        else:
+            self._dispatch("POST", lambda path: route_post(self, path, self._read_body()))
+
+    def do_DELETE(self):
+        self._dispatch("DELETE", lambda path: route_delete(self, path, self._qget))
+
+    def _dispatch(self, method: str, make_route):
+        started = time.monotonic()
+        path = self._path()
+        # /ws channels are capped by WS_MAX_CONNECTIONS rather than holding a slot
+        lane = request_lane(path)
+        slot = LANE_PRIORITY if path == "/ws" else lane
+        weight = request_weight(path)
+        refusal = rate_limit(self, lane) or admission.enter(slot, weight)
+        getattr(self.server, "opened", lambda: None)()  # now counted by admission
+        if refusal:
+            code, obj, retry_after = refusal
+            self.close_connection = True  # any request body is left unread
+            self._send_json(code, obj, {"Retry-After": str(retry_after)})
+            observe_request(method, path, code, started)
+            return
+        if getattr(self.server, "draining", False):
+            self.close_connection = True  # keep-alive clients move to the new process
+        try:
+            if _content_length(self.headers) is None:
+                self.close_connection = True  # can't tell where the body ends
+                self._send_json(*_err(400, "Bad Content-Length"))
+                observe_request(method, path, 400, started)
+                return
+            if method == "GET" and path == "/ws":
+                return self._serve_ws(started)
+            code, obj = drive(make_route(path))
+            if isinstance(obj, BodyUpload):
+                upload = obj
+                code, obj = upload.run(_body_chunks(self.rfile, self.headers))
+                if not upload.complete:
+                    self.close_connection = True
+            elif method == "POST" and _is_upload(self):
+                self.close_connection = True  # answered without reading the body
+            self._send_result(code, obj)
+            observe_request(method, path, code, started)
+        finally:
+            admission.leave(slot, weight)
+
+    def _serve_ws(self, started: float):
+        code, accept = ws_handshake(self)
+        observe_request("GET", "/ws", code, started)
+        if code != 101:
+            self._send_json(code, accept)
+            return
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        log.info("WS channel opened from %s", self.client_address[0])
+        WSChannel(self).serve()
+        self.close_connection = True
+        log.info("WS channel closed from %s", self.client_address[0])
+
+    # ââââââââââââââââââââââââââââââââââââââââââââ
+    # OPTIONS (CORS pre-flight)
+    # ââââââââââââââââââââââââââââââââââââââââââââ
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header("Allow", "GET, POST, DELETE, OPTIONS")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers",
+                         "Authorization, Content-Type, X-Auth")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# CONCURRENT SERVER (bounded worker pool)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+_BUSY_BODY = b'{"ok": false, "error": "Bridge busy, retry shortly.", "code": 503}'
+_BUSY_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: application/json; charset=utf-8\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: " + str(len(_BUSY_BODY)).encode() + b"\r\n\r\n" + _BUSY_BODY
+)
+
+
+class PoolHTTPServer(HTTPServer):
+    """HTTPServer that hands accepted connections to a fixed set of worker threads.
+
+    Accepted sockets wait in a bounded queue; when it is full the connection is
+    answered with 503 straight from the accept loop instead of growing a backlog.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, addr, handler, workers: int = POOL_WORKERS,
+                 queue_size: int = POOL_QUEUE, bind_and_activate: bool = True):
+        self.draining = False
+        super().__init__(addr, handler, bind_and_activate)
+        self._queue    = queue.Queue(maxsize=queue_size)
+        self._lock     = threading.Lock()
+        self._active   = 0
+        self._served   = 0
+        self._rejected = 0
+        self._opening  = 0   # connections handed to a worker, first request not read yet
+        self._local    = threading.local()
+        self._workers  = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            log.warning("Worker pool saturated; rejecting %s", client_address[0])
+            try:
+                request.sendall(_BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            with self._lock:
+                self._active += 1
+                self._opening += 1
+            self._local.opening = True
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.opened()
+                self.shutdown_request(request)
+                with self._lock:
+                    self._active -= 1
+                    self._served += 1
+
+    def opened(self):
+        """Called by the handler once the connection's first request is read."""
+        if getattr(self._local, "opening", False):
+            self._local.opening = False
+            with self._lock:
+                self._opening -= 1
+
+    def handle_error(self, request, client_address):
+        log.error("Unhandled error from %s: %s", client_address, traceback.format_exc())
+
+    def shutdown(self):
+        self.draining = True
+        super().shutdown()
+
+    def pool_stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers":   len(self._workers),
+                "active":    self._active,
+                "queued":    self._queue.qsize(),
+                "queue_max": self._queue.maxsize,
+                "opening":   self._opening,
+                "rejected":  self._rejected,
+                "served":    self._served,
+            }
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# ASYNCIO ENGINE
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# One event loop serves every connection, and subprocess waits are plain
+# awaits, so a slow termux-tts-speak or a long /exec costs no OS thread. Only
+# "call" effects (Supabase, ntfy, state builders) go to a small executor.
+_STATUS_REASONS = {code: msg for code, (msg, _) in BaseHTTPRequestHandler.responses.items()}
+
+
+def _decode_output(data: bytes, errors: str = "strict") -> str:
+    # Match subprocess.run(text=True): locale codec plus universal newlines.
+    return data.decode(_LOCALE_ENCODING, errors).replace("\r\n", "\n").replace("\r", "\n")
+
+
+async def _aexec(cmd: str, timeout: int):
+    """Run `cmd` through the shell; returns (returncode, stdout_bytes, stderr_bytes)."""
+    proc = await asyncio.create_subprocess_shell(
+        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        await proc.wait()
+        raise
+    return proc.returncode, out, err
+
+
+async def _acapture(cmd: str, timeout: int, out, err, stdin=None) -> int:
+    """Async twin of _capture_spawned(); `stdin` is a coroutine function."""
+    proc = await asyncio.create_subprocess_shell(
+        cmd, stdin=asyncio.subprocess.PIPE if stdin else None,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    feeder = asyncio.ensure_future(stdin(proc.stdin)) if stdin else None
+
+    async def pump(stream, sink):
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                return
+            sink(chunk)
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(pump(proc.stdout, out), pump(proc.stderr, err), proc.wait()),
+            timeout)
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        await proc.wait()
+        raise
+    finally:
+        if feeder is not None:
+            await feeder
+    return proc.returncode
+
+
+async def _arun(cmd: str, timeout: int = 15) -> str:
+    """Async twin of _run()."""
+    started = time.monotonic()
+    try:
+        code, out, err = await _aexec(cmd, timeout)
+        stdout, stderr = _decode_output(out), _decode_output(err)
+        _observe_cmd(cmd, started, "ok" if code == 0 else "error")
+        if code != 0 and stderr:
+            log.debug("CMD stderr [%s]: %s", cmd[:60], stderr.strip())
+        return stdout.strip()
+    except asyncio.TimeoutError:
+        _observe_cmd(cmd, started, "timeout")
+        log.warning("CMD timeout [%s]", cmd[:60])
+        return ""
+    except Exception as exc:
+        _observe_cmd(cmd, started, "exception")
+        log.warning("CMD error [%s]: %s", cmd[:60], exc)
+        return ""
+
+
+async def _arun_full(cmd: str, timeout: int = 30, stdin=None) -> dict:
+    """Async twin of _run_full(), built on asyncio.create_subprocess_shell."""
+    started = time.monotonic()
+    capture = OutputCapture(spills, EXEC_MEMORY_MAX)
+    try:
+        code = await _acapture(cmd, timeout, capture.sink("stdout"), capture.sink("stderr"),
+                               stdin)
+        _observe_cmd(cmd, started, "ok" if code == 0 else "error")
+        return capture.result(code)
+    except asyncio.TimeoutError:
+        capture.discard()
+        _observe_cmd(cmd, started, "timeout")
+        return {"stdout": "", "stderr": "Command timed out.", "returncode": -1}
+    except Exception as exc:
+        capture.discard()
+        _observe_cmd(cmd, started, "exception")
+        return {"stdout": "", "stderr": str(exc), "returncode": -2}
+    finally:
+        capture.close()
+
+
+async def _astream_exec(cmd: str, timeout: int = 30, raw: bool = False):
+    """Async twin of _stream_exec(): same frames, no thread per command."""
+    loop     = asyncio.get_running_loop()
+    started  = time.monotonic()
+    deadline = loop.time() + timeout
+    proc = await asyncio.create_subprocess_shell(
+        cmd, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    frames = asyncio.Queue(maxsize=64)  # bounded: a slow client back-pressures the pipes
+
+    async def pump(name, pipe):
+        splitter = _RawChunks() if raw else _LineSplitter()
+        while True:
+            chunk = await pipe.read(65536)
+            if not chunk:
+                break
+            lines = splitter.feed(chunk)
+            if lines:
+                await frames.put((name, lines))
+        lines = splitter.flush()
+        if lines:
+            await frames.put((name, lines))
+        await frames.put((name, None))
+
+    pumps = [asyncio.ensure_future(pump("stdout", proc.stdout)),
+             asyncio.ensure_future(pump("stderr", proc.stderr))]
+    try:
+        open_pipes = 2
+        while open_pipes:
+            name, lines = await asyncio.wait_for(frames.get(), deadline - loop.time())
+            if lines is None:
+                open_pipes -= 1
+                continue
+            yield name, lines
+        await asyncio.wait_for(proc.wait(), max(0.0, deadline - loop.time()))
+        _observe_cmd(cmd, started, "ok" if proc.returncode == 0 else "error")
+        yield "exit", {"returncode": proc.returncode,
+                       "duration": round(time.monotonic() - started, 3)}
+    except asyncio.CancelledError:
+        _observe_cmd(cmd, started, "cancelled")
+        raise
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        _observe_cmd(cmd, started, "timeout")
+        yield "exit", {"returncode": -1, "error": "Command timed out.",
+                       "duration": round(time.monotonic() - started, 3)}
+    finally:
+        for task in pumps:
+            task.cancel()
+        if proc.returncode is None:
+            _kill_group(proc)
+            await proc.wait()
+
+
+async def _aperform(effect):
+    kind = effect[0]
+    if kind == "run":
+        return await _arun(effect[1], timeout=effect[2])
+    if kind == "run_full":
+        if len(effect) > 3 and effect[3] is not None:  # sessions live in ShellPool
+            return await asyncio.get_running_loop().run_in_executor(None, _run_full, *effect[1:])
+        return await _arun_full(effect[1], timeout=effect[2])
+    if kind == "call":
+        return await asyncio.get_running_loop().run_in_executor(None, effect[1], *effect[2:])
+    if kind == "gather":
+        return await _agather(effect[1])
+    raise ValueError(f"unknown effect: {kind}")
+
+
+async def _agather(routes):
+    return await asyncio.gather(*(adrive(r) for r in routes), return_exceptions=True)
+
+
+async def adrive(route):
+    """Async counterpart of drive()."""
+    try:
+        effect = next(route)
+        while True:
+            try:
+                value = await _aperform(effect)
+            except Exception as exc:
+                effect = route.throw(exc)
+            else:
+                effect = route.send(value)
+    except StopIteration as stop:
+        return stop.value
+
+
+class _AsyncRequest:
+    """The slice of BaseHTTPRequestHandler that the routes and _check_auth use."""
+    __slots__ = ("server", "path", "headers", "client_address")
+
+    def __init__(self, server, path, headers, client_address):
+        self.server         = server
+        self.path           = path
+        self.headers        = headers
+        self.client_address = client_address
+
+
+class AsyncBridgeServer:
+    """HTTP/1.1 server on asyncio streams with the same surface run_server() uses
+    for HTTPServer: .socket, .serve_forever(), .shutdown(), .server_close().
+    """
+
+    def __init__(self, addr, max_body: int = 16 * 1024 * 1024, sock: socket.socket = None):
+        if sock is None:  # else an already listening socket (pre-fork, reload)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(addr)
+            sock.listen(1024)
+        self.socket = sock
+        self.server_address = self.socket.getsockname()
+        self.draining     = False
+        self._max_body    = max_body
+        self._loop        = None
+        self._stop        = None
+        self._connections = 0
+        self._opening     = 0  # accepted, first request not read yet
+        self._done        = threading.Event()
+        self._active      = 0
+        self._served      = 0
+        self.unix_listeners = []  # (socket, peer label), see attach_unix_listener
+
+    def pool_stats(self) -> dict:
+        return {
+            "connections": self._connections,
+            "opening":     self._opening,
+            "active":      self._active,
+            "served":      self._served,
+        }
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._done.set()
+
+    def shutdown(self):
+        # Like HTTPServer.shutdown(): returns once serve_forever() has drained
+        self.draining = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._done.wait()
+
+    def server_close(self):
+        self.socket.close()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=POOL_WORKERS,
+                                                  thread_name_prefix="async-call"))
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._client, sock=self.socket)
+        unix = [await asyncio.start_unix_server(functools.partial(self._client, label=label),
+                                                sock=sock)
+                for sock, label in self.unix_listeners]
+        await self._stop.wait()
+        # Stop accepting, then give in-flight requests DRAIN_SEC to finish;
+        # asyncio.run() cancels whatever is left (idle keep-alive readers)
+        server.close()
+        for srv in unix:
+            srv.close()
+        deadline = time.monotonic() + DRAIN_SEC
+        while requests_in_flight(self) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+    async def _client(self, reader, writer, label: str = None):
+        if label == LOCAL_PEER and not _peer_allowed(writer.get_extra_info("socket")):
+            writer.close()
+            return
+        self._connections += 1
+        self._opening += 1
+        opening = True
+        peer = (label, 0) if label else writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    return
+                finally:
+                    if opening:
+                        opening = False
+                        self._opening -= 1
+                keep_alive = await self._handle(head, reader, writer, peer)
+                await writer.drain()
+                if not keep_alive or self.draining:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            log.error("Unhandled error from %s: %s", peer, traceback.format_exc())
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _handle(self, head: bytes, reader, writer, peer) -> bool:
+        lines = head.decode("iso-8859-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            self._write(writer, *_err(400, "Bad request line"), keep_alive=False)
+            return False
+        headers = email.parser.Parser(_class=http.client.HTTPMessage).parsestr(
+            "\r\n".join(lines[1:]) + "\r\n")
+        conn = headers.get("Connection", "").lower()
+        keep_alive = conn != "close" if version == "HTTP/1.1" else conn == "keep-alive"
+        keep_alive = keep_alive and not self.draining
+
+        started = time.monotonic()
+        req = _AsyncRequest(self, target, headers, peer)
+        path = urlparse(target).path
+        lane = LANE_PRIORITY if method == "OPTIONS" else request_lane(path)
+        slot = LANE_PRIORITY if path == "/ws" else lane
+        weight = request_weight(path)
+
+        raw = b""
+        upload = method == "POST" and _is_upload(req)  # read later, by a BodyUpload
+        length = _content_length(headers)
+        if length is None:
+            code, obj = _err(400, "Bad Content-Length")
+        elif not upload and length > self._max_body:
+            code, obj = _err(413, "Request body too large")
+        else:
+            code = None
+        if code is None and length > 0 and not upload:
+            # Read before taking an admission slot, and bounded like the header
+            # read: a client that stalls mid-body must not hold a slot
+            try:
+                raw = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                code, obj = _err(408, "Timed out reading the request body")
+        if code is not None:
+            self._write(writer, code, obj, keep_alive=False)
+            observe_request(method, path, code, started)
+            return False
+
+        refusal = rate_limit(req, lane) or await admission.aenter(slot, weight)
+        if refusal:
+            code, obj, retry_after = refusal
+            self._write(writer, code, obj, keep_alive=False,
+                        headers={"Retry-After": str(retry_after)})
+            observe_request(method, path, code, started)
+            return False
+        try:
+            return await self._dispatch(method, target, version, headers, keep_alive,
+                                        req, path, raw, upload, reader, writer, peer, started)
+        finally:
+            admission.leave(slot, weight)
+
+    async def _dispatch(self, method, target, version, headers, keep_alive,
+                        req, path, raw, upload, reader, writer, peer, started) -> bool:
+        self._active += 1
+        try:
+            query = parse_qs(urlparse(target).query)
+            qget = lambda k, d=None: query.get(k, [d])[0]
+            if method == "GET" and path == "/ws":
+                return await self._serve_ws(req, reader, writer, started)
+            if method == "GET":
+                route = route_get(req, path, qget)
+            elif method == "DELETE":
+                route = route_delete(req, path, qget)
+            elif method == "POST" and upload:
+                route = route_post(req, path, {k: v[0] for k, v in query.items()})
+            elif method == "POST":
+                route = route_post(req, path, _parse_body(raw) if raw else {})
+            elif method == "OPTIONS":
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Allow: GET, POST, DELETE, OPTIONS\r\n"
+                    b"Access-Control-Allow-Origin: *\r\n"
+                    b"Access-Control-Allow-Headers: Authorization, Content-Type, X-Auth\r\n"
+                    b"Content-Length: 0\r\n\r\n")
+                return keep_alive
+            else:
+                self._write(writer, *_err(501, f"Unsupported method ({method})"),
+                            keep_alive=keep_alive)
+                return keep_alive
+            code, obj = await adrive(route)
+            if isinstance(obj, BodyUpload):
+                if headers.get("Expect", "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                consumer = obj
+                code, obj = await consumer.arun(_abody_chunks(reader, headers))
+                keep_alive = keep_alive and consumer.complete
+            elif upload:
+                keep_alive = False  # answered without reading the body
+            if isinstance(obj, ExecStream):
+                keep_alive = await self._write_stream(reader, writer, code, obj) and keep_alive
+        finally:
+            self._active -= 1
+            self._served += 1
+        if not isinstance(obj, ExecStream):
+            self._write(writer, code, obj, keep_alive=keep_alive,
+                        accept_encoding=headers.get("Accept-Encoding", ""))
+        observe_request(method, path, code, started)
+        log.info("%s â \"%s %s %s\" %d -", peer[0], method, target, version, code)
+        return keep_alive
+
+    async def _serve_ws(self, req, reader, writer, started: float) -> bool:
+        """Async counterpart of WSChannel: requests are tasks on this loop and a
+        sender task drains the outbox. Always ends the connection."""
+        code, accept = ws_handshake(req)
+        observe_request("GET", "/ws", code, started)
+        if code != 101:
+            self._write(writer, code, accept, keep_alive=False)
+            return False
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            f"Server: TCC-Bridge/{VERSION}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        log.info("WS channel opened from %s", req.client_address[0])
+
+        loop          = asyncio.get_running_loop()
+        outbox        = asyncio.Queue(maxsize=256)
+        subscriptions = set()
+        tasks         = set()
+
+        def offer(frame):
+            try:
+                outbox.put_nowait(frame)
+            except asyncio.QueueFull:
+                pass  # a slow reader loses pushed events, never replies
+
+        def on_event(event, data):  # called from any thread
+            if event in subscriptions:
+                loop.call_soon_threadsafe(offer, ws_json({"event": event, "data": data}))
+
+        async def sender():
+            while True:
+                try:
+                    frame = await asyncio.wait_for(outbox.get(), WS_PING_SEC)
+                except asyncio.TimeoutError:
+                    frame = ws_frame(WS_PING)
+                if frame is None:
+                    return
+                writer.write(frame)
+                await writer.drain()
+
+        async def handle(text, msg_id, lane, weight):
+            t0 = time.monotonic()
+            path, code = "/ws", 500
+            admitted = False
+            try:
+                refusal = await admission.aenter(lane, weight)
+                if refusal:
+                    code = refusal[0]
+                    await outbox.put(ws_json(ws_refused(msg_id, refusal)))
+                    return
+                admitted = True
+                msg_id, path, code, obj = await adrive(ws_route(req, text, subscriptions))
+                if isinstance(obj, ExecStream):
+                    frames = _astream_exec(obj.cmd, obj.timeout, raw=obj.binary)
+                    try:
+                        async for kind, data in frames:
+                            await outbox.put(ws_json(ws_stream_message(msg_id, obj, kind, data)))
+                    finally:
+                        await frames.aclose()
+                else:
+                    await outbox.put(ws_json(ws_reply(msg_id, code, obj)))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.error("WS request error: %s", traceback.format_exc())
+            finally:
+                if admitted:
+                    admission.leave(lane, weight)
+                observe_request("WS", path, code, t0)
+
+        send_task = asyncio.ensure_future(sender())
+        events.subscribe(on_event)
+        parser = WSParser(WS_MAX_MESSAGE)
+        close_code, reason = 1000, ""
+        try:
+            while not send_task.done():
+                data = await asyncio.wait_for(reader.read(65536), WS_PING_SEC * 3)
+                if not data:
+                    break
+                for opcode, payload in parser.feed(data):
+                    if opcode == WS_CLOSE:
+                        raise WebSocketError(1000, "")
+                    if opcode == WS_PING:
+                        await outbox.put(ws_frame(WS_PONG, payload))
+                    elif opcode != WS_PONG:
+                        text = ws_text(opcode, payload)
+                        msg_id, lane, weight = ws_lane(text)
+                        refusal = rate_limit(req, lane)
+                        if refusal:
+                            await outbox.put(ws_json(ws_refused(msg_id, refusal)))
+                            continue
+                        if len(tasks) >= WS_MAX_INFLIGHT:
+                            await outbox.put(ws_json(ws_busy_reply(msg_id)))
+                            continue
+                        task = asyncio.ensure_future(handle(text, msg_id, lane, weight))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+        except WebSocketError as exc:
+            close_code, reason = exc.code, str(exc)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            events.unsubscribe(on_event)
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if not send_task.done():
+                offer(ws_close_frame(close_code, reason))
+                offer(None)
+                try:
+                    await asyncio.wait_for(send_task, 5)
+                except (asyncio.TimeoutError, ConnectionError):
+                    send_task.cancel()
+            log.info("WS channel closed from %s", req.client_address[0])
+        return False
+
+    @staticmethod
+    async def _write_stream(reader, writer, code: int, stream: ExecStream) -> bool:
+        """Stream a command to the client; returns False if the connection
+        can't be reused (client hung up or sent data mid-stream)."""
+        writer.write((
+            f"HTTP/1.1 {code} {_STATUS_REASONS.get(code, '')}\r\n"
+            f"Server: TCC-Bridge/{VERSION}\r\n"
+            f"Content-Type: {stream.content_type}\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "X-Accel-Buffering: no\r\n"
+            f"X-Bridge-Version: {VERSION}\r\n"
+            + "".join(f"{k}: {v}\r\n" for k, v in stream.headers().items())
+            + "\r\n"
+        ).encode("latin-1"))
+        frames = _astream_exec(stream.cmd, stream.timeout, raw=stream.binary)
+        hangup = asyncio.ensure_future(reader.read(1))  # completes on EOF (or pipelined data)
+        reusable = True
+        step = None
+        try:
+            while True:
+                step = asyncio.ensure_future(frames.__anext__())
+                if not hangup.done():
+                    await asyncio.wait({step, hangup}, return_when=asyncio.FIRST_COMPLETED)
+                if hangup.done() and not step.done():
+                    reusable = False
+                    if hangup.exception() is not None or hangup.result() == b"":
+                        log.info("Stream client went away; killed [%s]", stream.cmd[:60])
+                        return False
+                try:
+                    kind, data = await step
+                except StopAsyncIteration:
+                    break
+                payload = stream.frame(kind, data)
+                if payload:
+                    writer.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+                    await writer.drain()
+            writer.write(b"0\r\n" + stream.trailer() + b"\r\n")
+            return reusable and not hangup.done()
+        finally:
+            hangup.cancel()
+            if step is not None and not step.done():
+                step.cancel()
+                await asyncio.gather(step, return_exceptions=True)
+            await frames.aclose()
+
+    @staticmethod
+    def _write(writer, code: int, obj: dict, keep_alive: bool = True,
+               accept_encoding: str = "", headers: dict = None):
+        body, content_type = _encode_response(obj)
+        body, encoding = _compress(body, accept_encoding)
+        head = (
+            f"HTTP/1.1 {code} {_STATUS_REASONS.get(code, '')}\r\n"
+            f"Server: TCC-Bridge/{VERSION}\r\n"
+            f"Date: {email.utils.formatdate(usegmt=True)}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            + "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+            + (f"Content-Encoding: {encoding}\r\n" if encoding else "")
+            + ("Vary: Accept-Encoding\r\n" if COMPRESS_MIN_BYTES else "")
+            + f"Content-Length: {len(body)}\r\n"
+            f"X-Bridge-Version: {VERSION}\r\n"
+            + ("" if keep_alive else "Connection: close\r\n")
+            + "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# UNIX SOCKET LISTENERS
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# Extra listeners feeding the same server as the TCP port: connections join the
+# worker pool (or the event loop) with client_address (LOCAL_PEER|ORIGIN_PEER, 0).
+def bind_unix_socket(path: str) -> socket.socket:
+    """Listen on `path`, connectable by this user only. A stale socket file
+    left by a crash is replaced; one a live bridge still answers is not."""
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        else:
+            raise OSError(f"{path} is in use by another process")
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)  # no window where the file is group/world-accessible
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    sock.listen(128)
+    return sock
+
+
+def _peer_allowed(conn) -> bool:
+    """Belt and braces for BRIDGE_SOCKET: the peer must be this user (or root)."""
+    try:
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    except (AttributeError, OSError):
+        return True  # no SO_PEERCRED here; the 0600 mode still applies
+    _pid, uid, _gid = struct.unpack("3i", creds)
+    return uid in (os.getuid(), 0)
+
+
+class UnixListener(threading.Thread):
+    """Accept loop for a threaded server: hands each connection to the server's
+    process_request(), i.e. the same bounded worker pool as TCP."""
+    def __init__(self, server, sock: socket.socket, label: str):
+        super().__init__(name=f"listen-{label}", daemon=True)
+        self.server, self.sock, self.label = server, sock, label
+
+    def run(self):
+        self.sock.settimeout(1)
+        while not (_stop_event.is_set() or getattr(self.server, "draining", False)):
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # socket closed
+            conn.settimeout(None)
+            if self.label == LOCAL_PEER and not _peer_allowed(conn):
+                conn.close()
+                continue
+            self.server.process_request(conn, (self.label, 0))
+
+
+def attach_unix_listener(server, sock: socket.socket, label: str):
+    if isinstance(server, AsyncBridgeServer):
+        server.unix_listeners.append((sock, label))
+    else:
+        UnixListener(server, sock, label).start()
+
+
+def bind_unix_sockets() -> dict:
+    """Bind BRIDGE_SOCKET / BRIDGE_ORIGIN_SOCKET; returns {path: (sock, label)}."""
+    socks = {}
+    for path, label in ((BRIDGE_SOCKET, LOCAL_PEER), (BRIDGE_ORIGIN_SOCKET, ORIGIN_PEER)):
+        if not path:
+            continue
+        try:
+            socks[path] = (bind_unix_socket(path), label)
+            log.info("Also listening on unix:%s (%s)", path,
+                     "local, no token" if label == LOCAL_PEER else "token auth")
+        except OSError as exc:
+            log.error("Unix socket %s unavailable (non-fatal): %s", path, exc)
+    return socks
+
+
+def close_unix_sockets(socks: dict):
+    for path, (sock, _label) in socks.items():
+        sock.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# SIGNAL HANDLING
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+_server     = None  # the serving object, so a signal can stop serve_forever()
+_unix_socks = {}    # {path: (sock, label)} it also accepts on
+
+
+def _handle_signal(sig, frame):
+    log.info("Signal %s received â initiating graceful shutdown.", sig)
+    _stop_event.set()
+    if _server is not None:
+        # shutdown() blocks until serve_forever() returns, which runs on this thread
+        threading.Thread(target=_server.shutdown, name="shutdown", daemon=True).start()
+
+
+def _handle_reload_signal(sig, frame):
+    log.info("Signal %s received â hot reload.", sig)
+    code, obj = request_reload()
+    if code != 202:
+        log.warning("Reload not started: %s", obj.get("error"))
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# HOT RELOAD (listening-socket handoff)
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# pm2 watches one pid, so a reload keeps it:
+#   1. the bridge passes dups of its listening sockets to a relay: a fresh
+#      interpreter that serves them (no background threads) and reports ready
+#      on a pipe. A relay that dies or never reports ready aborts the reload.
+#   2. the bridge stops accepting, lets in-flight requests finish, and execs
+#      a fresh interpreter in place, handing the same sockets over again;
+#   3. that interpreter serves them, then SIGTERMs the relay, which drains too.
+# The sockets never close, so connections arriving mid-reload wait in the
+# listen backlog instead of being refused. Under BRIDGE_PROCS the supervisor
+# execs itself instead and its new workers replace the old ones.
+_LISTEN_FDS = os.environ.pop("BRIDGE_LISTEN_FDS", "")   # "tcp=5,unix=6,..."
+_READY_FD   = os.environ.pop("BRIDGE_READY_FD", "")
+_RETIRE     = os.environ.pop("BRIDGE_RETIRE_PIDS", "")  # processes to stop once serving
+_RELAY      = os.environ.pop("BRIDGE_RELAY", "") == "1"
+
+_reload_lock = threading.Lock()
+_handoff     = {}  # set while a reload is draining this process: fds, retire
+
+
+def requests_in_flight(server) -> int:
+    """Requests admitted or waiting for a slot, plus connections accepted but
+    not read yet; open /ws channels are long-lived and not counted."""
+    stats = getattr(server, "pool_stats", dict)()
+    return (max(0, admission.inflight() - events.count())
+            + stats.get("queued", 0) + stats.get("opening", 0))
+
+
+def drain_requests(server):
+    deadline = time.monotonic() + DRAIN_SEC
+    while requests_in_flight(server) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    left = requests_in_flight(server)
+    if left:
+        log.warning("Drain timed out with %d request(s) in flight.", left)
+
+
+def _fds_env(fds: dict) -> str:
+    return ",".join(f"{label}={fd}" for label, fd in fds.items())
+
+
+def listen_fds(server, unix_socks: dict) -> dict:
+    """Inheritable dups of every listening socket, keyed "tcp" or the peer label."""
+    fds = {"tcp": os.dup(server.socket.fileno())}
+    for sock, label in unix_socks.values():
+        fds[label] = os.dup(sock.fileno())
+    for fd in fds.values():
+        os.set_inheritable(fd, True)
+    return fds
+
+
+def adopt_listen_fds():
+    """Sockets handed over by a reload: ({"tcp"...: sock}, {path: (sock, label)})."""
+    tcp, unix = {}, {}
+    for item in filter(None, _LISTEN_FDS.split(",")):
+        label, fd = item.split("=")
+        sock = socket.socket(fileno=int(fd))
+        sock.set_inheritable(False)
+        # Two processes accept on it during a reload: losing a race must
+        # raise instead of blocking accept() (and with it shutdown())
+        sock.setblocking(False)
+        if label.startswith("tcp"):
+            tcp[label] = sock
+        else:
+            unix[sock.getsockname()] = (sock, label)
+    return tcp, unix
+
+
+def spawn_relay(fds: dict):
+    """Start a fresh interpreter serving `fds`; its Popen, or None if it died or
+    was not ready within RELOAD_READY_SEC."""
+    ready_r, ready_w = os.pipe()
+    env = dict(os.environ, BRIDGE_LISTEN_FDS=_fds_env(fds), BRIDGE_READY_FD=str(ready_w),
+               BRIDGE_RELAY="1")
+    proc = subprocess.Popen([sys.executable] + sys.argv, env=env,
+                            pass_fds=[*fds.values(), ready_w])
+    os.close(ready_w)
+    try:
+        with selectors.DefaultSelector() as sel:
+            sel.register(ready_r, selectors.EVENT_READ)
+            ready = bool(sel.select(RELOAD_READY_SEC)) and os.read(ready_r, 1) == b"1"
+    finally:
+        os.close(ready_r)
+    if not ready:
+        proc.kill()
+        proc.wait()
+        return None
+    return proc
+
+
+def signal_ready(fd):
+    if fd is not None:
+        os.write(fd, b"1")
+        os.close(fd)
+
+
+def retire(pids: list, reap: bool = True):
+    """SIGTERM the processes a reload replaced; they drain and exit."""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            continue
+        log.info("Retiring pid %d.", pid)
+        if reap:
+            threading.Thread(target=os.waitpid, args=(pid, 0), name=f"reap-{pid}",
+                             daemon=True).start()
+
+
+def exec_fresh(fds: dict, retire_pids: list):
+    """Replace this process with a fresh interpreter (same pid) that takes over
+    `fds`. Only returns if the exec failed."""
+    env = dict(os.environ, BRIDGE_LISTEN_FDS=_fds_env(fds),
+               BRIDGE_RETIRE_PIDS=",".join(map(str, retire_pids)))
+    for fd in fds.values():
+        os.set_inheritable(fd, True)
+    log.info("Re-executing %s (pid %d).", " ".join(sys.argv), os.getpid())
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+    # An ignored signal stays ignored across exec: a second SIGHUP must not
+    # kill the new interpreter before it installs its own handler
+    previous = signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        os.execve(sys.executable, [sys.executable] + sys.argv, env)
+    except OSError:
+        log.critical("Re-exec failed: %s", traceback.format_exc())
+        signal.signal(signal.SIGHUP, previous)
+
+
+def _reload():
+    fds = listen_fds(_server, _unix_socks)
+    try:
+        relay = spawn_relay(fds)
+    except Exception:
+        log.error("Reload failed: %s", traceback.format_exc())
+        relay = None
+    if relay is None:
+        log.error("Reload abandoned: new code did not start serving within %ds.",
+                  RELOAD_READY_SEC)
+        for fd in fds.values():
+            os.close(fd)
+        _reload_lock.release()
+        return
+    log.info("Reload: relay pid %d is serving; draining this process.", relay.pid)
+    _handoff.update(fds=fds, retire=[relay.pid])
+    _server.shutdown()  # serve_process() drains, then calls exec_fresh()
+
+
+def request_reload():
+    """Start a hot reload (SIGHUP, POST /admin/reload); returns (code, obj)."""
+    if _worker_index is not None:
+        os.kill(os.getppid(), signal.SIGHUP)  # the pre-fork supervisor reloads everyone
+        return 202, {"ok": True, "reload": "supervisor"}
+    if _RELAY or _server is None or _stop_event.is_set():
+        return _err(409, "Not serving; nothing to reload.")
+    if not _reload_lock.acquire(blocking=False):
+        return _err(409, "Reload already in progress.")
+    threading.Thread(target=_reload, name="reload", daemon=True).start()
+    return 202, {"ok": True, "reload": "started"}
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# SERVER BOOTSTRAP
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+def run_server():
+    if BRIDGE_PROCS > 1 and ENGINE != "single":
+        run_prefork(BRIDGE_PROCS)
+    else:
+        serve_process()
+
+
+def bind_reuseport_socket() -> socket.socket:
+    """One of the pre-fork supervisor's per-worker listeners on PORT."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", PORT))
+    sock.listen(1024)
+    return sock
+
+
+def make_server(sock: socket.socket = None):
+    """The ENGINE's server on PORT, or on `sock` if one is already listening."""
+    addr = ("0.0.0.0", PORT)
+    if ENGINE == "async":
+        return AsyncBridgeServer(addr, sock=sock)
+    if ENGINE == "single":
+        server = HTTPServer(addr, BridgeHandler, bind_and_activate=sock is None)
+    else:
+        server = PoolHTTPServer(addr, BridgeHandler, bind_and_activate=sock is None)
+    if sock is not None:
+        server.socket.close()
+        server.socket = sock
+        server.server_address = sock.getsockname()
+    return server
+
+
+def serve_process(worker: int = 0, shared: "SharedState" = None,
+                  tcp_sock: socket.socket = None, unix_socks: dict = None, ready_fd: int = None):
+    """Serve until stopped. Standalone by default; under run_prefork() this is
+    one of N workers sharing the port, and only worker 0 (the leader) runs the
+    background threads and the startup push. A reload relay runs neither."""
+    global _server, _worker_index, _unix_socks
+    leader = worker == 0 and not _RELAY
+    announce = shared is None and not _RELAY
+    if shared is not None:
+        _worker_index = worker
+        METRICS.share(shared.metrics, worker)
+        health_snapshot.share(shared.health, writer=leader)
+        metric_history.share(shared.history)
+        jobs.shared = True
+
+    # Register signal handlers
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT,  _handle_signal)
+    signal.signal(signal.SIGHUP,  _handle_reload_signal)
+
+    # Start background threads
+    threads = []
+    if leader:
+        threads += [
+            HealthRefreshThread(),
+            StateRefreshThread(),
+            HistoryThread(),
+            BackfillThread(),
+            HeartbeatThread(),
+            ReportThread(),
+            WatchdogThread(),
+        ]
+    if shared is not None:
+        threads.append(SharedSyncThread(leader))
+    for t in threads:
+        t.start()
+        log.info("Started thread: %s", t.name)
+
+    # Send startup notification (the supervisor sends it in pre-fork mode,
+    # and a reload is not a restart)
+    if announce and not _LISTEN_FDS:
+        try:
+            ntfy_push(
+                f"\U0001F680 TCC Bridge v{VERSION} started on {DEVICE_ID} | Port: {PORT}",
+                title="Bridge Online",
+                priority="high",
+                tags=["rocket", "shield"]
+            )
+        except Exception:
+            log.warning("Startup ntfy failed (non-fatal).")
+
+    # Push initial state
+    if leader:
+        try:
+            state = build_device_state()
+            state_pusher.push(state)
+            log.info("Initial state pushed to Supabase.")
+        except Exception:
+            log.warning("Initial Supabase push failed (non-fatal).")
+
+    # Sockets handed over by a reload, if any (pre-fork workers get theirs from
+    # the supervisor); a relay leaves the unix socket files for its successor
+    own_socks = unix_socks is None and not _RELAY
+    if shared is None and _LISTEN_FDS:
+        tcp, unix_socks = adopt_listen_fds()
+        tcp_sock = tcp.get("tcp")
+    if shared is None and _READY_FD:
+        ready_fd = int(_READY_FD)
+
+    # Bind with retry
+    server = None
+    for attempt in range(10):
+        try:
+            server = make_server(tcp_sock)
+            server.socket.setsockopt(
+                __import__('socket').SOL_SOCKET,
+                __import__('socket').SO_REUSEADDR, 1
+            )
+            log.info("TCC Bridge v%s listening on 0.0.0.0:%d (engine=%s, workers=%d, queue=%d%s)",
+                     VERSION, PORT, ENGINE, POOL_WORKERS, POOL_QUEUE,
+                     "" if shared is None else f", process {worker + 1}/{BRIDGE_PROCS}")
+            check_worker_budget()
+            break
+        except OSError as exc:
+            wait = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
+            log.error("Server bind error (attempt %d/10): %s. Retrying in %ds.",
+                      attempt + 1, exc, wait)
+            time.sleep(wait)
+
+    if server is None:
+        log.critical("Failed to bind server after 10 attempts. Exiting.")
+        sys.exit(1)
+    _server = server
+
+    # Pre-fork workers share the supervisor's unix sockets; it unlinks them
+    if unix_socks is None:
+        unix_socks = bind_unix_sockets()
+    _unix_socks = unix_socks
+    for sock, label in unix_socks.values():
+        attach_unix_listener(server, sock, label)
+    if not _RELAY:
+        shells.warm()
+    signal_ready(ready_fd)
+    if shared is None and _RETIRE:
+        retire([int(pid) for pid in _RETIRE.split(",")])
+
+    try:
+        if not _stop_event.is_set():  # a signal during startup had no server to stop
+            server.serve_forever()
+        drain_requests(server)
+        shells.close()  # before exec_fresh(), or the new image inherits them as zombies
+        close_store()
+        if _handoff:
+            if not _stop_event.is_set():
+                exec_fresh(_handoff["fds"], _handoff["retire"])
+            retire(_handoff["retire"])  # stopping instead, or the exec failed
+    except Exception:
         log.critical("Server crashed: %s", traceback.format_exc())
     finally:
         _stop_event.set()
+        shells.close()
+        close_store()
         server.server_close()
+        if own_socks:
+            close_unix_sockets(unix_socks)
         log.info("Server closed.")
+        if announce:
+            try:
+                ntfy_push(
+                    f"\u26A0\uFE0F TCC Bridge v{VERSION} STOPPED on {DEVICE_ID}",
+                    title="Bridge Offline",
+                    priority="urgent",
+                    tags=["warning", "sos"]
+                )
+            except Exception:
+                pass
+        log.info("TCC Bridge v%s shutdown complete.", VERSION)
+
+
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# PRE-FORK SUPERVISOR
+# ââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââââ
+# BRIDGE_PROCS worker processes each accept on their own SO_REUSEPORT listener
+# on PORT, so the kernel spreads connections across them and one stuck
+# interpreter (or GIL-bound request) no longer stalls the rest. The parent
+# binds one listener per worker slot and keeps it: a respawned or reloaded
+# worker takes over its slot's socket, so connections queued on it are never
+# reset. The parent only forks, forwards SIGTERM/SIGINT/SIGHUP, and respawns
+# workers that die. It must not start threads before forking: children would
+# inherit locks held by threads that no longer exist.
+def _spawn_worker(index: int, shared: SharedState, listeners: list, unix_socks: dict,
+                  ready_fd: int = None) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            serve_process(index, shared, listeners[index], unix_socks, ready_fd)
+        except SystemExit as exc:
+            code = exc.code if isinstance(exc.code, int) else 1
+        except BaseException:
+            log.critical("Worker %d crashed: %s", index, traceback.format_exc())
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+    log.info("Worker %d started (pid %d).", index, pid)
+    return pid
+
+
+def _await_workers(ready_r: int, count: int) -> bool:
+    """Wait until `count` new workers are serving, at most RELOAD_READY_SEC."""
+    deadline = time.monotonic() + RELOAD_READY_SEC
+    with selectors.DefaultSelector() as sel:
+        sel.register(ready_r, selectors.EVENT_READ)
+        while count > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not sel.select(remaining):
+                return False
+            data = os.read(ready_r, count)
+            if not data:
+                return False  # every new worker died before serving
+            count -= len(data)
+    return True
+
+
+def run_prefork(workers: int):
+    shared     = SharedState(workers)
+    children   = {}  # pid -> (worker index, started)
+    stopping   = []
+    # After a reload: the old workers (still our children, the pid is the
+    # same) keep serving until the new ones are up, then drain and exit
+    old = [int(pid) for pid in _RETIRE.split(",") if pid]
+    tcp, unix_socks = adopt_listen_fds() if _LISTEN_FDS else ({}, bind_unix_sockets())
+    listeners = []
+    for i in range(workers):
+        sock = tcp.get(f"tcp{i}")
+        for attempt in range(10):
+            if sock is not None:
+                break
+            try:
+                sock = bind_reuseport_socket()
+            except OSError as exc:
+                wait = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
+                log.error("Server bind error (attempt %d/10): %s. Retrying in %ds.",
+                          attempt + 1, exc, wait)
+                time.sleep(wait)
+        if sock is None:
+            log.critical("Failed to bind server after 10 attempts. Exiting.")
+            sys.exit(1)
+        listeners.append(sock)
+
+    def forward(sig, frame):
+        if not stopping:
+            log.info("Signal %s received â stopping %d workers.", sig, len(children))
+        stopping.append(sig)
+        _stop_event.set()  # cuts short ntfy retries in this process
+        for pid in [*children, *old]:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(sig, frame):
+        if stopping:
+            return
+        log.info("Signal %s received â reloading %d workers.", sig, len(children))
+        fds = {f"tcp{i}": sock.fileno() for i, sock in enumerate(listeners)}
+        fds.update({label: sock.fileno() for sock, label in unix_socks.values()})
+        exec_fresh(fds, [*children, *old])
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT,  forward)
+
+    ready_r, ready_w = os.pipe()
+    for i in range(workers):
+        children[_spawn_worker(i, shared, listeners, unix_socks, ready_w)] = (i, time.monotonic())
+    os.close(ready_w)
+    if old:
+        if _await_workers(ready_r, workers):
+            retire(old, reap=False)
+            old.clear()
+        else:
+            log.error("New workers not all serving within %ds; old workers kept.",
+                      RELOAD_READY_SEC)
+    os.close(ready_r)
+    signal.signal(signal.SIGHUP, reload)
+
+    if not _LISTEN_FDS:
+        try:
+            ntfy_push(
+                f"\U0001F680 TCC Bridge v{VERSION} started on {DEVICE_ID} | Port: {PORT} "
+                f"| {workers} processes",
+                title="Bridge Online",
+                priority="high",
+                tags=["rocket", "shield"]
+            )
+        except Exception:
+            log.warning("Startup ntfy failed (non-fatal).")
+
+    crashes = 0
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index, started = children.pop(pid, (None, None))
+            if index is None or stopping:
+                continue  # a retired worker, or shutting down
+            # Back off on a crash loop; a worker that ran a while starts over
+            crashes = 1 if time.monotonic() - started > 60 else crashes + 1
+            wait = min(30, 2 ** min(crashes, 5))
+            log.error("Worker %d (pid %d) exited with status %d; respawning in %ds.",
+                      index, pid, os.waitstatus_to_exitcode(status), wait)
+            time.sleep(wait)
+            if stopping:
+                continue
+            children[_spawn_worker(index, shared, listeners, unix_socks)] = (index, time.monotonic())
+    finally:
+        close_unix_sockets(unix_socks)
+        log.info("All workers stopped.")
         try:
             ntfy_push(
                 f"\u26A0\uFE0F TCC Bridge v{VERSION} STOPPED on {DEVICE_ID}",
@@ -0,0 +1,334 @@
+"""
+TCC native device collectors — shared by the bridges and the state-push scripts.
+
+Reads what the kernel already exposes (/proc/loadavg, /proc/meminfo,
+/proc/stat, /proc/net/dev, /proc/uptime and statvfs()) instead of forking
+cat, free, df or ip for every number. Values come back typed — ints and
+floats, sizes in MB or bytes as the key says — and a source the device won't
+let us read (newer Android SELinux policy hides /proc/stat and /proc/net/dev
+from apps) gives {} or None rather than an exception.
+
+Collector runs a set of such functions (or slow termux-api calls) side by
+side under one deadline and reports what is missing or stale; Registry adds a
+per-field TTL and cost tier, a cache, and a scheduler that keeps it warm.
+UnixHTTPConnection is how the scripts reach the bridge's Unix socket.
+"""
+
+import http.client
+import os
+import socket
+import threading
+import time
+
+MB = 1024 * 1024
+
+# /proc/stat "cpu" columns, in order (kernel 2.6.33+)
+_CPU_FIELDS = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal")
+
+# /proc/net/dev columns after the interface name
+_NET_FIELDS = ("rx_bytes", "rx_packets", "rx_errs", "rx_drop", "rx_fifo", "rx_frame",
+               "rx_compressed", "rx_multicast",
+               "tx_bytes", "tx_packets", "tx_errs", "tx_drop", "tx_fifo", "tx_colls",
+               "tx_carrier", "tx_compressed")
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="ascii", errors="replace") as f:
+        return f.read()
+
+
+def loadavg() -> dict:
+    """1/5/15-minute load averages plus running/total scheduling entities."""
+    try:
+        one, five, fifteen, tasks = _read("/proc/loadavg").split()[:4]
+        running, total = tasks.split("/")
+        return {"1m": float(one), "5m": float(five), "15m": float(fifteen),
+                "running": int(running), "total": int(total)}
+    except (OSError, ValueError):
+        return {}
+
+
+def meminfo() -> dict:
+    """RAM and swap in MB. "used" is total minus available, as free(1) reports it."""
+    try:
+        kb = {}
+        for line in _read("/proc/meminfo").splitlines():
+            name, _, rest = line.partition(":")
+            fields = rest.split()
+            if fields:
+                kb[name] = int(fields[0])
+        total = kb["MemTotal"]
+        avail = kb.get("MemAvailable",  # kernels before 3.14 lack it
+                       kb.get("MemFree", 0) + kb.get("Buffers", 0) + kb.get("Cached", 0))
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {
+        "total_mb":      total // 1024,
+        "used_mb":       (total - avail) // 1024,
+        "free_mb":       kb.get("MemFree", 0) // 1024,
+        "available_mb":  avail // 1024,
+        "swap_total_mb": kb.get("SwapTotal", 0) // 1024,
+        "swap_free_mb":  kb.get("SwapFree", 0) // 1024,
+    }
+
+
+def cpu_times() -> dict:
+    """Aggregate CPU time in seconds since boot, per /proc/stat column."""
+    try:
+        line = _read("/proc/stat").split("\n", 1)[0]
+        ticks = os.sysconf("SC_CLK_TCK")
+        values = [int(v) for v in line.split()[1:len(_CPU_FIELDS) + 1]]
+    except (OSError, ValueError):
+        return {}
+    return {name: v / ticks for name, v in zip(_CPU_FIELDS, values)}
+
+
+def cpu_percent(before: dict, after: dict):
+    """Busy percentage between two cpu_times() samples, or None."""
+    if not before or not after:
+        return None
+    idle = (after.get("idle", 0) + after.get("iowait", 0)
+            - before.get("idle", 0) - before.get("iowait", 0))
+    total = sum(after.values()) - sum(before.values())
+    return round(100.0 * max(0.0, total - idle) / total, 1) if total > 0 else None
+
+
+def net_dev() -> dict:
+    """Per-interface counters from /proc/net/dev: {iface: {"rx_bytes": ...}}."""
+    try:
+        lines = _read("/proc/net/dev").splitlines()[2:]
+    except OSError:
+        return {}
+    out = {}
+    for line in lines:
+        name, _, rest = line.partition(":")
+        try:
+            out[name.strip()] = dict(zip(_NET_FIELDS, map(int, rest.split())))
+        except ValueError:
+            continue
+    return out
+
+
+def net_totals() -> dict:
+    """rx/tx bytes summed over every interface but loopback."""
+    ifaces = net_dev()
+    if not ifaces:
+        return {}
+    return {
+        "rx_bytes": sum(c.get("rx_bytes", 0) for n, c in ifaces.items() if n != "lo"),
+        "tx_bytes": sum(c.get("tx_bytes", 0) for n, c in ifaces.items() if n != "lo"),
+    }
+
+
+def disk_usage(path: str) -> dict:
+    """Filesystem usage for `path` in MB, the numbers df reports."""
+    try:
+        st = os.statvfs(os.path.expanduser(path))
+    except OSError:
+        return {}
+    total = st.f_blocks * st.f_frsize
+    used  = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    return {
+        "used_mb":  used // MB,
+        "avail_mb": avail // MB,
+        "total_mb": total // MB,
+        # df's Use%: used over what non-root users can reach
+        "use_pct":  round(100.0 * used / (used + avail), 1) if used + avail else 0.0,
+    }
+
+
+def uptime():
+    """Seconds since boot, or None."""
+    try:
+        return float(_read("/proc/uptime").split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def local_ip():
+    """Source address of the default route, like `ip route get 1`. Connecting a
+    UDP socket only runs the route lookup; no packet is sent. None when offline."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("1.1.1.1", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+# ─── PARALLEL COLLECTION ──────────────────────────────────────────────────────
+class Collector:
+    """Runs named collector functions concurrently under one overall deadline.
+
+    run() returns {"values": {name: value}, "missing": [name, ...],
+    "stale": {name: age_s}, "elapsed": s}. A function still running at the
+    deadline is left to finish on its daemon thread (a hung termux-api call
+    never holds up a push or the interpreter's exit) and is not started again
+    while it runs. Until a fresh result arrives, its last good value is
+    returned and listed as stale; a field that has never produced one, or
+    whose function raised, is missing.
+    """
+
+    def __init__(self, fns: dict, deadline: float):
+        self.fns      = dict(fns)
+        self.deadline = deadline
+        self.errors   = {}    # name -> last exception text
+        self.last     = None  # the latest run() report, without the values
+        self._lock    = threading.Lock()
+        self._results = {}    # name -> (value, time.monotonic() it arrived)
+        self._running = {}    # name -> Event set when the call returns
+
+    def _call(self, name: str, done: threading.Event):
+        try:
+            value = self.fns[name]()
+        except Exception as exc:
+            with self._lock:
+                self.errors[name] = f"{type(exc).__name__}: {exc}"
+        else:
+            with self._lock:
+                self._results[name] = (value, time.monotonic())
+                self.errors.pop(name, None)
+        finally:
+            with self._lock:
+                self._running.pop(name, None)
+            done.set()
+
+    def _start(self, name: str, thread: bool = True) -> threading.Event:
+        # Caller holds self._lock. With thread=False the caller runs
+        # self._call(name, done) itself, outside the lock.
+        done = self._running.get(name)
+        if done is None:
+            done = self._running[name] = threading.Event()
+            if thread:
+                threading.Thread(target=self._call, args=(name, done),
+                                 name=f"collect-{name}", daemon=True).start()
+        return done
+
+    def _report(self, names, started: float, stale_after) -> dict:
+        """The run()/get() result: `stale_after(name, started)` is the arrival
+        time before which a value counts as stale."""
+        now = time.monotonic()
+        values, missing, stale = {}, [], {}
+        with self._lock:
+            for name in names:
+                result = self._results.get(name)
+                if result is None:
+                    missing.append(name)
+                    continue
+                values[name] = result[0]
+                if result[1] < stale_after(name, now):
+                    stale[name] = round(now - result[1], 1)
+        self.last = {"missing": missing, "stale": stale,
+                     "elapsed": round(now - started, 3), "at": time.time()}
+        return dict(self.last, values=values)
+
+    def peek(self, name: str, default=None):
+        """The last good value for `name`, without collecting or waiting."""
+        with self._lock:
+            result = self._results.get(name)
+        return default if result is None else result[0]
+
+    def run(self, names=None, deadline: float = None) -> dict:
+        started = time.monotonic()
+        end = started + (self.deadline if deadline is None else deadline)
+        names = list(names or self.fns)
+        with self._lock:
+            waits = [self._start(name) for name in names]
+        for done in waits:
+            done.wait(max(0.0, end - time.monotonic()))
+        return self._report(names, started, lambda name, now: started)
+
+
+# Cost tiers for Registry fields: how a refresh is run
+CHEAP = "cheap"  # microseconds (/proc, statvfs): inline, on the caller's thread
+SLOW  = "slow"   # a subprocess or Termux:API round-trip: on its own thread
+HEAVY = "heavy"  # seconds of work (pm list, GPS): own thread, one HEAVY at a time
+
+
+class Registry(Collector):
+    """Collector whose fields each declare a cost tier and a TTL, read from a
+    cache rather than collected on the spot.
+
+    get() answers from the cache. A field past its TTL is still returned while
+    a refresh runs behind it (stale-while-revalidate), and only listed as
+    stale once it is a whole deadline overdue; a field never collected yet is
+    waited for, up to the deadline. serve() is the scheduler that refreshes
+    each field as its TTL runs out, so get() normally finds everything fresh
+    and takes well under a millisecond. A refresh is attempted at most once
+    per TTL, so a failing collector is not hammered.
+    """
+
+    def __init__(self, deadline: float):
+        super().__init__({}, deadline)
+        self.ttls     = {}
+        self.costs    = {}
+        self._started = {}  # name -> time.monotonic() of the last refresh
+
+    def register(self, name: str, fn, ttl: float, cost: str = SLOW):
+        self.fns[name], self.ttls[name], self.costs[name] = fn, ttl, cost
+
+    def _due(self, now: float) -> list:
+        """Start a refresh for every due field; returns [(name, done)] for the
+        CHEAP ones, which the caller runs inline. Caller holds self._lock."""
+        inline = []
+        heavy_busy = any(self.costs[n] == HEAVY for n in self._running)
+        for name, ttl in self.ttls.items():
+            if name in self._running or now - self._started.get(name, -ttl) < ttl:
+                continue
+            cost = self.costs[name]
+            if cost == HEAVY:
+                if heavy_busy and name in self._results:
+                    continue  # it has a value to serve meanwhile; wait its turn
+                heavy_busy = True
+            self._started[name] = now
+            done = self._start(name, thread=cost != CHEAP)
+            if cost == CHEAP:
+                inline.append((name, done))
+        return inline
+
+    def _refresh(self) -> dict:
+        with self._lock:
+            inline = self._due(time.monotonic())
+            running = dict(self._running)
+        for name, done in inline:
+            self._call(name, done)
+        return running
+
+    def get(self, names=None) -> dict:
+        started = time.monotonic()
+        names = list(names or self.fns)
+        running = self._refresh()
+        end = started + self.deadline
+        for name in names:
+            if name not in self._results and name in running:
+                running[name].wait(max(0.0, end - time.monotonic()))
+        return self._report(names, started,
+                            lambda name, now: now - self.ttls[name] - self.deadline)
+
+    def next_due(self) -> float:
+        """Seconds until the next field's TTL runs out."""
+        now = time.monotonic()
+        with self._lock:
+            waits = [self._started.get(name, now) + ttl - now
+                     for name, ttl in self.ttls.items() if name not in self._running]
+        return max(0.0, min(waits, default=self.deadline))
+
+    def serve(self, stop: threading.Event, min_wait: float = 0.5):
+        """Scheduler loop: refresh each field as its TTL runs out until `stop` is set."""
+        while not stop.is_set():
+            self._refresh()
+            stop.wait(max(min_wait, self.next_due()))
+
+
+# ─── BRIDGE SOCKET ────────────────────────────────────────────────────────────
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client over a Unix socket, e.g. the bridge's BRIDGE_SOCKET."""
+    def __init__(self, path: str, timeout: float = 10):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
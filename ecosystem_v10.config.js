@@ -6,6 +6,8 @@ module.exports = {
       args: "bridge_v10.py",
       autorestart: true,
       max_memory_restart: "200M",
+      // SIGTERM drains for DRAIN_SEC (30 s) before exiting; keep this above it
+      kill_timeout: 35000,
       env: {
         PYTHONUNBUFFERED: "1"
       }
@@ -2,7 +2,7 @@
 """
 TCC Health Monitor
 Kael the God Builder Edition
-- Checks bridge on localhost:8765/health
+- Checks bridge on its Unix socket (~/tcc/bridge.sock), else localhost:8765/health
 - Checks bridge on zenith.cosmic-claw.com/health
 - Restarts PM2 if down
 - Alerts via ntfy tcc-zenith-hive
@@ -13,8 +13,11 @@ import json, os, sys, subprocess, time, socket
 from urllib.request import urlopen, Request
 from urllib.error   import URLError, HTTPError
 
+from collectors import UnixHTTPConnection
+
 # ─── CONFIG ───────────────────────────────────────────────────────────────────
 LOCAL_URL    = "http://localhost:8765/health"
+LOCAL_SOCKET = os.path.expanduser(os.environ.get("BRIDGE_SOCKET", "~/tcc/bridge.sock"))
 REMOTE_URL   = "https://zenith.cosmic-claw.com/health"
 NTFY_TOPIC   = "tcc-zenith-hive"
 DEVICE_ID    = os.environ.get("DEVICE_ID", socket.gethostname())
@@ -68,6 +71,23 @@ def check_endpoint(url: str) -> dict:
         return {"ok": False, "status_code": None, "body": "", "error": str(e)}
 
 
+def check_local() -> dict:
+    """Like check_endpoint(LOCAL_URL), but over the Unix socket when it exists."""
+    if not os.path.exists(LOCAL_SOCKET):
+        return check_endpoint(LOCAL_URL)
+    conn = UnixHTTPConnection(LOCAL_SOCKET, timeout=TIMEOUT)
+    try:
+        conn.request("GET", "/health")
+        resp = conn.getresponse()
+        body = resp.read(512).decode("utf-8", errors="replace")
+        return {"ok": resp.status == 200, "status_code": resp.status, "body": body, "error": None}
+    except Exception as e:
+        _log(f"[local] unix socket failed ({e}); trying {LOCAL_URL}")
+        return check_endpoint(LOCAL_URL)
+    finally:
+        conn.close()
+
+
 def read_flag() -> int:
     """Read consecutive failure count from flag file."""
     try:
@@ -122,7 +142,7 @@ def restart_all_pm2() -> bool:
 def main():
     _log("=== TCC Health Monitor run ===")
 
-    local  = check_endpoint(LOCAL_URL)
+    local  = check_local()
     remote = check_endpoint(REMOTE_URL)
 
     _log(f"[local]  ok={local['ok']}  status={local['status_code']}  err={local['error']}")
@@ -143,7 +163,7 @@ def main():
         ok = restart_pm2("tcc-bridge")
         if ok:
             time.sleep(8)  # give it time to come up
-            recheck = check_endpoint(LOCAL_URL)
+            recheck = check_local()
             if recheck["ok"]:
                 _log("[health] Bridge recovered after restart.")
                 ntfy(
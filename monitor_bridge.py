@@ -1,8 +1,24 @@
 
-import time, requests, json, os
+import time, requests, json, os, http.client
+
+from collectors import UnixHTTPConnection
 
 NTFY_URL = "https://ntfy.sh/tcc-zenith-hive"
 HEALTH_URL = "http://localhost:8080/health"
+HEALTH_SOCKET = os.path.expanduser(os.environ.get("BRIDGE_SOCKET", "~/tcc/bridge.sock"))
+
+def health_status():
+    """HTTP status of /health, over the Unix socket when it exists."""
+    if os.path.exists(HEALTH_SOCKET):
+        conn = UnixHTTPConnection(HEALTH_SOCKET, timeout=5)
+        try:
+            conn.request("GET", "/health")
+            return conn.getresponse().status
+        except (OSError, http.client.HTTPException):
+            pass  # a bad reply on the socket; ask over TCP
+        finally:
+            conn.close()
+    return requests.get(HEALTH_URL, timeout=5).status_code
 
 def alert(msg, priority=5):
     try:
@@ -17,14 +33,14 @@ last_status = True
 
 while True:
     try:
-        resp = requests.get(HEALTH_URL, timeout=5)
-        if resp.status_code == 200:
+        status = health_status()
+        if status == 200:
             if not last_status:
                 alert("Bridge RECOVERED", priority=3)
                 last_status = True
         else:
             if last_status:
-                alert(f"Bridge unhealthy (Status: {resp.status_code})")
+                alert(f"Bridge unhealthy (Status: {status})")
                 last_status = False
     except Exception as e:
         if last_status:
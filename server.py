@@ -3,8 +3,9 @@
 TCC Bridge — Creator Mode Server
 Ghost Protocol: Auth-gated, stealth 404s, no fingerprints.
 """
-from flask import Flask, send_file, request, jsonify, Response
-import logging, os, time
+from flask import Flask, request, jsonify, Response
+from werkzeug.wsgi import FileWrapper
+import gzip, hashlib, logging, mimetypes, os, ssl, threading, time
 
 app = Flask(__name__)
 
@@ -32,8 +33,14 @@ FAKE_403 = """<html>
 
 AUTH_KEY = os.environ.get("BRIDGE_AUTH", "amos-bridge-2026")
 
-def ghost_response(body, status=404, content_type="text/html"):
+# Ghost bodies are encoded once; each hit only wraps them in a Response
+GHOST_BODIES = {404: FAKE_404.encode(), 403: FAKE_403.encode()}
+GHOST_HEADERS = {"Server": FAKE_SERVER, "Content-Type": "text/html"}  # as nginx sends it
+
+def ghost_response(body=None, status=404, content_type="text/html"):
     """Return a response that looks like nginx, not Flask."""
+    if body is None:
+        return Response(GHOST_BODIES[status], status=status, headers=GHOST_HEADERS)
     r = Response(body, status=status, content_type=content_type)
     r.headers["Server"] = FAKE_SERVER
     r.headers.pop("X-Powered-By", None)
@@ -43,49 +50,137 @@ def check_auth():
     """Verify X-Auth header. Returns True if authorized."""
     return request.headers.get("X-Auth") == AUTH_KEY
 
+# ── Asset cache: read once, re-read when mtime or size changes ──
+SENDFILE_MIN = 256 * 1024    # bigger binaries stay on disk and go out via sendfile
+CACHE_CONTROL = {"text/html": "no-cache",                  # always revalidate (304)
+                 "image/": "private, max-age=604800"}     # a week; private: auth-gated
+
+class Asset:
+    """One file's cached bytes, gzip variant and strong ETag."""
+
+    def __init__(self, path, st):
+        self.path     = path
+        self.stamp    = (st.st_mtime_ns, st.st_size)
+        self.size     = st.st_size
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.cache    = next((v for k, v in CACHE_CONTROL.items()
+                              if self.mimetype.startswith(k)), "no-cache")
+        digest = hashlib.blake2b(digest_size=12)
+        if self.size >= SENDFILE_MIN and not self.mimetype.startswith("text/"):
+            self.body = None
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(block)
+        else:
+            with open(path, "rb") as f:
+                self.body = f.read()
+            digest.update(self.body)
+        self.etag = digest.hexdigest()
+        self.gz = None
+        if self.mimetype.startswith("text/") and self.body:
+            gz = gzip.compress(self.body, 9, mtime=0)
+            if len(gz) < len(self.body):
+                self.gz = gz
+
+_assets = {}
+_assets_lock = threading.Lock()
+
+def load_asset(name):
+    """Cached Asset for `name` (relative to this file), or None if unreadable."""
+    path = os.path.join(app.root_path, name)
+    try:
+        st = os.stat(path)
+        asset = _assets.get(path)
+        if asset is None or asset.stamp != (st.st_mtime_ns, st.st_size):
+            with _assets_lock:
+                asset = _assets[path] = Asset(path, st)
+        return asset
+    except OSError:
+        return None
+
+def _etag_matches(etag):
+    header = request.headers.get("If-None-Match", "")
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return any(t.removeprefix("W/") == etag for t in tags)
+
+def _sendfile_body(path, size):
+    """Body iterator that hands the file to the kernel where the server allows it."""
+    f = open(path, "rb")
+    sock = request.environ.get("werkzeug.socket")
+    if sock is None or isinstance(sock, ssl.SSLSocket):
+        # gunicorn & co implement wsgi.file_wrapper with sendfile themselves
+        return request.environ.get("wsgi.file_wrapper", FileWrapper)(f)
+
+    def stream():
+        try:
+            yield b""  # the dev server sends the status line and headers here
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(sock.fileno(), f.fileno(), offset, size - offset)
+                if not sent:
+                    break
+                offset += sent
+        finally:
+            f.close()
+    return stream()
+
+def serve_asset(name):
+    """Serve a cached file: 304 on a matching ETag, gzip when accepted."""
+    asset = load_asset(name)
+    if asset is None:
+        return ghost_response(status=404)
+    headers = {"Cache-Control": asset.cache}
+    body, etag = asset.body, '"%s"' % asset.etag
+    if asset.gz is not None:
+        headers["Vary"] = "Accept-Encoding"
+        if request.accept_encodings["gzip"]:
+            body, etag = asset.gz, '"%s-gz"' % asset.etag
+            headers["Content-Encoding"] = "gzip"
+    headers["ETag"] = etag
+    if _etag_matches(etag):
+        return Response(status=304, headers=headers)
+    if body is None:
+        headers["Content-Length"] = str(asset.size)
+        return Response(_sendfile_body(asset.path, asset.size), mimetype=asset.mimetype,
+                        headers=headers, direct_passthrough=True)
+    return Response(body, mimetype=asset.mimetype, headers=headers)
+
 # ── Routes ──
 
 @app.route("/")
 def home():
     if not check_auth():
-        return ghost_response(FAKE_404, 404)
-    try:
-        return send_file("index.html")
-    except:
-        return ghost_response(FAKE_404, 404)
+        return ghost_response(status=404)
+    return serve_asset("index.html")
 
 @app.route("/voice")
 def voice():
     if not check_auth():
-        return ghost_response(FAKE_404, 404)
-    try:
-        return send_file("voice.html")
-    except:
-        return ghost_response(FAKE_404, 404)
+        return ghost_response(status=404)
+    return serve_asset("voice.html")
 
 @app.route("/health")
 def health():
     if not check_auth():
-        return ghost_response(FAKE_404, 404)
+        return ghost_response(status=404)
     return jsonify({"status": "ok", "version": "4.0"})
 
 @app.route("/proof.jpg")
 def proof():
     if not check_auth():
-        return ghost_response(FAKE_403, 403)
-    try:
-        return send_file("proof.jpg", mimetype="image/jpeg")
-    except:
-        return ghost_response(FAKE_404, 404)
+        return ghost_response(status=403)
+    return serve_asset("proof.jpg")
 
 # ── Catch-all: Everything else is dead nginx ──
 @app.errorhandler(404)
 def not_found(e):
-    return ghost_response(FAKE_404, 404)
+    return ghost_response(status=404)
 
 @app.errorhandler(405)
 def method_not_allowed(e):
-    return ghost_response(FAKE_404, 404)
+    return ghost_response(status=404)
 
 if __name__ == "__main__":
     print("[GHOST] Bridge online. Port 5000. Auth required.")
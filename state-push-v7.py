@@ -10,7 +10,11 @@ as a belt-and-suspenders backup to the bridge's internal ReportThread.
 This ensures Supabase is always updated even if the bridge's internal
 reporting stalls due to network issues or thread deadlock.
 
+Talks to the bridge over its Unix socket (~/tcc/bridge.sock) when present,
+falling back to TCP loopback.
+
 Environment variables:
+  BRIDGE_SOCKET       (default: ~/tcc/bridge.sock)
   BRIDGE_PORT         (default: 8080)
   BRIDGE_AUTH         (default: amos-bridge-2026)
   STATE_PUSH_INTERVAL (default: 300 — seconds between pushes)
@@ -21,14 +25,18 @@ import os
 import sys
 import logging
 import traceback
+import http.client
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 
+from collectors import UnixHTTPConnection
+
 # ── Config ──────────────────────────────────────────────────────────────────
 PORT     = os.environ.get("BRIDGE_PORT", "8080")
 AUTH     = os.environ.get("BRIDGE_AUTH", "amos-bridge-2026")
 INTERVAL = int(os.environ.get("STATE_PUSH_INTERVAL", "300"))  # seconds
 URL      = f"http://localhost:{PORT}/push_state"
+SOCKET   = os.path.expanduser(os.environ.get("BRIDGE_SOCKET", "~/tcc/bridge.sock"))
 
 MAX_RETRIES   = 4
 RETRY_BACKOFF = [5, 15, 30, 60]
@@ -44,36 +52,64 @@ logging.basicConfig(
 log = logging.getLogger("tcc.state-push")
 
 
+def push_state_unix():
+    """POST /push_state over the Unix socket. Returns the HTTP status, or None
+    if the socket is missing or unreachable (caller falls back to TCP)."""
+    if not os.path.exists(SOCKET):
+        return None
+    conn = UnixHTTPConnection(SOCKET, timeout=20)
+    try:
+        conn.request("POST", "/push_state", body=b'{"source":"state-push-daemon"}',
+                     headers={"Content-Type": "application/json",
+                              "User-Agent":   "TCC-StatePush/7.0"})
+        resp = conn.getresponse()
+        body = resp.read().decode("utf-8", errors="replace")
+        log.info("State push (unix) — HTTP %d | %s", resp.status, body[:120])
+        return resp.status
+    except (OSError, http.client.HTTPException) as exc:
+        log.warning("Unix socket %s unreachable (%s); using TCP.", SOCKET, exc)
+        return None
+    finally:
+        conn.close()
+
+
 def push_state() -> bool:
     """POST to /push_state on the bridge. Returns True on success."""
     for attempt in range(MAX_RETRIES):
-        try:
-            req = Request(
-                URL,
-                data=b'{"source":"state-push-daemon"}',
-                method="POST"
-            )
-            req.add_header("Authorization", AUTH)
-            req.add_header("Content-Type",  "application/json")
-            req.add_header("User-Agent",     "TCC-StatePush/7.0")
-            with urlopen(req, timeout=20) as resp:
-                body = resp.read().decode("utf-8", errors="replace")
-                log.info("State push OK — HTTP %d | %s", resp.status, body[:120])
-                return True
-        except HTTPError as exc:
-            log.warning("State push HTTP error (attempt %d/%d): %d %s",
-                        attempt + 1, MAX_RETRIES, exc.code, exc.reason)
-            # 401/403 — auth error, no point retrying
-            if exc.code in (401, 403):
-                log.error("Auth error — check BRIDGE_AUTH env var.")
-                return False
-        except URLError as exc:
-            log.warning("State push URLError (attempt %d/%d): %s",
-                        attempt + 1, MAX_RETRIES, exc.reason)
-        except Exception:
-            log.error("State push unexpected error (attempt %d/%d): %s",
-                      attempt + 1, MAX_RETRIES, traceback.format_exc())
-            return False  # don't retry unexpected errors
+        status = push_state_unix()
+        if status == 200:
+            return True
+        if status is not None:
+            log.warning("State push HTTP error over unix (attempt %d/%d): %d",
+                        attempt + 1, MAX_RETRIES, status)
+        else:
+            try:
+                req = Request(
+                    URL,
+                    data=b'{"source":"state-push-daemon"}',
+                    method="POST"
+                )
+                req.add_header("Authorization", AUTH)
+                req.add_header("Content-Type",  "application/json")
+                req.add_header("User-Agent",     "TCC-StatePush/7.0")
+                with urlopen(req, timeout=20) as resp:
+                    body = resp.read().decode("utf-8", errors="replace")
+                    log.info("State push OK — HTTP %d | %s", resp.status, body[:120])
+                    return True
+            except HTTPError as exc:
+                log.warning("State push HTTP error (attempt %d/%d): %d %s",
+                            attempt + 1, MAX_RETRIES, exc.code, exc.reason)
+                # 401/403 — auth error, no point retrying
+                if exc.code in (401, 403):
+                    log.error("Auth error — check BRIDGE_AUTH env var.")
+                    return False
+            except URLError as exc:
+                log.warning("State push URLError (attempt %d/%d): %s",
+                            attempt + 1, MAX_RETRIES, exc.reason)
+            except Exception:
+                log.error("State push unexpected error (attempt %d/%d): %s",
+                          attempt + 1, MAX_RETRIES, traceback.format_exc())
+                return False  # don't retry unexpected errors
 
         if attempt < MAX_RETRIES - 1:
             wait = RETRY_BACKOFF[attempt]
@@ -87,7 +123,7 @@ def push_state() -> bool:
 def main():
     log.info("========================================")
     log.info("TCC State Push Daemon v7.0 starting.")
-    log.info("  Target   : %s", URL)
+    log.info("  Target   : unix:%s, else %s", SOCKET, URL)
     log.info("  Interval : %ds", INTERVAL)
     log.info("  Auth     : %s...", AUTH[:8])
     log.info("========================================")
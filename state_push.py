@@ -10,6 +10,9 @@ Kael the God Builder Edition
 import json, os, sys, subprocess, time, socket, traceback
 from urllib.request import urlopen, Request
 from urllib.error   import URLError, HTTPError
+from urllib.parse   import quote
+
+import collectors
 
 # ─── CONFIG ───────────────────────────────────────────────────────────────────
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://vbqbbziqleymxcyesmky.supabase.co")
@@ -17,8 +20,16 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "sb_secret_lIbl-DBgdnrt_fejgJjKqg_
 NTFY_HIVE    = os.environ.get("NTFY_HIVE",    "tcc-zenith-hive")
 DEVICE_ID    = os.environ.get("DEVICE_ID",    socket.gethostname())
 BRIDGE_PORT  = int(os.environ.get("PORT",     8765))
-TIMEOUT      = 12   # seconds
+BRIDGE_SOCK  = os.path.expanduser(os.environ.get("BRIDGE_SOCKET", "~/tcc/bridge.sock"))
+TIMEOUT      = 12   # seconds, per termux-api call
+DEADLINE     = 15   # seconds for all collectors together (they run in parallel)
 LOG_FILE     = os.path.expanduser("~/tcc-state-push.log")
+# Delta pushes: the last row Supabase acknowledged lives in ACKED_FILE, and a
+# run whose only changes are VOLATILE columns pushes nothing unless KEEPALIVE
+# seconds have passed since the last push went out
+ACKED_FILE   = os.path.expanduser("~/.tcc-state-push-acked.json")
+KEEPALIVE    = int(os.environ.get("STATE_KEEPALIVE_SEC", 900))
+VOLATILE     = ("last_seen", "timestamp", "bridge_uptime_sec")
 
 # ─── LOGGING ──────────────────────────────────────────────────────────────────
 def _log(msg: str):
@@ -103,7 +114,16 @@ def get_location() -> dict:
 
 
 def get_bridge_uptime() -> float:
-    """Check local bridge and extract uptime from /health."""
+    """Check local bridge and extract uptime from /health (Unix socket first)."""
+    if os.path.exists(BRIDGE_SOCK):
+        conn = collectors.UnixHTTPConnection(BRIDGE_SOCK, timeout=4)
+        try:
+            conn.request("GET", "/health")
+            return json.loads(conn.getresponse().read()).get("uptime", -1)
+        except Exception:
+            pass  # fall back to TCP
+        finally:
+            conn.close()
     try:
         req = Request(f"http://localhost:{BRIDGE_PORT}/health")
         with urlopen(req, timeout=4) as resp:
@@ -136,6 +156,87 @@ def supabase_upsert(table: str, payload: dict) -> bool:
     return False
 
 
+def supabase_patch(table: str, match: str, payload: dict):
+    """PATCH the rows matching `match`; their keys ([] if none), or None on error."""
+    column = match.split("=", 1)[0]
+    try:
+        url  = f"{SUPABASE_URL}/rest/v1/{table}?{match}&select={column}"
+        body = json.dumps(payload).encode("utf-8")
+        req  = Request(url, data=body, method="PATCH")
+        req.add_header("apikey",        SUPABASE_KEY)
+        req.add_header("Authorization", f"Bearer {SUPABASE_KEY}")
+        req.add_header("Content-Type",  "application/json")
+        req.add_header("Prefer",        "return=representation")
+        with urlopen(req, timeout=TIMEOUT) as resp:
+            _log(f"[supabase] Patch to '{table}' -> HTTP {resp.status}")
+            return json.loads(resp.read() or b"[]")
+    except HTTPError as e:
+        _log(f"[supabase] HTTPError {e.code}: {e.read()[:200]}")
+    except URLError as e:
+        _log(f"[supabase] URLError: {e.reason}")
+    except Exception as e:
+        _log(f"[supabase] Error: {e}")
+    return None
+
+
+# ─── DELTA PUSH ───────────────────────────────────────────────────────────────
+def _load_acked() -> dict:
+    try:
+        with open(ACKED_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_acked(acked: dict):
+    tmp = ACKED_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(acked, f)
+    os.replace(tmp, ACKED_FILE)
+
+
+def push_state(state: dict) -> bool:
+    """Upsert `state` the first time, then PATCH only the columns that changed
+    since the last acknowledged push. A failed push forgets the acknowledged
+    row so the next run sends it whole."""
+    acked = _load_acked()
+    last  = acked.get("state")
+    size  = len(json.dumps(state))
+    if last:
+        changed = {k: v for k, v in state.items() if last.get(k) != v}
+        volatile_only = set(changed) <= set(VOLATILE)
+        if volatile_only and time.time() - acked.get("sent_at", 0) < KEEPALIVE:
+            acked["saved_requests"] = acked.get("saved_requests", 0) + 1
+            acked["saved_bytes"]    = acked.get("saved_bytes", 0) + size
+            _save_acked(acked)
+            _log(f"[state] Unchanged since last push; skipped ({acked['saved_requests']} "
+                 f"requests, {acked['saved_bytes']} bytes saved so far).")
+            return True
+        if not changed:  # keepalive: refresh the timestamps at least
+            changed = {k: state[k] for k in VOLATILE if k in state}
+        rows = supabase_patch("device_state", f"device_id=eq.{quote(str(state['device_id']))}",
+                              changed)
+        if rows:
+            acked["state"]       = dict(last, **changed)
+            acked["sent_at"]     = time.time()
+            acked["saved_bytes"] = acked.get("saved_bytes", 0) + size - len(json.dumps(changed))
+            _save_acked(acked)
+            _log(f"[state] Patched {len(changed)}/{len(state)} columns: {sorted(changed)}")
+            return True
+        if rows is None:
+            _save_acked({k: v for k, v in acked.items() if k != "state"})
+            return False
+        _log("[state] Row not found; pushing it whole.")
+    _log(f"[state] Pushing {len(state)} fields to Supabase.")
+    ok = supabase_upsert("device_state", state)
+    if ok:
+        acked.update(state=state, sent_at=time.time())
+    else:
+        acked.pop("state", None)
+    _save_acked(acked)
+    return ok
+
+
 # ─── NTFY ALERT ───────────────────────────────────────────────────────────────
 def ntfy_alert(title: str, msg: str, priority: str = "high"):
     try:
@@ -162,56 +263,41 @@ def main() -> int:
         "timestamp": int(time.time()),
     }
 
-    # Battery
-    try:
-        state.update(get_battery())
-        _log(f"[battery] {state.get('battery_pct')}% {state.get('battery_status')}")
-    except Exception as e:
-        _log(f"[battery] Error: {e}")
-
-    # WiFi
-    try:
-        state.update(get_wifi())
-        _log(f"[wifi] SSID={state.get('wifi_ssid')} RSSI={state.get('wifi_rssi')}")
-    except Exception as e:
-        _log(f"[wifi] Error: {e}")
-
-    # Network / SIM
-    try:
-        state.update(get_network_type())
-        _log(f"[network] op={state.get('network_operator')} type={state.get('network_type')}")
-    except Exception as e:
-        _log(f"[network] Error: {e}")
-
-    # Signal
-    try:
-        state.update(get_signal_strength())
-        _log(f"[signal] dbm={state.get('signal_dbm')} level={state.get('signal_level')}")
-    except Exception as e:
-        _log(f"[signal] Error: {e}")
-
-    # Location (best-effort, may be None if denied)
-    try:
-        state.update(get_location())
-        _log(f"[location] lat={state.get('lat')} lon={state.get('lon')}")
-    except Exception as e:
-        _log(f"[location] Error: {e}")
+    # Every collector at once; whatever is not back by DEADLINE is left out
+    collector = collectors.Collector({
+        "battery":  get_battery,
+        "wifi":     get_wifi,
+        "network":  get_network_type,
+        "signal":   get_signal_strength,
+        "location": get_location,    # best-effort, may be None if denied
+        "bridge":   get_bridge_uptime,
+    }, DEADLINE)
+    report = collector.run()
+    values = report["values"]
+    for name in ("battery", "wifi", "network", "signal", "location"):
+        state.update(values.get(name, {}))
+
+    _log(f"[battery] {state.get('battery_pct')}% {state.get('battery_status')}")
+    _log(f"[wifi] SSID={state.get('wifi_ssid')} RSSI={state.get('wifi_rssi')}")
+    _log(f"[network] op={state.get('network_operator')} type={state.get('network_type')}")
+    _log(f"[signal] dbm={state.get('signal_dbm')} level={state.get('signal_level')}")
+    _log(f"[location] lat={state.get('lat')} lon={state.get('lon')}")
 
     # Bridge uptime
-    try:
-        uptime = get_bridge_uptime()
-        state["bridge_uptime_sec"] = uptime
-        state["bridge_online"]     = uptime >= 0
-        _log(f"[bridge] uptime={uptime}s online={state['bridge_online']}")
-    except Exception as e:
-        _log(f"[bridge] Error: {e}")
-        state["bridge_online"] = False
+    uptime = values.get("bridge", -1)
+    state["bridge_uptime_sec"] = uptime
+    state["bridge_online"]     = uptime >= 0
+    _log(f"[bridge] uptime={uptime}s online={state['bridge_online']}")
+
+    for name in report["missing"]:
+        reason = collector.errors.get(name, f"no result within {DEADLINE}s")
+        _log(f"[{name}] Missing: {reason}")
+    _log(f"[collect] {len(values)}/{len(collector.fns)} collectors in {report['elapsed']}s")
 
     # Remove None values to avoid Supabase type errors on non-nullable cols
     clean_state = {k: v for k, v in state.items() if v is not None}
 
-    _log(f"[state] Pushing {len(clean_state)} fields to Supabase.")
-    ok = supabase_upsert("device_state", clean_state)
+    ok = push_state(clean_state)
 
     if not ok:
         _log("[state] Supabase push FAILED.")
@@ -2,6 +2,8 @@
 import os, json, subprocess, time
 from urllib.request import urlopen, Request
 
+import collectors
+
 URL = "https://vbqbbziqleymxcyesmky.supabase.co/rest/v1/device_state"
 KEY = "sb_secret_lIbl-DBgdnrt_fejgJjKqg_qR62SVEm"
 
@@ -11,14 +13,14 @@ def get_state():
         batt = json.loads(subprocess.check_output("termux-battery-status", shell=True))
         # Get network
         net = subprocess.check_output("termux-telephony-deviceinfo", shell=True).decode()
-        # Get storage
-        storage = subprocess.check_output("df -h /data", shell=True).decode()
+        # Get storage (statvfs, in MB)
+        storage = collectors.disk_usage("/data")
         
         return {
             "device_id": "amos-arms",
             "battery": batt.get("percentage"),
             "network": net,
-            "storage": {"raw": storage},
+            "storage": storage,
             "hostname": subprocess.check_output("hostname", shell=True).decode().strip(),
             "termux_version": os.environ.get("TERMUX_VERSION", "unknown"),
             "raw_output": f"Battery: {batt.get('status')}, {batt.get('percentage')}%"
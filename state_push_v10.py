@@ -4,6 +4,8 @@ import os, json, time, subprocess, logging
 from urllib.request import Request, urlopen
 from datetime import datetime, timezone
 
+import collectors
+
 SUPABASE_URL = "https://vbqbbziqleymxcyesmky.supabase.co"
 SUPABASE_KEY = "sb_secret_lIbl-DBgdnrt_fejgJjKqg_qR62SVEm" # Service role key
 DEVICE_ID = "amos-arms"
@@ -21,6 +23,12 @@ def get_battery():
     except:
         return 0
 
+def get_uptime():
+    up, load = collectors.uptime(), collectors.loadavg()
+    if up is None:
+        return "unknown"
+    return f"{int(up // 86400)}d {int(up % 86400 // 3600)}h, load {load.get('1m')}"
+
 def push_state():
     try:
         data = {
@@ -31,7 +39,7 @@ def push_state():
             "hostname": get_cmd("hostname"),
             "network": get_cmd("termux-wifi-connectioninfo | grep ssid | cut -d: -f2") or "mobile",
             "timestamp": datetime.now(timezone.utc).isoformat(),
-            "raw_output": f"Uptime: {get_cmd('uptime')}"
+            "raw_output": f"Uptime: {get_uptime()}"
         }
         
         req = Request(f"{SUPABASE_URL}/rest/v1/device_state", 
@@ -0,0 +1,265 @@
+"""
+TCC on-device time-series store — device samples that outlive restarts and outages.
+
+One SQLite database in WAL mode, written by a single process (the bridge's
+leader). Samples are buffered in memory and written a batch at a time:
+
+  raw        every sample as taken               (ts, series, value)
+  rollup_1m  count/sum/min/max per series-minute (bucket, series, ...)
+  rollup_1h  the same per series-hour
+  outbox     JSON rows meant for Supabase that could not be sent (heartbeats)
+
+Each table has its own retention. Everything is append-only apart from
+retention; an uploader reads a stream oldest first in batches past its cursor,
+and moves the cursor (kept in the database, so a restart resumes where it
+stopped) only once Supabase has accepted the batch.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Table names, also the keys of Store's retention
+RAW    = "raw"
+MINUTE = "rollup_1m"
+HOUR   = "rollup_1h"
+OUTBOX = "outbox"
+
+_WIDTHS = {MINUTE: 60, HOUR: 3600}  # rollup bucket width in seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS raw (
+    ts     REAL    NOT NULL,
+    series INTEGER NOT NULL,
+    value  REAL    NOT NULL,
+    PRIMARY KEY (ts, series)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1m (
+    bucket INTEGER NOT NULL,
+    series INTEGER NOT NULL,
+    n      INTEGER NOT NULL,
+    total  REAL    NOT NULL,
+    lo     REAL    NOT NULL,
+    hi     REAL    NOT NULL,
+    PRIMARY KEY (bucket, series)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1h (
+    bucket INTEGER NOT NULL,
+    series INTEGER NOT NULL,
+    n      INTEGER NOT NULL,
+    total  REAL    NOT NULL,
+    lo     REAL    NOT NULL,
+    hi     REAL    NOT NULL,
+    PRIMARY KEY (bucket, series)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS outbox (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    stream  TEXT    NOT NULL,
+    ts      REAL    NOT NULL,
+    payload TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    stream   TEXT PRIMARY KEY,
+    position TEXT NOT NULL
+);
+"""
+
+# Merge a batch's partial rollup into what the table already holds
+_MERGE = """
+INSERT INTO {table} (bucket, series, n, total, lo, hi) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (bucket, series) DO UPDATE SET
+    n     = n + excluded.n,
+    total = total + excluded.total,
+    lo    = min(lo, excluded.lo),
+    hi    = max(hi, excluded.hi)
+"""
+
+
+class Store:
+    """The time-series database at `path`.
+
+    add() queues a sample and writes the queue out (raw rows plus merged
+    rollups, one transaction) once `flush_sec` have passed; flush() forces
+    it. `retention` maps RAW, MINUTE, HOUR and OUTBOX to seconds kept, and
+    prune() applies it. The connection is opened on first use, so a Store
+    built before a fork is only ever opened by the process that uses it.
+    """
+
+    def __init__(self, path: str, retention: dict, flush_sec: float):
+        self.path       = path
+        self.retention  = dict(retention)
+        self.flush_sec  = flush_sec
+        self.flushed_to = 0.0   # time.time() before which every add() is on disk
+        self._lock      = threading.Lock()
+        self._conn      = None
+        self._pid       = None
+        self._series    = {}    # name -> id
+        self._pending   = []    # (ts, name, value) not yet written
+        self._pending_since = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Caller holds self._lock
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; only a power cut loses the tail
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid, self._series = conn, os.getpid(), {}
+        return self._conn
+
+    def _series_id(self, db: sqlite3.Connection, name: str) -> int:
+        sid = self._series.get(name)
+        if sid is None:
+            db.execute("INSERT OR IGNORE INTO series (name) VALUES (?)", (name,))
+            sid = self._series[name] = db.execute(
+                "SELECT id FROM series WHERE name = ?", (name,)).fetchone()[0]
+        return sid
+
+    # ─── SAMPLES ──────────────────────────────────────────────────────────────
+    def add(self, ts: float, values: dict):
+        """Queue one sample of each series in `values`; None, NaN and anything
+        not a number are left out."""
+        with self._lock:
+            for name, value in values.items():
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if math.isfinite(value):
+                    self._pending.append((ts, name, value))
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            due = time.monotonic() - self._pending_since >= self.flush_sec
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending, self._pending_since = self._pending, [], None
+            upto = time.time()
+            if rows:
+                db = self._db()
+                raw, rollups = [], {table: {} for table in _WIDTHS}
+                with db:
+                    for ts, name, value in rows:
+                        sid = self._series_id(db, name)
+                        raw.append((ts, sid, value))
+                        for table, width in _WIDTHS.items():
+                            key = (int(ts // width) * width, sid)
+                            r = rollups[table].get(key)
+                            if r is None:
+                                rollups[table][key] = [1, value, value, value]
+                            else:
+                                r[0] += 1
+                                r[1] += value
+                                r[2] = min(r[2], value)
+                                r[3] = max(r[3], value)
+                    db.executemany("INSERT OR REPLACE INTO raw (ts, series, value) VALUES (?, ?, ?)", raw)
+                    for table, buckets in rollups.items():
+                        db.executemany(_MERGE.format(table=table),
+                                       [(*key, *r) for key, r in buckets.items()])
+            self.flushed_to = upto
+
+    # ─── OUTBOX ───────────────────────────────────────────────────────────────
+    def append(self, stream: str, row: dict, ts: float = None):
+        """Keep `row` for upload on `stream`; written at once, not queued."""
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("INSERT INTO outbox (stream, ts, payload) VALUES (?, ?, ?)",
+                           (stream, time.time() if ts is None else ts,
+                            json.dumps(row, default=str)))
+
+    # ─── UPLOAD CURSORS ───────────────────────────────────────────────────────
+    def _cursor(self, db: sqlite3.Connection, stream: str, default):
+        row = db.execute("SELECT position FROM cursors WHERE stream = ?", (stream,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def advance(self, stream: str, position):
+        """Record that `stream` has been uploaded up to `position`, as
+        returned with the batch."""
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("INSERT OR REPLACE INTO cursors (stream, position) VALUES (?, ?)",
+                           (stream, json.dumps(position)))
+
+    def outbox_batch(self, stream: str, limit: int):
+        """Up to `limit` of `stream`'s outbox rows past its cursor, oldest
+        first, and the position to advance() to once they are uploaded."""
+        with self._lock:
+            db = self._db()
+            after = self._cursor(db, stream, 0)
+            rows = db.execute("SELECT id, payload FROM outbox WHERE stream = ? AND id > ? "
+                              "ORDER BY id LIMIT ?", (stream, after, limit)).fetchall()
+        return [json.loads(payload) for _, payload in rows], rows[-1][0] if rows else after
+
+    def rollup_batch(self, table: str, limit: int, stream: str = None):
+        """Up to `limit` closed buckets of `table` (MINUTE or HOUR) past the
+        cursor of `stream` (default: the table name), oldest first, as dicts
+        with bucket, metric, step, n, min, max and avg; plus the position to
+        advance() to. A bucket is closed once every sample in it is on disk."""
+        stream, width = stream or table, _WIDTHS[table]
+        with self._lock:
+            db = self._db()
+            bucket, series = self._cursor(db, stream, [0, 0])
+            rows = db.execute(
+                f"SELECT r.bucket, r.series, s.name, r.n, r.total, r.lo, r.hi "
+                f"FROM {table} r JOIN series s ON s.id = r.series "
+                f"WHERE (r.bucket, r.series) > (?, ?) AND r.bucket + ? <= ? "
+                f"ORDER BY r.bucket, r.series LIMIT ?",
+                (bucket, series, width, self.flushed_to, limit)).fetchall()
+        out = [{"bucket": b, "metric": name, "step": width, "n": n,
+                "min": lo, "max": hi, "avg": total / n}
+               for b, _, name, n, total, lo, hi in rows]
+        return out, [rows[-1][0], rows[-1][1]] if rows else [bucket, series]
+
+    def backlog(self, tables: tuple = (MINUTE,)) -> dict:
+        """Rows waiting past each cursor: every outbox stream and the rollup
+        `tables` uploaded, {stream: count}; {} if the database can't be read."""
+        try:
+            with self._lock:
+                db = self._db()
+                out = {}
+                for (stream,) in db.execute("SELECT DISTINCT stream FROM outbox").fetchall():
+                    after = self._cursor(db, stream, 0)
+                    out[stream] = db.execute("SELECT count(*) FROM outbox WHERE stream = ? "
+                                             "AND id > ?", (stream, after)).fetchone()[0]
+                for table in tables:
+                    bucket, series = self._cursor(db, table, [0, 0])
+                    out[table] = db.execute(f"SELECT count(*) FROM {table} "
+                                            f"WHERE (bucket, series) > (?, ?)",
+                                            (bucket, series)).fetchone()[0]
+                return out
+        except sqlite3.Error:
+            return {}
+
+    # ─── RETENTION ────────────────────────────────────────────────────────────
+    def prune(self, now: float = None) -> int:
+        """Drop rows older than their table's retention, uploaded or not.
+        Returns the number of rows removed."""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            db = self._db()
+            with db:
+                for table, keep in self.retention.items():
+                    column = "bucket" if table in _WIDTHS else "ts"
+                    removed += db.execute(f"DELETE FROM {table} WHERE {column} < ?",
+                                          (now - keep,)).rowcount
+        return removed
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None